@@ -0,0 +1,319 @@
+"""
+Avisos de estoque do bot.py (comando `/avisar`).
+
+Classe `MonitorEstoque`, que armazena as assinaturas dos usuários, cada uma de uma cor (SKU, `itemId`) de um produto
+(modelo em uma capacidade, `productId`), e o último estoque conhecido das cores assinadas.
+O estoque de todos os produtos assinados é consultado por uma única verificação periódica, independentemente da quantidade de assinantes,
+em lotes de `LOTE_CATALOG_SYSTEM` produtos e com requisições condicionais (ver `estoque_produtos`).\n
+Função `verificar_avisos`, tarefa agendada na `JobQueue` que verifica o estoque e avisa os assinantes apenas quando uma cor passa a ter estoque,
+gerando os links automaticamente caso a assinatura possua uma quantidade de links.\n
+As assinaturas são salvas em arquivo, para que sejam mantidas ao reiniciar o bot.
+"""
+
+import aiohttp
+import asyncio
+import json
+import logging
+import os
+from limitador import usuario_atual
+from metricas import ASSINATURAS_ESTOQUE, VERIFICACOES_ESTOQUE
+from os import getenv
+from registro import rastrear
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
+from utils import LOTE_CATALOG_SYSTEM, estoque_produtos, gerar_links
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (em segundos) entre as verificações do estoque dos produtos assinados
+INTERVALO_ESTOQUE = float(getenv("INTERVALO_ESTOQUE", 60))
+
+# Limite de assinaturas de cada usuário
+MAX_AVISOS_USUARIO = int(getenv("MAX_AVISOS_USUARIO", 5))
+
+# Arquivo onde as assinaturas são salvas (vazio desabilita)
+# No modo escalável, definido pela frente para cada trabalhador (ver `escala`)
+CAMINHO_AVISOS = getenv("CAMINHO_AVISOS", "avisos.json")
+
+
+class MonitorEstoque:
+    """
+    Assinaturas `{id_produto: {id_cor: {usuario_id: assinatura}}}` dos avisos de estoque,
+    com `assinatura` no formato `{"chat_id": chat_id, "descricao": descricao, "quantidade": quantidade}`.\n
+    Uma cor é assinada apenas enquanto não possui estoque, e a assinatura é removida assim que o usuário é avisado.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_AVISOS) -> None:
+        self.caminho = caminho
+        self._assinaturas: dict[str, dict[str, dict[int, dict]]] = dict()
+        # Último estoque conhecido `{id_produto: {id_cor: disponivel}}` dos produtos assinados
+        self._estoque: dict[str, dict[str, bool]] = dict()
+        # Validadores da última resposta de cada lote de IDs dos produtos, para as requisições condicionais
+        self._validadores: dict[tuple[str, ...], tuple] = dict()
+
+    def __len__(self) -> int:
+        return sum(
+            len(assinantes)
+            for cores in self._assinaturas.values()
+            for assinantes in cores.values()
+        )
+
+    def carregar(self) -> None:
+        """Carrega as assinaturas salvas no arquivo, caso exista."""
+        if not self.caminho:
+            return
+        try:
+            with open(self.caminho, encoding="utf-8") as arquivo:
+                dados = json.load(arquivo)
+            self._assinaturas = {
+                str(id_produto): {
+                    str(id_cor): {
+                        int(usuario_id): dict(assinatura)
+                        for usuario_id, assinatura in assinantes.items()
+                    }
+                    for id_cor, assinantes in cores.items()
+                }
+                for id_produto, cores in dados["assinaturas"].items()
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(
+                "Avisos salvos em %s não puderam ser carregados. Erro: %s",
+                self.caminho,
+                e,
+            )
+        ASSINATURAS_ESTOQUE.definir(valor=len(self))
+
+    async def salvar(self) -> None:
+        """Salva as assinaturas no arquivo, substituindo o arquivo anterior de uma só vez."""
+        ASSINATURAS_ESTOQUE.definir(valor=len(self))
+        if not self.caminho:
+            return
+        # O conteúdo é montado antes de a escrita ir para outra thread, já que as assinaturas podem mudar durante a escrita
+        conteudo = json.dumps({"assinaturas": self._assinaturas}, ensure_ascii=False)
+        await asyncio.to_thread(self._escrever, conteudo)
+
+    def _escrever(self, conteudo: str) -> None:
+        temporario = f"{self.caminho}.tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                arquivo.write(conteudo)
+            os.replace(temporario, self.caminho)
+        except OSError as e:
+            logger.warning(
+                "Avisos não puderam ser salvos em %s. Erro: %s", self.caminho, e
+            )
+
+    def assinaturas_usuario(self, usuario_id: int) -> list[tuple[str, dict]]:
+        """Retorna as assinaturas do usuário, no formato `[(id_cor, assinatura)]`."""
+        return [
+            (id_cor, assinantes[usuario_id])
+            for cores in self._assinaturas.values()
+            for id_cor, assinantes in cores.items()
+            if usuario_id in assinantes
+        ]
+
+    async def assinar(
+        self,
+        sessao: aiohttp.ClientSession,
+        usuario_id: int,
+        chat_id: int,
+        id_produto: str,
+        id_cor: str,
+        descricao: str,
+        quantidade: int = 0,
+    ) -> bool:
+        """
+        Consulta o estoque atual do produto e assina a cor, apenas caso ela não tenha estoque.
+        Retorna se a cor já possui estoque (e, portanto, não foi assinada).
+        Caso a consulta falhe, a cor é assinada e o usuário é avisado na verificação em que ela tiver estoque.
+        """
+        id_produto, id_cor = str(id_produto), str(id_cor)
+        try:
+            estoque, _ = await estoque_produtos(sessao, [id_produto])
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                "Requisição GET para pegar o estoque do produto de ID %s falhou: %s",
+                id_produto,
+                e,
+            )
+            estoque = None
+
+        cores = (estoque or dict()).get(id_produto)
+        if cores is not None:
+            if cores.get(id_cor):
+                return True
+            self._estoque[id_produto] = cores
+
+        self._assinaturas.setdefault(id_produto, dict()).setdefault(id_cor, dict())[
+            usuario_id
+        ] = {"chat_id": chat_id, "descricao": descricao, "quantidade": quantidade}
+
+        # A próxima verificação dos lotes com o produto não é condicional, para que a nova cor seja comparada com o estoque atual
+        self._validadores = {
+            lote: validador
+            for lote, validador in self._validadores.items()
+            if id_produto not in lote
+        }
+        await self.salvar()
+        return False
+
+    async def cancelar(self, usuario_id: int, id_cor: str) -> dict | None:
+        """Cancela a assinatura da cor pelo usuário e retorna a assinatura cancelada, ou `None` caso não exista."""
+        for id_produto, cores in list(self._assinaturas.items()):
+            assinantes = cores.get(id_cor)
+            if assinantes is None or usuario_id not in assinantes:
+                continue
+
+            assinatura = assinantes.pop(usuario_id)
+            if not assinantes:
+                del cores[id_cor]
+            if not cores:
+                del self._assinaturas[id_produto]
+                self._estoque.pop(id_produto, None)
+            await self.salvar()
+            return assinatura
+        return None
+
+    async def _consultar(
+        self, sessao: aiohttp.ClientSession, lote: tuple[str, ...]
+    ) -> dict[str, dict[str, bool]] | None:
+        """Consulta o estoque de um lote de produtos. Retorna `None` caso nada tenha mudado desde a última consulta ou ocorra erro."""
+        try:
+            estoque, validador = await estoque_produtos(
+                sessao, list(lote), self._validadores.get(lote)
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                "Requisição GET para pegar o estoque de %s produtos falhou: %s",
+                len(lote),
+                e,
+            )
+            VERIFICACOES_ESTOQUE.incrementar("erro")
+            return None
+
+        VERIFICACOES_ESTOQUE.incrementar(
+            "nao_modificado" if estoque is None else "modificado"
+        )
+        if validador is None:
+            self._validadores.pop(lote, None)
+        else:
+            self._validadores[lote] = validador
+        return estoque
+
+    async def verificar(
+        self, sessao: aiohttp.ClientSession
+    ) -> list[tuple[int, str, str, dict]]:
+        """
+        Consulta o estoque de todos os produtos assinados e compara com o último estoque conhecido.\n
+        Retorna as assinaturas das cores que passaram a ter estoque, no formato `[(usuario_id, id_produto, id_cor, assinatura)]`,
+        e as remove, para que cada usuário seja avisado uma única vez.
+        """
+        ids = sorted(self._assinaturas)
+        lotes = [
+            tuple(ids[inicio : inicio + LOTE_CATALOG_SYSTEM])
+            for inicio in range(0, len(ids), LOTE_CATALOG_SYSTEM)
+        ]
+
+        # Descarta os validadores e o estoque dos lotes e produtos que não são mais assinados
+        self._validadores = {
+            lote: self._validadores[lote] for lote in lotes if lote in self._validadores
+        }
+        self._estoque = {
+            id_produto: cores
+            for id_produto, cores in self._estoque.items()
+            if id_produto in self._assinaturas
+        }
+
+        resultados = await asyncio.gather(
+            *(self._consultar(sessao, lote) for lote in lotes)
+        )
+
+        avisos = list()
+        for estoque in resultados:
+            for id_produto, cores in (estoque or dict()).items():
+                anterior = self._estoque.get(id_produto, dict())
+                self._estoque[id_produto] = cores
+
+                # As assinaturas podem ter sido canceladas durante a consulta
+                assinadas = self._assinaturas.get(id_produto, dict())
+                for id_cor in [id_cor for id_cor in assinadas if cores.get(id_cor)]:
+                    if anterior.get(id_cor):
+                        continue
+                    avisos.extend(
+                        (usuario_id, id_produto, id_cor, assinatura)
+                        for usuario_id, assinatura in assinadas.pop(id_cor).items()
+                    )
+                if id_produto in self._assinaturas and not assinadas:
+                    del self._assinaturas[id_produto]
+
+        if avisos:
+            await self.salvar()
+        return avisos
+
+
+async def _avisar(
+    context: ContextTypes.DEFAULT_TYPE,
+    usuario_id: int,
+    id_produto: str,
+    id_cor: str,
+    assinatura: dict,
+) -> None:
+    """Avisa o assinante que a cor tem estoque e, caso a assinatura possua uma quantidade, gera e envia os links."""
+    chat_id = assinatura["chat_id"]
+    quantidade = assinatura["quantidade"]
+    texto = f"{assinatura['descricao']} voltou a ter estoque!"
+    if not quantidade:
+        texto += "\nEnvie /gerar para gerar o link."
+
+    # Cada aviso é rastreado como uma execução própria, com um novo ID de correlação (ver `registro`)
+    with rastrear("aviso_estoque", usuario=usuario_id):
+        try:
+            await context.bot.send_message(chat_id=chat_id, text=texto)
+            if not quantidade:
+                return
+
+            # As requisições à Samsung Shop são atribuídas ao assinante no limitador de taxa
+            # Os links são gerados simultaneamente, como no /gerar, com os carrinhos vazios do pool
+            usuario_atual.set(usuario_id)
+            tarefas = gerar_links(
+                context.bot_data["sessao"],
+                id_produto,
+                id_cor,
+                quantidade,
+                context.bot_data["pool_carrinhos"].retirar,
+            )
+            try:
+                links = await asyncio.gather(*tarefas)
+            finally:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+
+            linhas = list()
+            for link in links:
+                if link:
+                    linhas.append(f"Link {len(linhas) + 1} gerado: {link}")
+
+            if len(linhas) < quantidade:
+                linhas.append(
+                    f"Houve um erro ao gerar {quantidade - len(linhas)} de {quantidade} links."
+                )
+            await context.bot.send_message(chat_id=chat_id, text="\n".join(linhas))
+        except TelegramError as e:
+            # O usuário bloqueou o bot ou o chat não existe mais
+            logger.warning(
+                "Aviso de estoque não pôde ser enviado ao chat %s. Erro: %s", chat_id, e
+            )
+
+
+async def verificar_avisos(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Verifica o estoque dos produtos assinados e avisa, simultaneamente, os assinantes das cores que passaram a ter estoque."""
+    monitor = context.bot_data["monitor_estoque"]
+    avisos = await monitor.verificar(context.bot_data["sessao"])
+    await asyncio.gather(
+        *(
+            _avisar(context, usuario_id, id_produto, id_cor, assinatura)
+            for usuario_id, id_produto, id_cor, assinatura in avisos
+        )
+    )
@@ -0,0 +1,13 @@
+"""
+Benchmarks do bot.py, executados contra uma loja falsa local (`loja_falsa`), sem acessar a Samsung Shop.
+
+Medem a latência (p50, p95 e p99), a vazão e o pico de memória (RSS) da consulta de um modelo (`informacoes_modelo`)
+e da geração de N links (`gerar_link`), para que mudanças de desempenho possam ser comparadas entre commits.
+
+O teste de carga (`carga`) simula usuários do Telegram percorrendo simultaneamente o `ConversationHandler` do bot.py,
+contra a loja falsa e uma Bot API falsa local (`telegram_falso`).
+
+Uso:
+`python -m benchmark --iteracoes 20 --links 20 --latencia 50 --taxa-erro 0.01 --saida resultado.json`\n
+`python -m benchmark.carga --usuarios 1000 --taxa-chegada 50 --pensar 500 --saida carga.json`
+"""
@@ -0,0 +1,6 @@
+"""Permite executar os benchmarks com `python -m benchmark`."""
+
+from benchmark.executar import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+"""
+Teste de carga do bot.py, que simula usuários do Telegram percorrendo simultaneamente todas as etapas do `ConversationHandler`.
+
+O bot.py é executado em um processo separado, com a `application` e o `ConversationHandler` reais, através do webhook local
+(sem configurar o webhook no Telegram), contra a Bot API falsa (`telegram_falso`) e a loja falsa (`loja_falsa`).
+Os usuários virtuais chegam ao bot com a taxa de chegada escolhida (processo de Poisson), e cada um percorre as etapas
+MODELO (opção "Outro") → LINK → CAPACIDADE → COR → QUANTIDADE, esperando a resposta do bot a cada etapa.\n
+São informados os percentis da latência entre o envio de cada update e a resposta do bot, por etapa,
+o atraso do event loop do bot (métrica `bot_event_loop_atraso_segundos`) e a memória (RSS) do bot por conversa ativa.
+Os limites de taxa do bot (Telegram e Samsung Shop) são desabilitados, a não ser que sejam definidos com `--ambiente`.
+
+Uso:
+`python -m benchmark.carga --usuarios 1000 --taxa-chegada 50 --pensar 500 --saida carga.json`
+"""
+
+import aiohttp
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import re
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from aiohttp import web
+from benchmark.executar import (
+    esperar_loja_falsa,
+    executar_loja_falsa,
+    percentil,
+    porta_livre,
+)
+from benchmark.telegram_falso import TelegramFalso
+from pathlib import Path
+
+# Arquivo do bot executado no teste
+CAMINHO_BOT = Path(__file__).parent.parent / "bot.py"
+
+# URL do modelo informado pelos usuários virtuais na etapa LINK (servido pela loja falsa)
+URL_MODELO = "https://shop.samsung.com/br/galaxy-s24/p"
+
+# Etapas percorridas por cada usuário virtual, com o texto esperado na resposta do bot a cada etapa
+ETAPAS = [
+    ("escolha_modelo", "Escolha o modelo"),
+    ("informa_link", "Informe o link"),
+    ("escolha_capacidade", "Escolha a capacidade"),
+    ("escolha_cor", "Escolha a cor"),
+    ("escolha_quantidade", "Quantos links"),
+    ("envia_link", None),
+]
+
+# Variáveis de ambiente do bot que podem ser substituídas com `--ambiente`
+# Os limites de taxa são desabilitados, para que o teste meça o bot, e não os limites
+AMBIENTE_PADRAO = {
+    "TAXA_REQUISICOES": "0",
+    "TAXA_TELEGRAM": "0",
+    "TAXA_TELEGRAM_CHAT": "0",
+    "TAXA_TELEGRAM_GRUPO": "0",
+}
+
+# Intervalo (em segundos) entre as amostras da memória do bot e do atraso do event loop do teste
+INTERVALO_AMOSTRAS = 0.2
+
+
+class FalhaEtapa(Exception):
+    """A resposta do bot a uma etapa foi um erro, ou não chegou a tempo."""
+
+
+def rss_processo(pid: int) -> float:
+    """Retorna a memória (RSS) do processo, em megabytes (apenas no Linux)."""
+    with open(f"/proc/{pid}/status", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            if linha.startswith("VmRSS:"):
+                return int(linha.split()[1]) / 1024
+    return 0.0
+
+
+def percentil_histograma(buckets: list[tuple[float, float]], p: float) -> float:
+    """
+    Retorna o percentil `p` (entre 0 e 100) de um histograma do Prometheus, com os buckets `[(limite, contagem acumulada)]`,
+    por interpolação linear dentro do bucket, como a função `histogram_quantile` do Prometheus.
+    """
+    if not buckets or not buckets[-1][1]:
+        return 0.0
+    alvo = buckets[-1][1] * p / 100
+    limite_anterior, contagem_anterior = 0.0, 0.0
+    for limite, contagem in buckets:
+        if contagem >= alvo:
+            if limite == float("inf"):
+                return limite_anterior
+            if contagem == contagem_anterior:
+                return limite
+            return limite_anterior + (limite - limite_anterior) * (
+                (alvo - contagem_anterior) / (contagem - contagem_anterior)
+            )
+        limite_anterior, contagem_anterior = limite, contagem
+    return limite_anterior
+
+
+async def ler_histograma(
+    sessao: aiohttp.ClientSession, porta: int, nome: str
+) -> tuple[list[tuple[float, float]], float, float]:
+    """Retorna os buckets, a soma e a contagem do histograma (sem labels) exposto no servidor de métricas do bot."""
+    async with sessao.get(f"http://127.0.0.1:{porta}/metrics") as resposta:
+        texto = await resposta.text()
+
+    buckets, soma, contagem = list(), 0.0, 0.0
+    for linha in texto.splitlines():
+        if linha.startswith(f"{nome}_bucket"):
+            limite = re.search(r'le="([^"]+)"', linha).group(1)
+            buckets.append((float(limite), float(linha.rsplit(" ", 1)[1])))
+        elif linha.startswith(f"{nome}_sum"):
+            soma = float(linha.rsplit(" ", 1)[1])
+        elif linha.startswith(f"{nome}_count"):
+            contagem = float(linha.rsplit(" ", 1)[1])
+    return buckets, soma, contagem
+
+
+class TesteCarga:
+    """Usuários virtuais do teste de carga, e as medições das respostas do bot."""
+
+    def __init__(
+        self,
+        args: argparse.Namespace,
+        telegram: TelegramFalso,
+        url_webhook: str,
+        segredo: str,
+        quantidade_links: int,
+        indice_quantidade: int,
+    ) -> None:
+        self.args = args
+        self.telegram = telegram
+        self.url_webhook = url_webhook
+        self.segredo = segredo
+        self.quantidade_links = quantidade_links
+        self.indice_quantidade = indice_quantidade
+        self.latencias: dict[str, list[float]] = {nome: list() for nome, _ in ETAPAS}
+        self.concluidos = 0
+        self.erros: dict[str, int] = dict()
+        self.ativas = 0
+        self._ids_updates = itertools.count(1)
+
+    async def _enviar(self, sessao: aiohttp.ClientSession, update: dict) -> None:
+        """Envia o update ao webhook local do bot."""
+        update["update_id"] = next(self._ids_updates)
+        async with sessao.post(
+            self.url_webhook,
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": self.segredo},
+        ) as resposta:
+            if resposta.status != 200:
+                raise FalhaEtapa(f"webhook respondeu {resposta.status}")
+
+    async def _etapa(
+        self,
+        sessao: aiohttp.ClientSession,
+        nome: str,
+        esperado: str | None,
+        usuario_id: int,
+        update: dict,
+    ) -> dict:
+        """
+        Envia o update e espera a resposta do bot com o texto `esperado` (ou, na última etapa, o último link).
+        Registra a latência da etapa e retorna a mensagem do bot.
+        """
+        fila = self.telegram.fila(usuario_id)
+        inicio = time.perf_counter()
+        await self._enviar(sessao, update)
+
+        limite = inicio + self.args.timeout
+        while True:
+            try:
+                metodo, dados, resultado, instante = await asyncio.wait_for(
+                    fila.get(), max(0.0, limite - time.perf_counter())
+                )
+            except asyncio.TimeoutError:
+                raise FalhaEtapa("timeout") from None
+
+            texto = dados.get("text", "")
+            if metodo not in ("sendMessage", "editMessageText"):
+                continue
+            if esperado is None:
+                if "Houve um erro" in texto:
+                    raise FalhaEtapa("erro_links")
+                if f"Link {self.quantidade_links} gerado" not in texto:
+                    continue
+            elif esperado not in texto:
+                # Erro ao pegar as informações do modelo, com a solicitação de escolher o modelo novamente
+                raise FalhaEtapa("erro_modelo")
+
+            self.latencias[nome].append(instante - inicio)
+            return resultado
+
+    async def usuario_virtual(self, sessao: aiohttp.ClientSession, numero: int) -> None:
+        """Percorre todas as etapas do `ConversationHandler` como um usuário, com um tempo de reflexão entre as etapas."""
+        from teclados import (
+            PREFIXO_CAPACIDADE,
+            PREFIXO_COR,
+            PREFIXO_OUTRO,
+            PREFIXO_QUANTIDADE,
+            callback_data,
+        )
+
+        usuario_id = 1_000_000 + numero
+        usuario = {"id": usuario_id, "is_bot": False, "first_name": f"Usuário {numero}"}
+        chat = {"id": usuario_id, "type": "private"}
+        ids_mensagens = itertools.count(1)
+
+        def mensagem(texto: str, comando: bool = False) -> dict:
+            dados = {
+                "message_id": next(ids_mensagens),
+                "date": int(time.time()),
+                "chat": chat,
+                "from": usuario,
+                "text": texto,
+            }
+            if comando:
+                dados["entities"] = [{"type": "bot_command", "offset": 0, "length": len(texto)}]
+            return {"message": dados}
+
+        def callback(mensagem_bot: dict, dados: str) -> dict:
+            return {
+                "callback_query": {
+                    "id": secrets.token_hex(8),
+                    "from": usuario,
+                    "chat_instance": str(usuario_id),
+                    "message": mensagem_bot,
+                    "data": dados,
+                }
+            }
+
+        async def pensar() -> None:
+            if self.args.pensar:
+                await asyncio.sleep(self.args.pensar / 1000 * random.uniform(0.5, 1.5))
+
+        etapa = "escolha_modelo"
+        self.ativas += 1
+        try:
+            etapas = dict(ETAPAS)
+            resposta = await self._etapa(
+                sessao, etapa, etapas[etapa], usuario_id, mensagem("/gerar", comando=True)
+            )
+            for etapa, update in [
+                ("informa_link", lambda: callback(resposta, callback_data(PREFIXO_OUTRO))),
+                ("escolha_capacidade", lambda: mensagem(URL_MODELO)),
+                ("escolha_cor", lambda: callback(resposta, callback_data(PREFIXO_CAPACIDADE, 0))),
+                ("escolha_quantidade", lambda: callback(resposta, callback_data(PREFIXO_COR, 0))),
+                (
+                    "envia_link",
+                    lambda: callback(
+                        resposta, callback_data(PREFIXO_QUANTIDADE, self.indice_quantidade)
+                    ),
+                ),
+            ]:
+                await pensar()
+                resposta = await self._etapa(
+                    sessao, etapa, etapas[etapa], usuario_id, update()
+                )
+            self.concluidos += 1
+        except (FalhaEtapa, aiohttp.ClientError) as e:
+            motivo = f"{etapa}: {e}"
+            self.erros[motivo] = self.erros.get(motivo, 0) + 1
+        finally:
+            self.ativas -= 1
+            self.telegram.descartar(usuario_id)
+
+
+async def executar_carga(
+    args: argparse.Namespace, porta_loja: int, diretorio: str
+) -> dict:
+    """Executa o bot e os usuários virtuais, e retorna o resultado do teste."""
+    from bot import QUANTIDADE_LINKS
+
+    if args.quantidade not in QUANTIDADE_LINKS:
+        raise ValueError(f"A quantidade de links precisa ser uma de {QUANTIDADE_LINKS}")
+
+    telegram = TelegramFalso(latencia=args.latencia_telegram / 1000)
+    runner = web.AppRunner(telegram.criar_app(), access_log=None)
+    await runner.setup()
+    porta_telegram = porta_livre()
+    await web.TCPSite(runner, "127.0.0.1", porta_telegram).start()
+
+    porta_bot, porta_metricas = porta_livre(), porta_livre()
+    segredo = secrets.token_urlsafe(32)
+    ambiente = {
+        **AMBIENTE_PADRAO,
+        **dict(variavel.split("=", 1) for variavel in args.ambiente),
+        "TOKEN": "123456:carga",
+        "GRUPO_ID": "-1",
+        "MODO": "webhook",
+        "URL": "",
+        "HOST": "127.0.0.1",
+        "PORT": str(porta_bot),
+        "SECRET_TOKEN": segredo,
+        "URL_API_TELEGRAM": f"http://127.0.0.1:{porta_telegram}/bot",
+        "URL_LOJA": f"http://127.0.0.1:{porta_loja}",
+        "URL_SEARCHAPI": f"http://127.0.0.1:{porta_loja}",
+        "METRICAS_PORTA": str(porta_metricas),
+        "CAMINHO_CATALOGO": str(Path(diretorio) / "catalogo.json"),
+        "CAMINHO_INDICE": "",
+        "TRABALHADORES": "0",
+    }
+    log = open(args.log, "w", encoding="utf-8") if args.log else subprocess.DEVNULL
+    processo = subprocess.Popen(
+        [sys.executable, str(CAMINHO_BOT)],
+        env={**os.environ, **ambiente},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+    teste = TesteCarga(
+        args,
+        telegram,
+        f"http://127.0.0.1:{porta_bot}/telegram",
+        segredo,
+        args.quantidade,
+        QUANTIDADE_LINKS.index(args.quantidade),
+    )
+    amostras: list[tuple[int, float]] = list()
+    atrasos_teste: list[float] = list()
+
+    async def amostrar() -> None:
+        """Registra a memória do bot e a quantidade de conversas ativas, e o atraso do event loop do próprio teste."""
+        loop = asyncio.get_running_loop()
+        while True:
+            inicio = loop.time()
+            await asyncio.sleep(INTERVALO_AMOSTRAS)
+            atrasos_teste.append(max(0.0, loop.time() - inicio - INTERVALO_AMOSTRAS))
+            amostras.append((teste.ativas, rss_processo(processo.pid)))
+
+    conector = aiohttp.TCPConnector(limit=args.conexoes)
+    try:
+        async with aiohttp.ClientSession(connector=conector) as sessao:
+            # Espera o bot iniciar e carregar o catálogo
+            limite = time.monotonic() + 30
+            while True:
+                if processo.poll() is not None:
+                    raise RuntimeError("O bot terminou antes de iniciar o teste")
+                try:
+                    async with sessao.get(f"http://127.0.0.1:{porta_bot}/healthcheck") as r:
+                        if r.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if time.monotonic() > limite:
+                    raise RuntimeError("O bot não iniciou")
+                await asyncio.sleep(0.1)
+            await asyncio.sleep(args.aquecimento)
+
+            rss_base = rss_processo(processo.pid)
+            amostrador = asyncio.create_task(amostrar())
+
+            inicio = time.perf_counter()
+            usuarios = list()
+            for numero in range(args.usuarios):
+                usuarios.append(asyncio.create_task(teste.usuario_virtual(sessao, numero)))
+                if args.taxa_chegada:
+                    await asyncio.sleep(random.expovariate(args.taxa_chegada))
+            await asyncio.gather(*usuarios)
+            duracao = time.perf_counter() - inicio
+
+            amostrador.cancel()
+            rss_final = rss_processo(processo.pid)
+            buckets, soma, contagem = await ler_histograma(
+                sessao, porta_metricas, "bot_event_loop_atraso_segundos"
+            )
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+        if log is not subprocess.DEVNULL:
+            log.close()
+        await runner.cleanup()
+
+    # Memória na amostra com mais conversas ativas, em relação à memória antes do teste
+    pico_ativas, rss_pico = max(amostras, default=(0, rss_base))
+    return {
+        "usuarios": args.usuarios,
+        "concluidos": teste.concluidos,
+        "erros": teste.erros,
+        "duracao_s": duracao,
+        "conversas_por_s": teste.concluidos / duracao if duracao else 0.0,
+        "etapas": {
+            nome: {
+                "respostas": len(latencias),
+                "p50_ms": percentil(latencias, 50) * 1000,
+                "p95_ms": percentil(latencias, 95) * 1000,
+                "p99_ms": percentil(latencias, 99) * 1000,
+                "max_ms": max(latencias, default=0.0) * 1000,
+            }
+            for nome, latencias in teste.latencias.items()
+        },
+        "atraso_event_loop_bot": {
+            "p50_ms": percentil_histograma(buckets, 50) * 1000,
+            "p95_ms": percentil_histograma(buckets, 95) * 1000,
+            "p99_ms": percentil_histograma(buckets, 99) * 1000,
+            "media_ms": soma / contagem * 1000 if contagem else 0.0,
+        },
+        "atraso_event_loop_teste_p99_ms": percentil(atrasos_teste, 99) * 1000,
+        "conversas_ativas_pico": pico_ativas,
+        "rss_base_mb": rss_base,
+        "rss_pico_mb": rss_pico,
+        "rss_final_mb": rss_final,
+        "kb_por_conversa_ativa": (
+            (rss_pico - rss_base) * 1024 / pico_ativas if pico_ativas else 0.0
+        ),
+        "kb_por_usuario": (rss_final - rss_base) * 1024 / args.usuarios,
+        "chamadas_telegram": telegram.chamadas,
+    }
+
+
+def imprimir_resultado(resultado: dict) -> None:
+    """Imprime a latência de cada etapa em uma tabela, e o resumo do teste."""
+    colunas = [
+        ("respostas", "respostas", "{}"),
+        ("p50_ms", "p50 (ms)", "{:.1f}"),
+        ("p95_ms", "p95 (ms)", "{:.1f}"),
+        ("p99_ms", "p99 (ms)", "{:.1f}"),
+        ("max_ms", "máx (ms)", "{:.1f}"),
+    ]
+    linhas = [["etapa"] + [titulo for _, titulo, _ in colunas]] + [
+        [nome] + [formato.format(etapa[chave]) for chave, _, formato in colunas]
+        for nome, etapa in resultado["etapas"].items()
+    ]
+    larguras = [max(len(linha[i]) for linha in linhas) for i in range(len(linhas[0]))]
+    for linha in linhas:
+        print("  ".join(valor.rjust(largura) for valor, largura in zip(linha, larguras)))
+
+    atraso = resultado["atraso_event_loop_bot"]
+    print()
+    print(
+        f"Conversas: {resultado['concluidos']} de {resultado['usuarios']} concluídas em {resultado['duracao_s']:.1f} s "
+        f"({resultado['conversas_por_s']:.1f}/s), pico de {resultado['conversas_ativas_pico']} ativas"
+    )
+    for motivo, quantidade in sorted(resultado["erros"].items()):
+        print(f"  Erro em {motivo}: {quantidade}")
+    print(
+        f"Atraso do event loop do bot: p50 {atraso['p50_ms']:.1f} ms, p95 {atraso['p95_ms']:.1f} ms, "
+        f"p99 {atraso['p99_ms']:.1f} ms, média {atraso['media_ms']:.1f} ms "
+        f"(p99 do teste: {resultado['atraso_event_loop_teste_p99_ms']:.1f} ms)"
+    )
+    print(
+        f"Memória do bot: {resultado['rss_base_mb']:.1f} MB antes, {resultado['rss_pico_mb']:.1f} MB no pico de conversas ativas, "
+        f"{resultado['rss_final_mb']:.1f} MB ao final; {resultado['kb_por_conversa_ativa']:.1f} KB por conversa ativa, "
+        f"{resultado['kb_por_usuario']:.1f} KB por usuário"
+    )
+
+
+def main() -> None:
+    """Executa a loja falsa e o teste de carga, e imprime (e opcionalmente salva) o resultado."""
+    parser = argparse.ArgumentParser(
+        description="Teste de carga do bot com usuários virtuais, contra uma Bot API falsa e uma loja falsa locais."
+    )
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument(
+        "--taxa-chegada",
+        type=float,
+        default=20,
+        help="usuários por segundo (0 inicia todos ao mesmo tempo)",
+    )
+    parser.add_argument(
+        "--pensar", type=float, default=500, help="tempo de reflexão entre as etapas, em milissegundos"
+    )
+    parser.add_argument("--quantidade", type=int, default=1, help="links por conversa")
+    parser.add_argument("--timeout", type=float, default=60, help="espera máxima por resposta, em segundos")
+    parser.add_argument(
+        "--conexoes", type=int, default=100, help="conexões simultâneas ao webhook do bot"
+    )
+    parser.add_argument(
+        "--aquecimento", type=float, default=2, help="espera após o bot iniciar, em segundos"
+    )
+    parser.add_argument(
+        "--latencia-telegram", type=float, default=0, help="em milissegundos"
+    )
+    parser.add_argument("--latencia", type=float, default=50, help="em milissegundos")
+    parser.add_argument(
+        "--variacao-latencia", type=float, default=10, help="em milissegundos"
+    )
+    parser.add_argument("--taxa-erro", type=float, default=0, help="entre 0 e 1")
+    parser.add_argument(
+        "--tamanho-pagina", type=int, default=1024 * 1024, help="em bytes"
+    )
+    parser.add_argument(
+        "--ambiente",
+        action="append",
+        default=[],
+        metavar="VARIAVEL=VALOR",
+        help="variável de ambiente do bot (ex: LINKS_POR_MENSAGEM=5), pode ser repetida",
+    )
+    parser.add_argument("--log", help="arquivo para salvar a saída do bot")
+    parser.add_argument("--saida", help="arquivo JSON para salvar o resultado")
+    args = parser.parse_args()
+
+    contexto = multiprocessing.get_context("spawn")
+    porta_loja = porta_livre()
+    loja = contexto.Process(
+        target=executar_loja_falsa, args=(porta_loja, args), daemon=True
+    )
+    loja.start()
+
+    try:
+        esperar_loja_falsa(porta_loja)
+        with tempfile.TemporaryDirectory() as diretorio:
+            resultado = asyncio.run(executar_carga(args, porta_loja, diretorio))
+    finally:
+        loja.terminate()
+        loja.join()
+
+    imprimir_resultado(resultado)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(
+                {"parametros": vars(args), "resultado": resultado},
+                arquivo,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
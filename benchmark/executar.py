@@ -0,0 +1,239 @@
+"""
+Executa os benchmarks contra a loja falsa local e informa latência, vazão e pico de memória de cada cenário.
+
+A loja falsa e cada cenário são executados em processos separados,
+para que o pico de memória (RSS) medido seja apenas o do cenário.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import time
+
+# URL da página do modelo usado nos benchmarks (servida pela loja falsa)
+URL_MODELO = "https://shop.samsung.com/br/galaxy-s24/p"
+
+CENARIOS = ["modelo", "links"]
+
+
+def percentil(valores: list[float], p: float) -> float:
+    """Retorna o percentil `p` (entre 0 e 100) dos valores, por interpolação linear."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (
+        posicao - inferior
+    )
+
+
+def porta_livre() -> int:
+    """Retorna uma porta TCP livre no localhost."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def executar_loja_falsa(porta: int, args: argparse.Namespace) -> None:
+    """Executa a loja falsa (em um processo separado)."""
+    from aiohttp import web
+    from benchmark.loja_falsa import criar_loja_falsa
+
+    web.run_app(
+        criar_loja_falsa(
+            latencia=args.latencia / 1000,
+            variacao_latencia=args.variacao_latencia / 1000,
+            taxa_erro=args.taxa_erro,
+            tamanho_pagina=args.tamanho_pagina,
+        ),
+        host="127.0.0.1",
+        port=porta,
+        print=None,
+    )
+
+
+def esperar_loja_falsa(porta: int, timeout: float = 10) -> None:
+    """Espera a loja falsa aceitar conexões."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", porta), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"A loja falsa não iniciou na porta {porta}")
+
+
+async def cenario_modelo(args: argparse.Namespace) -> tuple[list[float], int, int]:
+    """Consulta o modelo `iteracoes` vezes, uma por vez. Retorna as latências, a quantidade de operações e de erros."""
+    from utils import criar_sessao, informacoes_modelo
+
+    latencias, erros = list(), 0
+    async with criar_sessao() as sessao:
+        for _ in range(args.iteracoes):
+            inicio = time.perf_counter()
+            informacoes = await informacoes_modelo(sessao, URL_MODELO)
+            latencias.append(time.perf_counter() - inicio)
+            erros += "erro" in informacoes
+
+    return latencias, args.iteracoes, erros
+
+
+async def cenario_links(args: argparse.Namespace) -> tuple[list[float], int, int]:
+    """
+    Gera `links` links simultaneamente (com no máximo `concorrencia` ao mesmo tempo), `iteracoes` vezes.
+    Retorna as latências de cada geração de N links, a quantidade de links gerados e de erros.
+    """
+    from utils import criar_sessao, gerar_link, informacoes_modelo
+
+    latencias, erros = list(), 0
+    async with criar_sessao() as sessao:
+        informacoes = await informacoes_modelo(sessao, URL_MODELO)
+        if "erro" in informacoes:
+            raise RuntimeError(f"Consulta do modelo falhou: {informacoes['erro']}")
+        capacidade = next(iter(informacoes.values()))
+        id_modelo, id_cor = capacidade["id"], next(iter(capacidade["cores"].values()))
+
+        limite = asyncio.Semaphore(args.concorrencia)
+
+        async def gerar_link_limitado() -> str | None:
+            async with limite:
+                return await gerar_link(sessao, id_modelo, id_cor)
+
+        for _ in range(args.iteracoes):
+            inicio = time.perf_counter()
+            links = await asyncio.gather(
+                *(gerar_link_limitado() for _ in range(args.links))
+            )
+            latencias.append(time.perf_counter() - inicio)
+            erros += sum(1 for link in links if not link)
+
+    return latencias, args.iteracoes * args.links, erros
+
+
+def executar_cenario(
+    nome: str, porta: int, args: argparse.Namespace, fila: multiprocessing.Queue
+) -> None:
+    """Executa um cenário (em um processo separado) e coloca o resultado na fila."""
+    # Os URLs base são lidos pelo `utils` ao ser importado
+    os.environ["URL_LOJA"] = f"http://127.0.0.1:{porta}"
+    os.environ["URL_SEARCHAPI"] = f"http://127.0.0.1:{porta}"
+    # O índice de produtos é mantido apenas em memória, para que cada execução comece do zero
+    os.environ["CAMINHO_INDICE"] = ""
+    # O limitador de taxa é desabilitado, para que o benchmark meça o código, e não o limite (a não ser que seja definido)
+    os.environ.setdefault("TAXA_REQUISICOES", "0")
+
+    cenario = {"modelo": cenario_modelo, "links": cenario_links}[nome]
+
+    inicio = time.perf_counter()
+    latencias, operacoes, erros = asyncio.run(cenario(args))
+    duracao = time.perf_counter() - inicio
+
+    fila.put(
+        {
+            "cenario": nome,
+            "iteracoes": len(latencias),
+            "operacoes": operacoes,
+            "erros": erros,
+            "p50_ms": percentil(latencias, 50) * 1000,
+            "p95_ms": percentil(latencias, 95) * 1000,
+            "p99_ms": percentil(latencias, 99) * 1000,
+            "media_ms": statistics.fmean(latencias) * 1000 if latencias else 0.0,
+            "vazao_por_s": operacoes / duracao if duracao else 0.0,
+            # Em kilobytes no Linux
+            "rss_pico_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+
+
+def imprimir_resultados(resultados: list[dict]) -> None:
+    """Imprime os resultados em uma tabela."""
+    colunas = [
+        ("cenario", "cenário", "{}"),
+        ("iteracoes", "iterações", "{}"),
+        ("operacoes", "operações", "{}"),
+        ("erros", "erros", "{}"),
+        ("p50_ms", "p50 (ms)", "{:.1f}"),
+        ("p95_ms", "p95 (ms)", "{:.1f}"),
+        ("p99_ms", "p99 (ms)", "{:.1f}"),
+        ("vazao_por_s", "vazão (/s)", "{:.1f}"),
+        ("rss_pico_mb", "RSS pico (MB)", "{:.1f}"),
+    ]
+    linhas = [[titulo for _, titulo, _ in colunas]] + [
+        [formato.format(resultado[chave]) for chave, _, formato in colunas]
+        for resultado in resultados
+    ]
+    larguras = [max(len(linha[i]) for linha in linhas) for i in range(len(colunas))]
+    for linha in linhas:
+        print("  ".join(valor.rjust(largura) for valor, largura in zip(linha, larguras)))
+
+
+def main() -> None:
+    """Executa a loja falsa e os cenários escolhidos, e imprime (e opcionalmente salva) os resultados."""
+    parser = argparse.ArgumentParser(
+        description="Benchmarks do bot contra uma loja falsa local."
+    )
+    parser.add_argument(
+        "--cenarios", nargs="+", choices=CENARIOS, default=CENARIOS
+    )
+    parser.add_argument("--iteracoes", type=int, default=20)
+    parser.add_argument("--links", type=int, default=20, help="links por iteração")
+    parser.add_argument(
+        "--concorrencia", type=int, default=5, help="links gerados simultaneamente"
+    )
+    parser.add_argument("--latencia", type=float, default=50, help="em milissegundos")
+    parser.add_argument(
+        "--variacao-latencia", type=float, default=10, help="em milissegundos"
+    )
+    parser.add_argument("--taxa-erro", type=float, default=0, help="entre 0 e 1")
+    parser.add_argument(
+        "--tamanho-pagina", type=int, default=1024 * 1024, help="em bytes"
+    )
+    parser.add_argument("--saida", help="arquivo JSON para salvar os resultados")
+    args = parser.parse_args()
+
+    contexto = multiprocessing.get_context("spawn")
+    porta = porta_livre()
+    loja = contexto.Process(
+        target=executar_loja_falsa, args=(porta, args), daemon=True
+    )
+    loja.start()
+
+    resultados = list()
+    try:
+        esperar_loja_falsa(porta)
+        for nome in args.cenarios:
+            fila = contexto.Queue()
+            processo = contexto.Process(
+                target=executar_cenario, args=(nome, porta, args, fila)
+            )
+            processo.start()
+            processo.join()
+            if processo.exitcode != 0:
+                raise RuntimeError(f"O cenário {nome} falhou")
+            resultados.append(fila.get())
+    finally:
+        loja.terminate()
+        loja.join()
+
+    imprimir_resultados(resultados)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(
+                {"parametros": vars(args), "resultados": resultados},
+                arquivo,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Loja falsa local, que substitui a Samsung Shop e a API de busca da Samsung nos benchmarks.
+
+Serve as respostas gravadas em `fixtures` para as rotas usadas pelo `utils.py`:
+página do produto, `searchapi ... card/detail`, `catalog_system ... productId` e listagem de categoria (`fq=C:`),
+`orderForm`, `items`, `getProductGroup` e `marketingData`.\n
+Cada requisição pode ter latência e taxa de erro (respostas 503) configuráveis.\n
+As respostas do `catalog_system` possuem `ETag`, e requisições condicionais (`If-None-Match`) sem mudanças recebem `304`.
+O estoque de uma cor pode ser alternado com `POST /_estoque/<itemId>`, para testar os avisos de estoque.
+
+Uso:
+`python -m benchmark.loja_falsa --porta 8765 --latencia 50 --taxa-erro 0.01`
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import uuid
+from aiohttp import web
+from pathlib import Path
+from string import Template
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def carregar_fixtures() -> dict:
+    """Carrega as respostas gravadas da pasta `fixtures`."""
+    return {
+        "produtos": json.loads((FIXTURES / "produtos.json").read_text("utf-8")),
+        "produto": Template((FIXTURES / "produto.html").read_text("utf-8")),
+        "card_detail": json.loads((FIXTURES / "card_detail.json").read_text("utf-8")),
+        "catalog_system": json.loads(
+            (FIXTURES / "catalog_system.json").read_text("utf-8")
+        ),
+        "order_form": Template((FIXTURES / "order_form.json").read_text("utf-8")),
+        "product_group": Template(
+            (FIXTURES / "product_group.json").read_text("utf-8")
+        ),
+    }
+
+
+def criar_loja_falsa(
+    latencia: float = 0.05,
+    variacao_latencia: float = 0.0,
+    taxa_erro: float = 0.0,
+    tamanho_pagina: int = 1024 * 1024,
+) -> web.Application:
+    """
+    Cria a aplicação `aiohttp` da loja falsa.\n
+    `latencia` e `variacao_latencia` em segundos, `taxa_erro` entre 0 e 1, e `tamanho_pagina` em bytes
+    (as páginas dos produtos são preenchidas até esse tamanho, como as páginas reais, de vários megabytes).
+    """
+    fixtures = carregar_fixtures()
+    contagem: dict[str, int] = dict()
+
+    # Metade do preenchimento antes do referenceId, e metade depois
+    preenchimento = "/* preenchimento */ " * (tamanho_pagina // 40)
+
+    @web.middleware
+    async def simular_rede(request: web.Request, handler) -> web.StreamResponse:
+        """Adiciona a latência e os erros configurados a cada requisição, e conta as requisições por rota."""
+        rota = request.match_info.route.name or "desconhecida"
+        contagem[rota] = contagem.get(rota, 0) + 1
+
+        await asyncio.sleep(max(0, latencia + random.uniform(-1, 1) * variacao_latencia))
+
+        if rota not in ("contagem", "estoque") and random.random() < taxa_erro:
+            raise web.HTTPServiceUnavailable()
+
+        return await handler(request)
+
+    async def produto(request: web.Request) -> web.Response:
+        produto = fixtures["produtos"].get(request.match_info["slug"])
+        if produto is None:
+            raise web.HTTPNotFound()
+        return web.Response(
+            text=fixtures["produto"].substitute(
+                id=produto["id"],
+                ref=produto["ref"],
+                slug=request.match_info["slug"],
+                preenchimento_cabecalho=preenchimento,
+                preenchimento_corpo=preenchimento,
+            ),
+            content_type="text/html",
+        )
+
+    async def card_detail(request: web.Request) -> web.Response:
+        # Apenas os modelos com algum dos referenceIds do `modelList`
+        refs = set(request.query.get("modelList", "").split(","))
+        produtos = [
+            produto
+            for produto in fixtures["card_detail"]["response"]["resultData"]["productList"]
+            if refs & {modelo["modelCode"] for modelo in produto["modelList"]}
+        ]
+        return web.json_response({"response": {"resultData": {"productList": produtos}}})
+
+    async def catalog_system(request: web.Request) -> web.Response:
+        resposta = list()
+        for fq in request.query.getall("fq", []):
+            if fq.startswith("productId:"):
+                for id in fq.removeprefix("productId:").split(","):
+                    resposta.extend(fixtures["catalog_system"].get(id, []))
+            elif fq.startswith("C:"):
+                # Listagem da categoria, paginada por `_from` e `_to`
+                produtos = [p for lista in fixtures["catalog_system"].values() for p in lista]
+                inicio = int(request.query.get("_from", 0))
+                fim = int(request.query.get("_to", inicio + 9))
+                resposta.extend(produtos[inicio : fim + 1])
+
+        corpo = json.dumps(resposta)
+        etag = f'"{hashlib.md5(corpo.encode()).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            text=corpo, content_type="application/json", headers={"ETag": etag}
+        )
+
+    async def alternar_estoque(request: web.Request) -> web.Response:
+        # Alterna o `IsAvailable` da cor em todos os produtos em que aparece
+        id_cor = request.match_info["id_cor"]
+        disponivel = None
+        for lista in fixtures["catalog_system"].values():
+            for produto in lista:
+                for item in produto["items"]:
+                    if str(item["itemId"]) == id_cor:
+                        oferta = item["sellers"][0]["commertialOffer"]
+                        oferta["IsAvailable"] = not oferta["IsAvailable"]
+                        disponivel = oferta["IsAvailable"]
+        if disponivel is None:
+            raise web.HTTPNotFound()
+        return web.json_response({"itemId": id_cor, "IsAvailable": disponivel})
+
+    async def order_form(request: web.Request) -> web.Response:
+        return web.Response(
+            text=fixtures["order_form"].substitute(order_form_id=uuid.uuid4().hex),
+            content_type="application/json",
+        )
+
+    async def items(request: web.Request) -> web.Response:
+        await request.read()
+        return web.json_response({"orderFormId": request.match_info["id"]})
+
+    async def product_group(request: web.Request) -> web.Response:
+        return web.Response(
+            text=fixtures["product_group"].substitute(
+                id_modelo=request.match_info["id_modelo"],
+                id_cor=request.match_info["id_cor"],
+            ),
+            content_type="application/json",
+        )
+
+    async def marketing_data(request: web.Request) -> web.Response:
+        await request.read()
+        return web.json_response({"orderFormId": request.match_info["id"]})
+
+    async def rota_contagem(request: web.Request) -> web.Response:
+        return web.json_response(contagem)
+
+    app = web.Application(middlewares=[simular_rede])
+    app.router.add_get(
+        "/v6/front/b2c/product/card/detail/global", card_detail, name="card_detail"
+    )
+    app.router.add_get(
+        "/br/api/catalog_system/pub/products/search/",
+        catalog_system,
+        name="catalog_system",
+    )
+    app.router.add_post("/br/api/checkout/pub/orderForm", order_form, name="orderForm")
+    app.router.add_post(
+        "/br/api/checkout/pub/orderForm/{id}/items", items, name="items"
+    )
+    app.router.add_post(
+        "/br/api/checkout/pub/orderForm/{id}/attachments/marketingData",
+        marketing_data,
+        name="marketingData",
+    )
+    app.router.add_get(
+        "/br/tradein/vtex/getProductGroup/{id_modelo}/{id_cor}/MQ==",
+        product_group,
+        name="getProductGroup",
+    )
+    app.router.add_get("/br/{slug}/p", produto, name="produto")
+    app.router.add_get("/_contagem", rota_contagem, name="contagem")
+    app.router.add_post("/_estoque/{id_cor}", alternar_estoque, name="estoque")
+    return app
+
+
+def main() -> None:
+    """Executa a loja falsa até ser encerrada (`Ctrl + C`)."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=50, help="em milissegundos")
+    parser.add_argument(
+        "--variacao-latencia", type=float, default=0, help="em milissegundos"
+    )
+    parser.add_argument("--taxa-erro", type=float, default=0, help="entre 0 e 1")
+    parser.add_argument(
+        "--tamanho-pagina", type=int, default=1024 * 1024, help="em bytes"
+    )
+    args = parser.parse_args()
+
+    web.run_app(
+        criar_loja_falsa(
+            latencia=args.latencia / 1000,
+            variacao_latencia=args.variacao_latencia / 1000,
+            taxa_erro=args.taxa_erro,
+            tamanho_pagina=args.tamanho_pagina,
+        ),
+        host=args.host,
+        port=args.porta,
+        print=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Bot API falsa local, que substitui a Bot API do Telegram no teste de carga (`carga`).
+
+Responde localmente aos métodos usados pelo bot.py (`getMe`, `sendMessage`, `editMessageText`, `editMessageReplyMarkup`,
+`deleteMessage`, `answerCallbackQuery` e `getChatMember`, que sempre informa um membro do grupo), com latência configurável.
+Cada chamada do bot é colocada na fila do chat, com o instante em que chegou, para que os usuários virtuais esperem as respostas.\n
+O bot.py usa a Bot API falsa através da variável de ambiente `URL_API_TELEGRAM` (ex: `http://127.0.0.1:8081/bot`).
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from aiohttp import web
+
+# Usuário do bot falso, retornado por `getMe` e como autor das mensagens enviadas
+BOT = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Bot",
+    "username": "bot_falso",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class TelegramFalso:
+    """
+    Bot API falsa, com uma fila `[(metodo, dados, resultado, instante)]` das chamadas do bot a cada chat.\n
+    `latencia` em segundos, adicionada a cada resposta.
+    """
+
+    def __init__(self, latencia: float = 0.0) -> None:
+        self.latencia = latencia
+        self.chamadas: dict[str, int] = dict()
+        self._filas: dict[int, asyncio.Queue] = dict()
+        self._ids_mensagens = itertools.count(1)
+
+    def fila(self, chat_id: int) -> asyncio.Queue:
+        """Retorna a fila das chamadas do bot ao chat."""
+        if chat_id not in self._filas:
+            self._filas[chat_id] = asyncio.Queue()
+        return self._filas[chat_id]
+
+    def descartar(self, chat_id: int) -> None:
+        """Descarta a fila do chat, após o usuário virtual terminar."""
+        self._filas.pop(chat_id, None)
+
+    def _mensagem(self, dados: dict) -> dict:
+        """Retorna a mensagem enviada ou editada pelo bot, no formato da Bot API."""
+        mensagem = {
+            "message_id": int(dados.get("message_id") or next(self._ids_mensagens)),
+            "date": int(time.time()),
+            "chat": {"id": int(dados["chat_id"]), "type": "private"},
+            "from": BOT,
+            "text": dados.get("text", ""),
+        }
+        if dados.get("reply_markup"):
+            mensagem["reply_markup"] = json.loads(dados["reply_markup"])
+        return mensagem
+
+    async def _metodo(self, request: web.Request) -> web.Response:
+        """Responde a um método da Bot API e coloca a chamada na fila do chat."""
+        instante = time.perf_counter()
+        metodo = request.match_info["metodo"]
+        self.chamadas[metodo] = self.chamadas.get(metodo, 0) + 1
+
+        # O python-telegram-bot envia os parâmetros como formulário, com os valores compostos em JSON
+        if request.content_type == "application/json":
+            dados = await request.json()
+        else:
+            dados = dict(await request.post())
+
+        if metodo == "getMe":
+            resultado = BOT
+        elif metodo == "getChatMember":
+            resultado = {
+                "status": "member",
+                "user": {"id": int(dados["user_id"]), "is_bot": False, "first_name": "Usuário"},
+            }
+        elif metodo in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            resultado = self._mensagem(dados)
+        else:
+            resultado = True
+
+        if "chat_id" in dados and metodo != "getChatMember":
+            self.fila(int(dados["chat_id"])).put_nowait((metodo, dados, resultado, instante))
+
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        return web.json_response({"ok": True, "result": resultado})
+
+    def criar_app(self) -> web.Application:
+        """Cria a aplicação `aiohttp` da Bot API falsa, com a rota `POST /bot<token>/<metodo>`."""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{metodo}", self._metodo)
+        return app
@@ -3,14 +3,18 @@
 """
 Telegram bot que gera links para o carrinho da loja da Samsung com um produto escolhido e desconto do Vale Mais - Troca Smart.\n
 
-A comunicação do bot ocorre através de polling.\n
+A comunicação do bot ocorre através de polling ou, opcionalmente, de webhook (variável de ambiente `MODO`).
+Opcionalmente, o bot é executado em vários processos trabalhadores, com um processo de entrada que distribui os updates entre eles (ver `escala`).\n
 O bot funciona através do `ConversationHandler`, que define a ordem de algumas funções callback.\n
 A ordem das funções, definida nas etapas (`states`), pede ao usuário escolher o modelo, opcionalmente informar o link do modelo,
-a capacidade e a cor do modelo escolhido, e por fim a quantidade de links a serem gerados.\n
+a capacidade e a cor do modelo escolhido, e por fim a quantidade de links a serem gerados.
+Conversas sem resposta do usuário por `TEMPO_CONVERSA` segundos são encerradas, e o `user_data` é descartado ao fim de cada conversa.\n
 Os botões funcionam através de `InlineKeyboard`.\n
 Os modelos apresentados nos botões para o usuário são armazenados no dicionário `MODELOS`.
 As opções de capacidades e de cores do modelo são filtradas e apresentadas nos botões para o usuário apenas se estão com estoque.\n
-Os links são gerados com o modelo e o desconto do Vale Mais - Troca Smart nos carrinhos.
+Os links são gerados com o modelo e o desconto do Vale Mais - Troca Smart nos carrinhos.\n
+Com o comando /avisar, o usuário assina o aviso de estoque de um modelo, capacidade e cor sem estoque,
+e é avisado (opcionalmente com os links já gerados) quando a cor voltar a ter estoque (ver `avisos`).
 
 Uso:
 O bot solicita informações sobre um modelo da Samsung Shop através de `InlineKeyboard`
@@ -19,33 +23,83 @@ Com essas informações o bot gera o link do carrinho com o modelo e o desconto.
 Envie /start para informações de como utilizar.
 Envie /gerar para iniciar o processo de geração do link.
 Escolha um modelo (opcionalmente informe o link), a capacidade, a cor, e a quantidade de links.
+Envie /avisar <modelo> <capacidade> <cor> [quantidade] para ser avisado quando a cor voltar a ter estoque, e /avisos para cancelar os avisos.
 """
 
+import asyncio
+import atexit
+import functools
 import logging
+import sys
+from avisos import INTERVALO_ESTOQUE, MAX_AVISOS_USUARIO, MonitorEstoque, verificar_avisos
+from busca import escolher_opcao, interpretar_pedido, termos_restantes
+from cache import CacheTTL
+from carrinhos import PoolCarrinhos
+from catalogo import (
+    CATEGORIAS_DESCOBERTA,
+    INTERVALO_CATALOGO,
+    INTERVALO_DESCOBERTA,
+    JITTER_CATALOGO,
+    atualizar_catalogo,
+    carregar_catalogo,
+    descobrir_catalogo,
+    recarregar_catalogo,
+)
+from envio import URL_API_TELEGRAM, LimitadorTelegram
+from escala import (
+    TRABALHADOR,
+    TRABALHADORES,
+    criar_application_frente,
+    verificar_frente,
+)
+from instantaneos import Instantaneos
+from metricas import iniciar_servidor_metricas, medir_etapa, monitorar_event_loop
 from modelos import MODELOS
+from processador import ProcessadorUsuarios
+from registro import configurar_logging, nova_correlacao
+from teclados import (
+    NOMES_MODELOS,
+    PREFIXO_AVISO,
+    PREFIXO_CAPACIDADE,
+    PREFIXO_COR,
+    PREFIXO_MODELO,
+    PREFIXO_OUTRO,
+    PREFIXO_PAGINA,
+    PREFIXO_QUANTIDADE,
+    TECLADOS_MODELOS,
+    ler_callback_data,
+    teclado_avisos,
+    teclado_opcoes,
+)
 from utils import (
-    gerar_link,
+    criar_sessao,
+    gerar_links,
     informacoes_modelo,
+    informacoes_modelo_em_cache,
+    normalizar_url,
 )
+from webhook import executar_webhook
 from os import getenv
-from re import escape
-from telegram import ChatMember, InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.error import TelegramError
+from telegram import ChatMember, Message, Update
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
+    ChatMemberHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    PersistenceInput,
+    PicklePersistence,
+    TypeHandler,
     filters,
 )
+from typing import Callable, Mapping
 
-# Habilitar logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
+# Habilitar logging (configurado em `main`, ver `registro`)
 logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("apscheduler").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # TOKEN do bot gerado pelo BotFather
@@ -54,37 +108,90 @@ TOKEN = getenv("TOKEN")
 # ID do grupo para restrição de acesso
 GRUPO_ID = getenv("GRUPO_ID")
 
+# Modo de comunicação do bot: "polling" (padrão) ou "webhook"
+MODO = getenv("MODO", "polling")
+
+# Arquivo onde as conversas em andamento são salvas, para que sejam mantidas ao reiniciar o bot (vazio desabilita)
+# No modo escalável, definido pela frente para cada trabalhador (ver `escala`)
+CAMINHO_ESTADO = getenv("CAMINHO_ESTADO", "")
+
+# Configurações do cache das informações dos modelos (TTLs em segundos)
+TTL_CACHE_MODELOS = float(getenv("TTL_CACHE_MODELOS", 120))
+TTL_CACHE_MODELOS_ERRO = float(getenv("TTL_CACHE_MODELOS_ERRO", 15))
+TTL_CACHE_MODELOS_OBSOLETO = float(getenv("TTL_CACHE_MODELOS_OBSOLETO", 600))
+MAX_ITENS_CACHE_MODELOS = int(getenv("MAX_ITENS_CACHE_MODELOS", 500))
+MAX_BYTES_CACHE_MODELOS = int(getenv("MAX_BYTES_CACHE_MODELOS", 16 * 1024 * 1024))
+
+# Configurações do cache de membros do grupo (TTLs em segundos)
+TTL_CACHE_MEMBROS = float(getenv("TTL_CACHE_MEMBROS", 3600))
+TTL_CACHE_NAO_MEMBROS = float(getenv("TTL_CACHE_NAO_MEMBROS", 60))
+MAX_ITENS_CACHE_MEMBROS = int(getenv("MAX_ITENS_CACHE_MEMBROS", 10000))
+
 # Definição das etapas do ConversationHandler
 MODELO, LINK, CAPACIDADE, COR, QUANTIDADE = range(5)
 
+# Tempo (em segundos) sem resposta do usuário após o qual a conversa é encerrada (0 desabilita)
+TEMPO_CONVERSA = float(getenv("TEMPO_CONVERSA", 600))
+
+# Intervalo (em segundos) entre os descartes dos instantâneos das informações dos modelos que não são usados por nenhuma conversa
+INTERVALO_COLETA = float(getenv("INTERVALO_COLETA", 60))
+
 # Definição das opções de quantidade de links
 QUANTIDADE_LINKS = [1, 2, 3, 5, 10, 15, 20]
 
+# Quantidade de links enviados em cada mensagem
+# e se os links são enviados editando uma única mensagem de progresso, em vez de novas mensagens
+LINKS_POR_MENSAGEM = max(1, int(getenv("LINKS_POR_MENSAGEM", 1)))
+MENSAGEM_PROGRESSO = getenv("MENSAGEM_PROGRESSO", "0") == "1"
+
+
+# Status de `ChatMember` que permitem o acesso ao bot
+STATUS_PERMITIDOS = [
+    ChatMember.ADMINISTRATOR,
+    ChatMember.MEMBER,
+    ChatMember.OWNER,
+    ChatMember.RESTRICTED,
+]
+
 
 def restringir_acesso(func):
-    """Restringir acesso aos comandos do bot apenas a usuários em determinado grupo."""
+    """
+    Restringir acesso aos comandos do bot apenas a usuários em determinado grupo.\n
+    O resultado da verificação é armazenado no cache de membros, atualizado pelas mudanças de membros do grupo.
+    Aplicado abaixo de `medir_etapa`, para que a verificação (e a recusa) seja medida e rastreada como parte da etapa.
+    """
 
+    @functools.wraps(func)
     async def wrapper(
         update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
     ):
         usuario_id = update.effective_user.id
+        cache_membros = context.bot_data["cache_membros"]
 
-        # Tenta pegar o `ChatMember` do usuário no grupo
-        try:
-            membro = await context.bot.get_chat_member(
-                chat_id=GRUPO_ID, user_id=usuario_id
-            )
-        except TelegramError:
-            pass
+        entrada = cache_membros.obter(usuario_id)
+        if entrada is not None:
+            membro = entrada[0]
+
+        # Caso o usuário não esteja no cache, tenta pegar o `ChatMember` do usuário no grupo
         else:
-            # Checa status do usuário no grupo
-            if membro.status in [
-                ChatMember.ADMINISTRATOR,
-                ChatMember.MEMBER,
-                ChatMember.OWNER,
-                ChatMember.RESTRICTED,
-            ]:
-                return await func(update, context, *args, **kwargs)
+            try:
+                chat_member = await context.bot.get_chat_member(
+                    chat_id=GRUPO_ID, user_id=usuario_id
+                )
+            except BadRequest:
+                # Usuário nunca esteve no grupo
+                membro = False
+                cache_membros.definir(usuario_id, membro, negativo=True)
+            except TelegramError:
+                # Erros temporários não são armazenados no cache
+                membro = False
+            else:
+                # Checa status do usuário no grupo
+                membro = chat_member.status in STATUS_PERMITIDOS
+                cache_membros.definir(usuario_id, membro, negativo=not membro)
+
+        if membro:
+            return await func(update, context, *args, **kwargs)
 
         # Caso usuário não foi encontrado no grupo (nunca esteve lá ou saiu)
         await update.message.reply_text(
@@ -94,28 +201,48 @@ def restringir_acesso(func):
     return wrapper
 
 
+async def atualiza_membro(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Atualiza o cache de membros quando um usuário entra, sai ou é banido do grupo.\n
+    O bot precisa ser administrador do grupo para receber essas atualizações.
+    """
+    chat_member = update.chat_member.new_chat_member
+    membro = chat_member.status in STATUS_PERMITIDOS
+    context.bot_data["cache_membros"].definir(
+        chat_member.user.id, membro, negativo=not membro
+    )
+
+
+@medir_etapa
 @restringir_acesso
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Envia a mensagem com instruções quando o comando /start é enviado pelo usuário."""
     await update.message.reply_text(
-        "Use o comando /gerar para iniciar a geração do link do carrinho."
+        "Use o comando /gerar para iniciar a geração do link do carrinho.\n"
+        "Use o comando /avisar para ser avisado quando um modelo sem estoque voltar a ter estoque."
     )
 
 
+@medir_etapa
 @restringir_acesso
 async def escolha_modelo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Inicia o `ConversationHandler` e solicita ao usuário escolher um modelo."""
-    # Monta botões com as opções de modelos do dicionário `MODELOS` e uma opção Outro
-    teclado = [
-        *(
-            [InlineKeyboardButton(text=modelo, callback_data=modelo)]
-            for modelo in MODELOS.keys()
-        ),
-        [InlineKeyboardButton(text="Outro", callback_data="outro")],
-    ]
-
+    """
+    Inicia o `ConversationHandler` e solicita ao usuário escolher um modelo.
+    Caso o comando possua o pedido (ex: `/gerar s24 ultra 512 titanium 5`), avança diretamente até onde for possível (ver `pedido_direto`).
+    """
+    # Caso o usuário reinicie a conversa, deleta o teclado anterior e descarta as escolhas anteriores
+    # Cada conversa possui um novo ID de correlação, incluído nos registros de log de todas as suas etapas
+    await apagar_mensagem_bot(update, context)
+    context.user_data.clear()
+    nova_correlacao(context.user_data)
+    logger.info("Conversa do /gerar iniciada")
+
+    if context.args:
+        return await pedido_direto(update, context)
+
+    # Envia a primeira página do teclado com as opções de modelos do dicionário `MODELOS` e uma opção Outro
     mensagem = await update.message.reply_text(
-        text="Escolha o modelo:", reply_markup=InlineKeyboardMarkup(teclado)
+        text="Escolha o modelo:", reply_markup=TECLADOS_MODELOS[0]
     )
 
     # Salva o ID da mensagem do bot para ser excluída depois
@@ -124,6 +251,215 @@ async def escolha_modelo(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return MODELO
 
 
+async def pedido_direto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """
+    Procura o modelo, a capacidade, a cor e a quantidade de links informados junto ao comando /gerar (ver `busca`)
+    e gera os links, caso todos tenham sido encontrados sem ambiguidade.
+    Caso contrário, solicita ao usuário escolher, pelos botões, a partir da primeira opção que não foi encontrada.
+    """
+    nome, informados, quantidade = interpretar_pedido(
+        " ".join(context.args), QUANTIDADE_LINKS
+    )
+
+    if nome is not None:
+        dispositivo = await escolher_dispositivo(context, MODELOS[nome])
+
+    # Caso o modelo não seja encontrado ou ocorra erro na função de pegar as informações do modelo
+    if nome is None or "erro" in dispositivo:
+        erro = "Modelo não encontrado" if nome is None else dispositivo["erro"]
+        mensagem = await update.message.reply_text(
+            text=f"{erro}.\nEscolha o modelo:", reply_markup=TECLADOS_MODELOS[0]
+        )
+
+        # Salva o ID da mensagem do bot para ser excluída depois
+        context.user_data["mensagem_bot_id"] = mensagem.message_id
+
+        return MODELO
+
+    # O ID da mensagem do bot com os botões é salvo para que seja deletada caso a conversa expire
+    capacidades = tuple(dispositivo.keys())
+    capacidade = capacidade_informada(informados, capacidades)
+    if capacidade is None:
+        mensagem = await update.message.reply_text(
+            text=f"{nome}\nEscolha a capacidade:",
+            reply_markup=teclado_opcoes(PREFIXO_CAPACIDADE, capacidades),
+        )
+        context.user_data["mensagem_bot_id"] = mensagem.message_id
+        return CAPACIDADE
+    context.user_data["capacidade"] = capacidade
+
+    cores = tuple(sorted(dispositivo[capacidade]["cores"].keys()))
+    informados = termos_restantes(informados, capacidade)
+    cor = cor_informada(informados, cores)
+    if cor is None:
+        mensagem = await update.message.reply_text(
+            text=f"{nome} {capacidade}\nEscolha a cor:",
+            reply_markup=teclado_opcoes(PREFIXO_COR, cores),
+        )
+        context.user_data["mensagem_bot_id"] = mensagem.message_id
+        return COR
+    context.user_data["cor"] = cor
+
+    if quantidade is None:
+        mensagem = await update.message.reply_text(
+            text=f"{nome} {capacidade} {cor}\nQuantos links você quer gerar?",
+            reply_markup=teclado_opcoes(
+                PREFIXO_QUANTIDADE,
+                tuple(str(quantidade) for quantidade in QUANTIDADE_LINKS),
+                por_linha=len(QUANTIDADE_LINKS),
+            ),
+        )
+        context.user_data["mensagem_bot_id"] = mensagem.message_id
+        return QUANTIDADE
+
+    mensagem = None
+    if MENSAGEM_PROGRESSO:
+        mensagem = await update.message.reply_text(
+            text=f"{nome} {capacidade} {cor}\nGerando {quantidade} link(s)..."
+        )
+    await enviar_links(update, context, dispositivo, quantidade, mensagem)
+
+    # Termina o ConversationHandler
+    encerrar_conversa(update, context)
+    return ConversationHandler.END
+
+
+def capacidade_informada(informados: list[str], capacidades: tuple[str, ...]) -> str | None:
+    """
+    Retorna a capacidade informada entre as capacidades do modelo (ver `escolher_opcao`).
+    A capacidade é escolhida automaticamente caso seja a única e nenhum número tenha sido informado para ela.
+    """
+    return escolher_opcao(informados, capacidades) or (
+        capacidades[0]
+        if len(capacidades) == 1
+        and not any(informado[0].isdigit() for informado in informados)
+        else None
+    )
+
+
+def cor_informada(informados: list[str], cores: tuple[str, ...]) -> str | None:
+    """
+    Retorna a cor informada entre as cores da capacidade (ver `escolher_opcao`).
+    A cor é escolhida automaticamente caso seja a única e nenhum termo tenha sobrado para ela.
+    """
+    return escolher_opcao(informados, cores) or (
+        cores[0] if len(cores) == 1 and not informados else None
+    )
+
+
+async def informacoes_dispositivo(
+    context: ContextTypes.DEFAULT_TYPE, url: str
+) -> dict:
+    """Retorna as informações do modelo do catálogo pré-carregado e, caso o modelo não esteja nele, do cache ou da Samsung Shop."""
+    return context.bot_data["catalogo"].get(
+        normalizar_url(url)
+    ) or await informacoes_modelo_em_cache(
+        context.bot_data["sessao"], context.bot_data["cache_modelos"], url
+    )
+
+
+async def escolher_dispositivo(
+    context: ContextTypes.DEFAULT_TYPE, url: str
+) -> Mapping:
+    """
+    Retorna o instantâneo compartilhado das informações do modelo (ver `informacoes_dispositivo` e `instantaneos`)
+    e salva no `user_data` apenas a referência `(url, versao)` a ele.
+    Caso ocorra erro ao pegar as informações, retorna as informações com o erro, sem alterar o `user_data`.
+    """
+    dispositivo = await informacoes_dispositivo(context, url)
+    if "erro" in dispositivo:
+        return dispositivo
+
+    versao = context.bot_data["instantaneos"].registrar(dispositivo)
+    context.user_data["dispositivo"] = (sys.intern(normalizar_url(url)), versao)
+    return context.bot_data["instantaneos"].obter(versao)
+
+
+async def dispositivo_usuario(context: ContextTypes.DEFAULT_TYPE) -> Mapping | None:
+    """
+    Retorna o instantâneo das informações do modelo escolhido na conversa.\n
+    Caso o instantâneo não esteja mais no registro (ex: conversa restaurada após reiniciar o bot), as informações são pegas novamente,
+    e `None` é retornado caso tenham mudado, já que os botões enviados ao usuário podem não corresponder mais às opções.
+    """
+    url, versao = context.user_data["dispositivo"]
+    instantaneos = context.bot_data["instantaneos"]
+
+    if instantaneos.obter(versao) is None:
+        dispositivo = await informacoes_dispositivo(context, url)
+        if "erro" not in dispositivo:
+            instantaneos.registrar(dispositivo)
+    return instantaneos.obter(versao)
+
+
+async def modelo_alterado(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Informa ao usuário que as opções do modelo mudaram durante a conversa e termina o `ConversationHandler`."""
+    await update.callback_query.edit_message_text(
+        text="As opções do modelo mudaram. Envie /gerar para começar novamente."
+    )
+    encerrar_conversa(update, context)
+    return ConversationHandler.END
+
+
+async def apagar_mensagem_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Deleta a última mensagem do bot na conversa (botões ou solicitação do link), caso exista."""
+    mensagem_bot_id = context.user_data.get("mensagem_bot_id")
+    if mensagem_bot_id is None:
+        return
+
+    try:
+        await context.bot.delete_message(
+            chat_id=update.effective_chat.id, message_id=mensagem_bot_id
+        )
+    except TelegramError:
+        # A mensagem já foi deletada ou é antiga demais para ser deletada
+        pass
+
+
+def encerrar_conversa(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Descarta o `user_data` do usuário ao terminar a conversa,
+    para que a memória usada pelo bot cresça apenas com as conversas ativas, e não com todos os usuários que já usaram o bot.
+    """
+    context.application.drop_user_data(update.effective_user.id)
+
+
+async def descarta_user_data_vazio(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """
+    Descarta o `user_data` vazio do usuário após os outros handlers processarem o update.\n
+    Com persistência, o `python-telegram-bot` cria (e salva) o `user_data` de todo usuário que envia um update, mesmo sem conversa,
+    como no /start e no /avisar, e ele seria mantido para sempre.
+    """
+    usuario_id = update.effective_user.id if update.effective_user else None
+    dados = context.application.user_data
+    if usuario_id in dados and not dados[usuario_id]:
+        context.application.drop_user_data(usuario_id)
+
+
+@medir_etapa
+async def conversa_expirada(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Deleta os botões deixados na conversa e descarta o `user_data` quando o usuário não responde por `TEMPO_CONVERSA` segundos.
+    O `update` é o último recebido na conversa.
+    """
+    await apagar_mensagem_bot(update, context)
+    encerrar_conversa(update, context)
+
+
+@medir_etapa
+async def pagina_modelos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Mostra ao usuário outra página do teclado de modelos."""
+    query = update.callback_query
+    await query.answer()
+
+    _, pagina = ler_callback_data(query.data)
+    await query.edit_message_reply_markup(reply_markup=TECLADOS_MODELOS[int(pagina)])
+
+    return MODELO
+
+
+@medir_etapa
 async def informa_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Solicita ao usuário informar o link do modelo na Samsung Shop."""
     query = update.callback_query
@@ -142,6 +478,7 @@ async def informa_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     return LINK
 
 
+@medir_etapa
 async def escolha_capacidade(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Salva o modelo escolhido e solicita ao usuário escolher a capacidade do modelo."""
     query = update.callback_query
@@ -149,8 +486,9 @@ async def escolha_capacidade(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Se existe uma query, o usuário escolheu o modelo em um dos botões
     if query:
         await query.answer()
-        # Pega URL do dicionário `MODELOS` através do nome do modelo escolhido
-        url = MODELOS[query.data]
+        # Pega URL do dicionário `MODELOS` através do índice do modelo escolhido
+        _, indice = ler_callback_data(query.data)
+        url = MODELOS[NOMES_MODELOS[int(indice)]]
 
     # Se não existe uma query, o usuário informou o URL do modelo
     else:
@@ -167,24 +505,16 @@ async def escolha_capacidade(update: Update, context: ContextTypes.DEFAULT_TYPE)
         message_id=context.user_data["mensagem_bot_id"],
     )
 
-    context.user_data["dispositivo"] = await informacoes_modelo(url)
+    # Consulta o catálogo pré-carregado e, caso o modelo não esteja nele, o cache ou a Samsung Shop
+    dispositivo = await escolher_dispositivo(context, url)
 
     # Caso ocorra erro na função de pegar as informações do modelo
-    if "erro" in context.user_data["dispositivo"]:
-        # Refaz teclado com as opções de modelos
-        teclado = [
-            *(
-                [InlineKeyboardButton(text=modelo, callback_data=modelo)]
-                for modelo in MODELOS.keys()
-            ),
-            [InlineKeyboardButton(text="Outro", callback_data="outro")],
-        ]
-
+    if "erro" in dispositivo:
         # Informa erro ao usuário e solicita escolha de modelo novamente
         message = await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=f"{context.user_data['dispositivo']['erro']}.\nEscolha o modelo:",
-            reply_markup=InlineKeyboardMarkup(teclado),
+            text=f"{dispositivo['erro']}.\nEscolha o modelo:",
+            reply_markup=TECLADOS_MODELOS[0],
         )
 
         # Salva o ID da mensagem do bot para ser excluída depois
@@ -192,106 +522,420 @@ async def escolha_capacidade(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
         return MODELO
 
-    # Monta botões com as opções de capacidades do modelo escolhido
-    teclado = [
-        [InlineKeyboardButton(text=capacidade, callback_data=capacidade)]
-        for capacidade in context.user_data["dispositivo"].keys()
-    ]
-
-    await context.bot.send_message(
+    # Botões com as opções de capacidades do modelo escolhido
+    mensagem = await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Escolha a capacidade:",
-        reply_markup=InlineKeyboardMarkup(teclado),
+        reply_markup=teclado_opcoes(PREFIXO_CAPACIDADE, tuple(dispositivo.keys())),
     )
 
+    # Salva o ID da mensagem do bot, editada nas próximas etapas, para ser excluída caso a conversa expire
+    context.user_data["mensagem_bot_id"] = mensagem.message_id
+
     return CAPACIDADE
 
 
+@medir_etapa
 async def escolha_cor(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Salva a capacidade escolhida e solicita ao usuário escolher a cor do modelo."""
     query = update.callback_query
     await query.answer()
 
-    context.user_data["capacidade"] = query.data
+    dispositivo = await dispositivo_usuario(context)
+    if dispositivo is None:
+        return await modelo_alterado(update, context)
 
-    # Monta botões com as opções de cores do modelo e da capacidade escolhidos
-    teclado = [
-        [InlineKeyboardButton(text=cor, callback_data=cor)]
-        for cor in sorted(context.user_data["dispositivo"][query.data]["cores"].keys())
-    ]
+    # Pega a capacidade através do seu índice nas opções de capacidades
+    _, indice = ler_callback_data(query.data)
+    capacidade = list(dispositivo.keys())[int(indice)]
+    context.user_data["capacidade"] = capacidade
 
+    # Botões com as opções de cores do modelo e da capacidade escolhidos
     await query.edit_message_text(
-        text="Escolha a cor:", reply_markup=InlineKeyboardMarkup(teclado)
+        text="Escolha a cor:",
+        reply_markup=teclado_opcoes(
+            PREFIXO_COR, tuple(sorted(dispositivo[capacidade]["cores"].keys()))
+        ),
     )
 
     return COR
 
 
+@medir_etapa
 async def escolha_quantidade(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Salva a cor escolhida e solicita ao usuário escolher uma quantidade de links a seren gerados."""
     query = update.callback_query
     await query.answer()
 
-    context.user_data["cor"] = query.data
+    dispositivo = await dispositivo_usuario(context)
+    if dispositivo is None:
+        return await modelo_alterado(update, context)
 
-    # Monta botões com as opções de quantidade de links a serem gerados
-    teclado = [
-        [
-            InlineKeyboardButton(text=str(quantidade), callback_data=str(quantidade))
-            for quantidade in QUANTIDADE_LINKS
-        ]
-    ]
+    # Pega a cor através do seu índice nas opções de cores, em ordem alfabética
+    _, indice = ler_callback_data(query.data)
+    cores = dispositivo[context.user_data["capacidade"]]["cores"]
+    context.user_data["cor"] = sorted(cores.keys())[int(indice)]
 
+    # Botões com as opções de quantidade de links a serem gerados
     await query.edit_message_text(
         text="Quantos links você quer gerar?",
-        reply_markup=InlineKeyboardMarkup(teclado),
+        reply_markup=teclado_opcoes(
+            PREFIXO_QUANTIDADE,
+            tuple(str(quantidade) for quantidade in QUANTIDADE_LINKS),
+            por_linha=len(QUANTIDADE_LINKS),
+        ),
     )
 
     return QUANTIDADE
 
 
+@medir_etapa
 async def envia_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Gera e envia ao usuário os links para o carrinho com o modelo e o desconto do Vale Mais - Troca Smart."""
+    """Gera e envia ao usuário a quantidade escolhida de links (ver `enviar_links`)."""
     query = update.callback_query
     await query.answer()
 
-    quantidade = int(query.data)
+    dispositivo = await dispositivo_usuario(context)
+    if dispositivo is None:
+        return await modelo_alterado(update, context)
+
+    _, indice = ler_callback_data(query.data)
+    quantidade = QUANTIDADE_LINKS[int(indice)]
+
+    # Edita a última mensagem do bot para mostrar o progresso, ou a deleta
+    mensagem = None
+    if MENSAGEM_PROGRESSO:
+        mensagem = await query.edit_message_text(text=f"Gerando {quantidade} link(s)...")
+    else:
+        await context.bot.delete_message(
+            chat_id=update.effective_chat.id, message_id=query.message.message_id
+        )
+
+    await enviar_links(update, context, dispositivo, quantidade, mensagem)
+
+    # Termina o ConversationHandler
+    encerrar_conversa(update, context)
+    return ConversationHandler.END
+
 
-    # Pega ID do modelo e ID específico da cor no dicionário `dispositivo`
-    id_modelo = context.user_data["dispositivo"][context.user_data["capacidade"]]["id"]
-    id_cor = context.user_data["dispositivo"][context.user_data["capacidade"]]["cores"][
+async def enviar_links(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    dispositivo: Mapping,
+    quantidade: int,
+    mensagem: Message | None,
+) -> None:
+    """
+    Gera e envia ao usuário os links para o carrinho com o modelo e o desconto do Vale Mais - Troca Smart.
+    Com `MENSAGEM_PROGRESSO`, os links são enviados editando a `mensagem` de progresso.
+    """
+    # Pega ID do modelo e ID específico da cor nas informações do modelo
+    id_modelo = dispositivo[context.user_data["capacidade"]]["id"]
+    id_cor = dispositivo[context.user_data["capacidade"]]["cores"][
         context.user_data["cor"]
     ]
 
-    # Deleta a última mensagem do bot
-    await context.bot.delete_message(
-        chat_id=update.effective_chat.id, message_id=query.message.message_id
+    # Gera os links simultaneamente, com limite de links gerados ao mesmo tempo, usando os carrinhos vazios do pool, se houver
+    tarefas = gerar_links(
+        context.bot_data["sessao"],
+        id_modelo,
+        id_cor,
+        quantidade,
+        context.bot_data["pool_carrinhos"].retirar,
     )
 
-    for i in range(quantidade):
-        link = await gerar_link(id_modelo, id_cor)
+    # Envia os links para o usuário na ordem, conforme são gerados, `LINKS_POR_MENSAGEM` links por mensagem
+    # Com a mensagem de progresso, os links gerados até o momento substituem o texto da mensagem
+    enviados = 0
+    linhas: list[str] = list()
+    pendentes = 0
+    try:
+        for numero, tarefa in enumerate(tarefas, 1):
+            link = await tarefa
+
+            if link:
+                enviados += 1
+                pendentes += 1
+                linhas.append(f"Link {enviados} gerado: {link}")
+
+            if pendentes and (pendentes == LINKS_POR_MENSAGEM or numero == quantidade):
+                if MENSAGEM_PROGRESSO:
+                    if numero < quantidade:
+                        await mensagem.edit_text(
+                            text="\n".join(
+                                linhas + [f"Gerando {numero} de {quantidade} links..."]
+                            )
+                        )
+                else:
+                    await context.bot.send_message(
+                        chat_id=update.effective_chat.id,
+                        text="\n".join(linhas[-pendentes:]),
+                    )
+                pendentes = 0
+    finally:
+        # Caso o envio seja interrompido, cancela os links que ainda estão sendo gerados
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+    # Informa ao usuário caso algum link não tenha sido gerado
+    erro = None
+    if enviados < quantidade:
+        logger.warning(
+            "%s de %s links do modelo de ID %s não foram gerados",
+            quantidade - enviados,
+            quantidade,
+            id_modelo,
+        )
+        erro = (
+            "Houve um erro ao gerar o link."
+            if quantidade == 1
+            else f"Houve um erro ao gerar {quantidade - enviados} de {quantidade} links."
+        )
 
-        # Envia o link do carrinho para o usuário, ou o erro caso ocorra
-        if link:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"Link {i + 1} gerado: {link}",
-            )
-        else:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Houve um erro ao gerar o link.",
-            )
-            return ConversationHandler.END
+    if MENSAGEM_PROGRESSO:
+        await mensagem.edit_text(text="\n".join(linhas + ([erro] if erro else [])))
+    elif erro:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=erro)
 
-    # Termina o ConversationHandler
-    return ConversationHandler.END
+
+@medir_etapa
+@restringir_acesso
+async def avisar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Assina o aviso de estoque do modelo, capacidade e cor informados junto ao comando (ex: `/avisar s24 ultra 512 titanium`),
+    opcionalmente com a quantidade de links gerados automaticamente quando a cor voltar a ter estoque (ex: `/avisar s24 ultra 512 titanium 5`).
+    Caso alguma opção não seja encontrada sem ambiguidade, informa as opções ao usuário.
+    """
+    monitor = context.bot_data["monitor_estoque"]
+    usuario_id = update.effective_user.id
+
+    if not context.args:
+        await update.message.reply_text(
+            "Informe o modelo, a capacidade e a cor. Ex: /avisar s24 256 verde\n"
+            "Informe também uma quantidade para gerar os links automaticamente. Ex: /avisar s24 256 verde 5"
+        )
+        return
+
+    if len(monitor.assinaturas_usuario(usuario_id)) >= MAX_AVISOS_USUARIO:
+        await update.message.reply_text(
+            f"Você já possui {MAX_AVISOS_USUARIO} avisos de estoque. Envie /avisos para cancelar algum."
+        )
+        return
+
+    nome, informados, quantidade = interpretar_pedido(
+        " ".join(context.args), QUANTIDADE_LINKS
+    )
+    if nome is None:
+        await update.message.reply_text("Modelo não encontrado.")
+        return
+
+    # As informações incluem as cores sem estoque, que não fazem parte do catálogo nem do cache
+    dispositivo = await informacoes_modelo(
+        context.bot_data["sessao"], MODELOS[nome], indisponiveis=True
+    )
+    if "erro" in dispositivo:
+        await update.message.reply_text(f"{dispositivo['erro']}.")
+        return
+
+    capacidades = tuple(dispositivo.keys())
+    capacidade = capacidade_informada(informados, capacidades)
+    if capacidade is None:
+        await update.message.reply_text(
+            f"{nome}\nInforme a capacidade: {', '.join(capacidades)}."
+        )
+        return
+
+    cores = tuple(sorted(dispositivo[capacidade]["cores"].keys()))
+    cor = cor_informada(termos_restantes(informados, capacidade), cores)
+    if cor is None:
+        await update.message.reply_text(
+            f"{nome} {capacidade}\nInforme a cor: {', '.join(cores)}."
+        )
+        return
+
+    descricao = f"{nome} {capacidade} {cor}"
+    disponivel = await monitor.assinar(
+        context.bot_data["sessao"],
+        usuario_id,
+        update.effective_chat.id,
+        dispositivo[capacidade]["id"],
+        dispositivo[capacidade]["cores"][cor],
+        descricao,
+        quantidade or 0,
+    )
+    if disponivel:
+        await update.message.reply_text(
+            f"{descricao} já possui estoque. Envie /gerar para gerar o link."
+        )
+        return
+
+    await update.message.reply_text(
+        f"Você será avisado quando {descricao} voltar a ter estoque."
+        + (f"\n{quantidade} link(s) serão gerados automaticamente." if quantidade else "")
+    )
+
+
+@medir_etapa
+@restringir_acesso
+async def lista_avisos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Envia ao usuário os seus avisos de estoque, com um botão para cancelar cada um."""
+    assinaturas = context.bot_data["monitor_estoque"].assinaturas_usuario(
+        update.effective_user.id
+    )
+    if not assinaturas:
+        await update.message.reply_text(
+            "Você não possui avisos de estoque. Envie /avisar para criar um."
+        )
+        return
+
+    await update.message.reply_text(
+        text="Seus avisos de estoque:",
+        reply_markup=teclado_avisos(
+            [(id_cor, assinatura["descricao"]) for id_cor, assinatura in assinaturas]
+        ),
+    )
+
+
+@medir_etapa
+async def cancela_aviso(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Cancela o aviso de estoque escolhido e mostra os avisos restantes do usuário."""
+    query = update.callback_query
+    await query.answer()
+
+    monitor = context.bot_data["monitor_estoque"]
+    _, id_cor = ler_callback_data(query.data)
+    assinatura = await monitor.cancelar(update.effective_user.id, id_cor)
+
+    texto = (
+        f"Aviso de {assinatura['descricao']} cancelado."
+        if assinatura
+        else "O aviso já foi enviado ou cancelado."
+    )
+    assinaturas = monitor.assinaturas_usuario(update.effective_user.id)
+    if not assinaturas:
+        await query.edit_message_text(text=texto)
+        return
+
+    await query.edit_message_text(
+        text=f"{texto}\nSeus avisos de estoque:",
+        reply_markup=teclado_avisos(
+            [(id_cor, assinatura["descricao"]) for id_cor, assinatura in assinaturas]
+        ),
+    )
+
+
+async def post_init(application: Application) -> None:
+    """
+    Cria a sessão HTTP compartilhada pelas requisições à Samsung Shop, os caches das informações dos modelos e dos membros do grupo,
+    o registro dos instantâneos das informações dos modelos usados pelas conversas, o monitor dos avisos de estoque, inicia o pool de carrinhos vazios, o servidor de métricas e a medição do atraso do event loop,
+    e carrega o catálogo dos modelos de `MODELOS` salvo em arquivo ao iniciar a `application`.
+    """
+    application.bot_data["sessao"] = criar_sessao()
+    application.bot_data["servidor_metricas"] = await iniciar_servidor_metricas()
+    application.bot_data["monitor_event_loop"] = asyncio.create_task(
+        monitorar_event_loop()
+    )
+    application.bot_data["pool_carrinhos"] = PoolCarrinhos(application.bot_data["sessao"])
+    application.bot_data["pool_carrinhos"].iniciar()
+    application.bot_data["catalogo"] = carregar_catalogo()
+    application.bot_data["instantaneos"] = Instantaneos()
+    application.bot_data["monitor_estoque"] = MonitorEstoque()
+    application.bot_data["monitor_estoque"].carregar()
+    application.bot_data["cache_modelos"] = CacheTTL(
+        ttl=TTL_CACHE_MODELOS,
+        ttl_negativo=TTL_CACHE_MODELOS_ERRO,
+        ttl_obsoleto=TTL_CACHE_MODELOS_OBSOLETO,
+        max_itens=MAX_ITENS_CACHE_MODELOS,
+        max_bytes=MAX_BYTES_CACHE_MODELOS,
+    )
+    application.bot_data["cache_membros"] = CacheTTL(
+        ttl=TTL_CACHE_MEMBROS,
+        ttl_negativo=TTL_CACHE_NAO_MEMBROS,
+        max_itens=MAX_ITENS_CACHE_MEMBROS,
+    )
+
+
+async def post_shutdown(application: Application) -> None:
+    """
+    Para a medição do atraso do event loop, o pool de carrinhos vazios e o servidor de métricas
+    e fecha a sessão HTTP compartilhada ao encerrar a `application`.
+    """
+    application.bot_data["monitor_event_loop"].cancel()
+    await application.bot_data["pool_carrinhos"].parar()
+    await application.bot_data["sessao"].close()
+    if application.bot_data["servidor_metricas"]:
+        await application.bot_data["servidor_metricas"].cleanup()
+
+
+async def coletar_instantaneos(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Descarta os instantâneos das informações dos modelos que não são referenciados por nenhuma conversa ativa."""
+    context.bot_data["instantaneos"].coletar(
+        dados["dispositivo"][1]
+        for dados in context.application.user_data.values()
+        if "dispositivo" in dados
+    )
+
+
+def rotear(rotas: dict[str, Callable]) -> CallbackQueryHandler:
+    """
+    Retorna um `CallbackQueryHandler` que despacha o callback para a função associada ao prefixo do callback_data.\n
+    A função é encontrada diretamente no dicionário `rotas`, sem testar um padrão para cada opção dos teclados.
+    Callbacks com prefixos que não estão em `rotas` (como botões de etapas anteriores) são ignorados.
+    """
+
+    async def despachar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        prefixo, _ = ler_callback_data(update.callback_query.data)
+        return await rotas[prefixo](update, context)
+
+    return CallbackQueryHandler(
+        despachar,
+        pattern=lambda dados: isinstance(dados, str)
+        and ler_callback_data(dados)[0] in rotas,
+    )
+
+
+def executar(application: Application) -> None:
+    """Executa a `application` até o usuário pressionar `Ctrl + C`, através de webhook, caso escolhido, ou através de polling."""
+    if MODO == "webhook":
+        asyncio.run(executar_webhook(application))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES, poll_interval=3)
 
 
 def main() -> None:
     """Começa o bot."""
+    # Os registros de log são escritos por uma thread separada, e os pendentes são escritos ao encerrar
+    atexit.register(configurar_logging().stop)
+
+    # No modo escalável, este processo é a frente, que apenas encaminha os updates aos trabalhadores
+    if TRABALHADORES and TRABALHADOR is None:
+        executar(criar_application_frente(TOKEN))
+        return
+
     # Cria a `application` e passa o TOKEN do bot
-    application = Application.builder().token(TOKEN).build()
+    # A sessão HTTP compartilhada é criada e fechada junto com a `application`
+    # Os updates de usuários diferentes são processados simultaneamente, e os de cada usuário, na ordem (ver `processador`)
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .rate_limiter(LimitadorTelegram())
+        .concurrent_updates(ProcessadorUsuarios())
+    )
+    if URL_API_TELEGRAM:
+        builder.base_url(URL_API_TELEGRAM)
+    # Apenas o `user_data` e as etapas das conversas são salvos
+    if CAMINHO_ESTADO:
+        builder.persistence(
+            PicklePersistence(
+                CAMINHO_ESTADO,
+                store_data=PersistenceInput(
+                    bot_data=False, chat_data=False, callback_data=False
+                ),
+            )
+        )
+    application = builder.build()
 
     # Configurar `ConversationHandler` com as etapas (`states`)
     # Cada handler é associado a uma interação do usuário em resposta às solicitações do bot
@@ -299,23 +943,67 @@ def main() -> None:
         entry_points=[CommandHandler("gerar", escolha_modelo)],
         states={
             MODELO: [
-                *(
-                    CallbackQueryHandler(
-                        escolha_capacidade, pattern="^" + escape(modelo) + "$"
-                    )
-                    for modelo in MODELOS.keys()
-                ),
-                CallbackQueryHandler(informa_link, pattern="^outro$"),
+                rotear(
+                    {
+                        PREFIXO_MODELO: escolha_capacidade,
+                        PREFIXO_PAGINA: pagina_modelos,
+                        PREFIXO_OUTRO: informa_link,
+                    }
+                )
             ],
             LINK: [MessageHandler(filters.TEXT & ~filters.COMMAND, escolha_capacidade)],
-            CAPACIDADE: [CallbackQueryHandler(escolha_cor, pattern="^.*$")],
-            COR: [CallbackQueryHandler(escolha_quantidade, pattern="^.*$")],
-            QUANTIDADE: [
-                CallbackQueryHandler(envia_link, pattern="^" + str(quantidade) + "$")
-                for quantidade in QUANTIDADE_LINKS
-            ],
+            CAPACIDADE: [rotear({PREFIXO_CAPACIDADE: escolha_cor})],
+            COR: [rotear({PREFIXO_COR: escolha_quantidade})],
+            QUANTIDADE: [rotear({PREFIXO_QUANTIDADE: envia_link})],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversa_expirada)],
         },
         fallbacks=[CommandHandler("gerar", escolha_modelo)],
+        conversation_timeout=TEMPO_CONVERSA or None,
+        name="gerar",
+        persistent=bool(CAMINHO_ESTADO),
+    )
+
+    # No modo escalável, apenas o primeiro trabalhador atualiza e descobre o catálogo, e os outros o carregam do arquivo
+    principal = not TRABALHADOR
+
+    # Atualiza periodicamente o catálogo dos modelos de `MODELOS`, com variação aleatória no intervalo
+    application.job_queue.run_repeating(
+        atualizar_catalogo if principal else recarregar_catalogo,
+        interval=INTERVALO_CATALOGO,
+        first=0,
+        job_kwargs={"jitter": JITTER_CATALOGO},
+    )
+
+    # Descobre periodicamente os modelos das categorias da Samsung Shop, caso configuradas
+    if CATEGORIAS_DESCOBERTA and principal:
+        application.job_queue.run_repeating(
+            descobrir_catalogo,
+            interval=INTERVALO_DESCOBERTA,
+            first=0,
+            job_kwargs={"jitter": JITTER_CATALOGO},
+        )
+
+    # Descarta periodicamente os instantâneos que não são mais usados pelas conversas
+    application.job_queue.run_repeating(
+        coletar_instantaneos, interval=INTERVALO_COLETA, first=INTERVALO_COLETA
+    )
+
+    # Verifica periodicamente o estoque dos produtos assinados e avisa os assinantes
+    application.job_queue.run_repeating(
+        verificar_avisos, interval=INTERVALO_ESTOQUE, first=INTERVALO_ESTOQUE
+    )
+
+    # Encerra o trabalhador caso a frente termine sem encerrá-lo
+    if TRABALHADOR is not None:
+        application.job_queue.run_repeating(verificar_frente, interval=5)
+
+    # Atualiza o cache de membros com as mudanças de membros do grupo
+    application.add_handler(
+        ChatMemberHandler(
+            atualiza_membro,
+            ChatMemberHandler.CHAT_MEMBER,
+            chat_id=int(GRUPO_ID) if GRUPO_ID else None,
+        )
     )
 
     # Responda ao comando start
@@ -324,8 +1012,16 @@ def main() -> None:
     # Adicionar `ConversationHandler` a `application` que vai ser utilizada para lidar com updates
     application.add_handler(conv_handler)
 
+    # Responda aos comandos dos avisos de estoque e aos botões de cancelamento dos avisos
+    application.add_handler(CommandHandler("avisar", avisar))
+    application.add_handler(CommandHandler("avisos", lista_avisos))
+    application.add_handler(rotear({PREFIXO_AVISO: cancela_aviso}))
+
+    # Após os outros handlers, descarta o `user_data` vazio de usuários sem conversa em andamento
+    application.add_handler(TypeHandler(Update, descarta_user_data_vazio), group=1)
+
     # Bot irá operar até usuário pressionar `Ctrl + C`
-    application.run_polling(allowed_updates=Update.ALL_TYPES, poll_interval=3)
+    executar(application)
 
 
 if __name__ == "__main__":
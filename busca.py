@@ -0,0 +1,155 @@
+"""
+Busca dos modelos de `MODELOS`, das capacidades e das cores pelo texto informado pelo usuário no bot.py (ex: `/gerar s24 ultra 512 titanium 5`).
+
+Os nomes são normalizados (sem acentos, maiúsculas, pontuação e sufixo `GB`) e divididos em termos,
+e os termos informados são comparados aos termos dos nomes, aceitando prefixos e pequenas diferenças de grafia nos termos sem números.\n
+Função `interpretar_pedido`, que encontra o modelo e a quantidade de links no texto.\n
+Função `escolher_opcao`, que encontra uma capacidade ou cor entre as opções do modelo.\n
+Função `termos_restantes`, que retorna os termos informados que não correspondem à opção escolhida.\n
+Uma busca é resolvida apenas quando uma única opção é a melhor. Caso contrário, `None` é retornado, e o usuário escolhe pelos botões.
+"""
+
+import functools
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from modelos import MODELOS
+
+# Termos comuns a quase todos os modelos, que não diferenciam um modelo de outro
+TERMOS_IGNORADOS = frozenset({"galaxy", "samsung", "celular", "smartphone"})
+
+# Semelhança mínima entre dois termos sem números para que sejam considerados iguais (ex: `titanium` e `titanio`)
+SEMELHANCA_MINIMA = 0.8
+
+# Índice `[(nome, termos)]` dos modelos de `MODELOS`, e quantidade de modelos quando foi montado
+_indice_modelos: list[tuple[str, frozenset[str]]] = list()
+_modelos_indexados = 0
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Retorna o texto normalizado para a busca: sem acentos, em minúsculas, apenas com letras, números e espaços simples,
+    com `+` como `plus` e capacidades sem o sufixo `GB` (ex: `Galaxy S24+ 512 GB` se torna `galaxy s24 plus 512`).
+    """
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = texto.replace("+", " plus ")
+    texto = re.sub(r"(\d+)\s*gb\b", r"\1", texto)
+    texto = re.sub(r"(\d+)\s*tb\b", r"\1tb", texto)
+    return " ".join(re.findall(r"[a-z0-9]+", texto))
+
+
+def termos(texto: str) -> list[str]:
+    """Retorna os termos do texto normalizado, na ordem."""
+    return normalizar_texto(texto).split()
+
+
+def _semelhantes(informado: str, termo: str) -> bool:
+    """
+    Retorna se o termo informado corresponde ao termo de um nome: iguais, prefixo com ao menos 3 caracteres,
+    ou, para termos sem números, semelhantes o suficiente (termos com números, como `s24` e `512`, precisam ser iguais).
+    """
+    if informado == termo:
+        return True
+    if any(c.isdigit() for c in informado + termo):
+        return False
+    if len(informado) >= 3 and termo.startswith(informado):
+        return True
+    return SequenceMatcher(None, informado, termo).ratio() >= SEMELHANCA_MINIMA
+
+
+def _correspondencias(informados: list[str], termos_nome: frozenset[str]) -> set[str]:
+    """Retorna os termos do nome que correspondem a algum dos termos informados."""
+    return {
+        termo
+        for termo in termos_nome
+        if any(_semelhantes(informado, termo) for informado in informados)
+    }
+
+
+def _restantes(informados: list[str], termos_nome: frozenset[str]) -> list[str]:
+    """Retorna os termos informados que não correspondem a nenhum dos termos do nome."""
+    return [
+        informado
+        for informado in informados
+        if not any(_semelhantes(informado, termo) for termo in termos_nome)
+    ]
+
+
+def _melhor(pontuacoes: list[tuple[tuple[int, int], str]]) -> str | None:
+    """Retorna o nome com a maior pontuação, apenas caso seja o único com essa pontuação e tenha alguma correspondência."""
+    if not pontuacoes:
+        return None
+    pontuacoes.sort(reverse=True)
+    (pontuacao, nome) = pontuacoes[0]
+    if pontuacao[0] == 0:
+        return None
+    if len(pontuacoes) > 1 and pontuacoes[1][0] == pontuacao:
+        return None
+    return nome
+
+
+def _indice() -> list[tuple[str, frozenset[str]]]:
+    """Retorna o índice dos modelos de `MODELOS`, montado novamente apenas quando modelos são adicionados."""
+    global _modelos_indexados
+    if _modelos_indexados != len(MODELOS):
+        _indice_modelos[:] = [
+            (nome, frozenset(termos(nome)) - TERMOS_IGNORADOS) for nome in MODELOS
+        ]
+        _modelos_indexados = len(MODELOS)
+    return _indice_modelos
+
+
+def interpretar_pedido(
+    texto: str, quantidades: list[int]
+) -> tuple[str | None, list[str], int | None]:
+    """
+    Retorna o nome do modelo de `MODELOS` encontrado no texto, os termos restantes (capacidade e cor)
+    e a quantidade de links, no formato `(nome, termos, quantidade)`.\n
+    A quantidade é o último termo, caso seja um número entre as `quantidades`.
+    O modelo é o que possui mais termos informados e, no empate, menos termos não informados
+    (ex: `s24` é o `Galaxy S24`, e `s24 ultra` é o `Galaxy S24 Ultra`).
+    """
+    informados = [termo for termo in termos(texto) if termo not in TERMOS_IGNORADOS]
+
+    quantidade = None
+    if informados and informados[-1].isdigit() and int(informados[-1]) in quantidades:
+        quantidade = int(informados.pop())
+
+    pontuacoes = list()
+    for nome, termos_nome in _indice():
+        encontrados = _correspondencias(informados, termos_nome)
+        pontuacoes.append(
+            ((len(encontrados), len(encontrados) - len(termos_nome)), nome)
+        )
+    nome = _melhor(pontuacoes)
+    if nome is None:
+        return None, informados, quantidade
+
+    # Os termos usados para encontrar o modelo não são usados para encontrar a capacidade e a cor
+    return nome, _restantes(informados, dict(_indice())[nome]), quantidade
+
+
+@functools.lru_cache(maxsize=1024)
+def _indice_opcoes(opcoes: tuple[str, ...]) -> tuple[tuple[str, frozenset[str]], ...]:
+    """Retorna o índice das opções (capacidades ou cores), armazenado em cache pelas opções."""
+    return tuple((opcao, frozenset(termos(opcao))) for opcao in opcoes)
+
+
+def escolher_opcao(informados: list[str], opcoes: tuple[str, ...]) -> str | None:
+    """
+    Retorna a opção (capacidade ou cor) que corresponde aos termos informados, ou `None` caso nenhuma ou mais de uma corresponda.
+    A opção é a que possui mais termos informados e, no empate, menos termos não informados.
+    """
+    pontuacoes = list()
+    for opcao, termos_opcao in _indice_opcoes(opcoes):
+        encontrados = _correspondencias(informados, termos_opcao)
+        pontuacoes.append(
+            ((len(encontrados), len(encontrados) - len(termos_opcao)), opcao)
+        )
+    return _melhor(pontuacoes)
+
+
+def termos_restantes(informados: list[str], opcao: str) -> list[str]:
+    """Retorna os termos informados que não correspondem à opção escolhida."""
+    return _restantes(informados, frozenset(termos(opcao)))
@@ -0,0 +1,113 @@
+"""
+Cache em memória para o bot.py e o utils.py.
+
+Classe `CacheTTL`, que armazena valores com tempo de vida (TTL), descarta os menos usados recentemente (LRU)
+quando o limite de itens ou de memória é atingido, e permite servir valores expirados enquanto são atualizados.
+"""
+
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+def tamanho_aproximado(valor: Any) -> int:
+    """Retorna o tamanho aproximado em bytes de um valor, somando recursivamente dicionários, listas e tuplas."""
+    tamanho = sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        tamanho += sum(
+            tamanho_aproximado(chave) + tamanho_aproximado(item)
+            for chave, item in valor.items()
+        )
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        tamanho += sum(tamanho_aproximado(item) for item in valor)
+    return tamanho
+
+
+class CacheTTL:
+    """
+    Cache com tempo de vida (TTL) e descarte dos itens menos usados recentemente (LRU).\n
+    Cada item tem um TTL, após o qual é considerado obsoleto, mas ainda pode ser servido por até `ttl_obsoleto` segundos
+    enquanto é atualizado em segundo plano (stale-while-revalidate).
+    Itens negativos (resultados de erro) usam `ttl_negativo` e não são servidos depois de expirados.\n
+    O cache respeita um limite de itens (`max_itens`) e um limite aproximado de memória em bytes (`max_bytes`).
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        ttl_negativo: float,
+        ttl_obsoleto: float = 0,
+        max_itens: int = 1000,
+        max_bytes: int = 0,
+    ) -> None:
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.ttl_obsoleto = ttl_obsoleto
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # Cada item no formato `chave: (valor, expira_em, negativo, tamanho)`
+        self._itens: OrderedDict[Hashable, tuple[Any, float, bool, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def __contains__(self, chave: Hashable) -> bool:
+        return self.obter(chave) is not None
+
+    def obter(self, chave: Hashable) -> tuple[Any, bool] | None:
+        """
+        Retorna o valor da chave e se ele está obsoleto, no formato `(valor, obsoleto)`.\n
+        Retorna `None` caso a chave não esteja no cache ou tenha expirado além do tempo permitido.
+        """
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+
+        valor, expira_em, negativo, _ = item
+        agora = time.monotonic()
+
+        if agora < expira_em:
+            self._itens.move_to_end(chave)
+            return valor, False
+
+        # Itens negativos não são servidos depois de expirados
+        if not negativo and agora < expira_em + self.ttl_obsoleto:
+            self._itens.move_to_end(chave)
+            return valor, True
+
+        self.remover(chave)
+        return None
+
+    def definir(self, chave: Hashable, valor: Any, negativo: bool = False) -> None:
+        """Armazena o valor na chave, com o TTL negativo caso seja um resultado de erro."""
+        self.remover(chave)
+
+        ttl = self.ttl_negativo if negativo else self.ttl
+        tamanho = tamanho_aproximado(valor) if self.max_bytes else 0
+
+        # Valores maiores que o limite de memória não são armazenados
+        if self.max_bytes and tamanho > self.max_bytes:
+            return
+
+        self._itens[chave] = (valor, time.monotonic() + ttl, negativo, tamanho)
+        self.bytes += tamanho
+
+        # Descarta os itens menos usados recentemente até respeitar os limites
+        while len(self._itens) > self.max_itens or (
+            self.max_bytes and self.bytes > self.max_bytes
+        ):
+            _, (_, _, _, tamanho) = self._itens.popitem(last=False)
+            self.bytes -= tamanho
+
+    def remover(self, chave: Hashable) -> None:
+        """Remove a chave do cache, caso exista."""
+        item = self._itens.pop(chave, None)
+        if item is not None:
+            self.bytes -= item[3]
+
+    def limpar(self) -> None:
+        """Remove todos os itens do cache."""
+        self._itens.clear()
+        self.bytes = 0
@@ -0,0 +1,99 @@
+"""
+Pool de carrinhos vazios da Samsung Shop para o bot.py.
+
+Classe `PoolCarrinhos`, que mantém em segundo plano carrinhos vazios (orderFormIds) já criados,
+para que a geração do link não precise esperar a criação do carrinho.
+"""
+
+import aiohttp
+import asyncio
+import logging
+import time
+from collections import deque
+from os import getenv
+from utils import criar_carrinho
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de carrinhos vazios mantidos no pool (0 desabilita o pool)
+TAMANHO_POOL_CARRINHOS = int(getenv("TAMANHO_POOL_CARRINHOS", 10))
+
+# Quantidade máxima de carrinhos criados por segundo para repor o pool (0 desabilita o pool)
+TAXA_REPOSICAO_CARRINHOS = float(getenv("TAXA_REPOSICAO_CARRINHOS", 2))
+
+# Idade máxima (em segundos) de um carrinho no pool, após a qual é descartado
+IDADE_MAXIMA_CARRINHO = float(getenv("IDADE_MAXIMA_CARRINHO", 1200))
+
+
+class PoolCarrinhos:
+    """
+    Pool de carrinhos vazios, reposto em segundo plano até `tamanho` carrinhos,
+    criando no máximo `taxa_reposicao` carrinhos por segundo. Tamanho ou taxa 0 desabilitam o pool.\n
+    Carrinhos mais antigos que `idade_maxima` segundos são descartados sem serem usados.
+    """
+
+    def __init__(
+        self,
+        sessao: aiohttp.ClientSession,
+        tamanho: int = TAMANHO_POOL_CARRINHOS,
+        taxa_reposicao: float = TAXA_REPOSICAO_CARRINHOS,
+        idade_maxima: float = IDADE_MAXIMA_CARRINHO,
+    ) -> None:
+        self.sessao = sessao
+        self.tamanho = tamanho
+        self.taxa_reposicao = taxa_reposicao
+        self.idade_maxima = idade_maxima
+        # Cada carrinho no formato `(order_form_id, criado_em)`, do mais antigo ao mais novo
+        self._carrinhos: deque[tuple[str, float]] = deque()
+        self._tarefa: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._carrinhos)
+
+    def iniciar(self) -> None:
+        """Inicia a reposição do pool em segundo plano, caso o pool esteja habilitado."""
+        if self.tamanho > 0 and self.taxa_reposicao > 0 and self._tarefa is None:
+            self._tarefa = asyncio.create_task(self._repor())
+
+    async def parar(self) -> None:
+        """Para a reposição do pool e descarta os carrinhos restantes."""
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        self._carrinhos.clear()
+
+    def retirar(self) -> str | None:
+        """Retira do pool o carrinho válido mais antigo, ou retorna `None` caso o pool esteja vazio."""
+        self._descartar_expirados()
+        if not self._carrinhos:
+            return None
+        order_form_id, _ = self._carrinhos.popleft()
+        return order_form_id
+
+    def _descartar_expirados(self) -> None:
+        """Descarta os carrinhos mais antigos que a idade máxima."""
+        limite = time.monotonic() - self.idade_maxima
+        while self._carrinhos and self._carrinhos[0][1] < limite:
+            self._carrinhos.popleft()
+
+    async def _repor(self) -> None:
+        """Cria carrinhos vazios até completar o pool, respeitando a taxa de reposição."""
+        intervalo = 1 / self.taxa_reposicao
+
+        while True:
+            self._descartar_expirados()
+
+            if len(self._carrinhos) < self.tamanho:
+                try:
+                    order_form_id = await criar_carrinho(self.sessao)
+                except Exception as e:
+                    logger.warning("Reposição do pool de carrinhos falhou: %s", e)
+                    order_form_id = None
+                if order_form_id:
+                    self._carrinhos.append((order_form_id, time.monotonic()))
+
+            await asyncio.sleep(intervalo)
@@ -0,0 +1,247 @@
+"""
+Catálogo pré-carregado dos modelos do dicionário `MODELOS` para o bot.py.
+
+Função `atualizar_catalogo`, tarefa agendada na `JobQueue` que atualiza as informações de todos os modelos de `MODELOS`.\n
+Função `carregar_catalogo`, que carrega o catálogo salvo em arquivo ao iniciar o bot.\n
+Função `salvar_catalogo`, que salva o catálogo em arquivo para que esteja disponível após reiniciar o bot.\n
+Função `descobrir_catalogo`, tarefa agendada na `JobQueue` que descobre os modelos das categorias da Samsung Shop
+e os adiciona a `MODELOS` e ao catálogo, com poucas requisições em lote.
+Função `recarregar_catalogo`, tarefa agendada na `JobQueue` que carrega o catálogo salvo em arquivo por outro processo.
+
+O catálogo é um dicionário `{url_normalizado: informacoes}`, com `informacoes` no formato retornado por `informacoes_modelo`.
+Apenas modelos cujas informações foram obtidas sem erro são armazenados no catálogo.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from modelos import MODELOS
+from os import getenv
+from teclados import atualizar_teclados_modelos
+from telegram.ext import ContextTypes
+from utils import (
+    agrupar_produtos,
+    detalhes_modelos,
+    indexar_produtos,
+    informacoes_modelo,
+    informacoes_produtos,
+    normalizar_url,
+    produtos_categoria,
+    produtos_por_id,
+)
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (em segundos) entre as atualizações do catálogo e variação aleatória máxima do intervalo
+INTERVALO_CATALOGO = float(getenv("INTERVALO_CATALOGO", 300))
+JITTER_CATALOGO = float(getenv("JITTER_CATALOGO", 30))
+
+# Arquivo onde o catálogo é salvo e idade máxima (em segundos) para que seja carregado ao iniciar o bot
+CAMINHO_CATALOGO = getenv("CAMINHO_CATALOGO", "catalogo.json")
+IDADE_MAXIMA_CATALOGO = float(getenv("IDADE_MAXIMA_CATALOGO", 3600))
+
+# Limite de modelos atualizados simultaneamente
+LIMITE_MODELOS_SIMULTANEOS = int(getenv("LIMITE_MODELOS_SIMULTANEOS", 2))
+
+# Caminhos das categorias da Samsung Shop (ex: `/1/2/`) cujos modelos são descobertos, separados por vírgula
+# Sem categorias, a descoberta é desabilitada e apenas os modelos de `MODELOS` fazem parte do catálogo
+CATEGORIAS_DESCOBERTA = [
+    categoria.strip()
+    for categoria in getenv("CATEGORIAS_DESCOBERTA", "").split(",")
+    if categoria.strip()
+]
+
+# Intervalo (em segundos) entre as descobertas de modelos
+INTERVALO_DESCOBERTA = float(getenv("INTERVALO_DESCOBERTA", 3600))
+
+
+def _ler_catalogo(caminho: str) -> tuple[dict, dict]:
+    """
+    Retorna o catálogo salvo no arquivo e os modelos de `MODELOS` quando foi salvo, no formato `(catalogo, nomes)`.
+    Retorna dicionários vazios caso o arquivo não exista, seja inválido ou seja mais antigo que a idade máxima.
+    """
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+        atualizado_em = float(dados["atualizado_em"])
+        catalogo = dict(dados["modelos"])
+        nomes = dict(dados.get("nomes", dict()))
+    except FileNotFoundError:
+        return dict(), dict()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(
+            "Catálogo salvo em %s não pôde ser carregado. Erro: %s", caminho, e
+        )
+        return dict(), dict()
+
+    if time.time() - atualizado_em > IDADE_MAXIMA_CATALOGO:
+        return dict(), dict()
+
+    return catalogo, nomes
+
+
+def carregar_catalogo(caminho: str = CAMINHO_CATALOGO) -> dict:
+    """
+    Retorna o catálogo salvo no arquivo.
+    Retorna um catálogo vazio caso o arquivo não exista, seja inválido ou seja mais antigo que a idade máxima.
+    """
+    return _ler_catalogo(caminho)[0]
+
+
+async def salvar_catalogo(catalogo: dict, caminho: str = CAMINHO_CATALOGO) -> None:
+    """Salva o catálogo e os modelos de `MODELOS` (incluindo os descobertos) no arquivo, substituindo o arquivo anterior de uma só vez."""
+    # O conteúdo é montado antes de a escrita ir para outra thread, já que `MODELOS` pode mudar durante a escrita
+    conteudo = json.dumps(
+        {"atualizado_em": time.time(), "modelos": catalogo, "nomes": MODELOS},
+        ensure_ascii=False,
+    )
+    await asyncio.to_thread(_escrever_catalogo, conteudo, caminho)
+
+
+def _escrever_catalogo(conteudo: str, caminho: str) -> None:
+    temporario = f"{caminho}.tmp"
+    try:
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        logger.warning("Catálogo não pôde ser salvo em %s. Erro: %s", caminho, e)
+
+
+async def atualizar_catalogo(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Atualiza as informações de todos os modelos de `MODELOS` e substitui o catálogo em `bot_data["catalogo"]`.
+    Os modelos descobertos (com os IDs dos produtos em `bot_data["ids_catalogo"]`) são atualizados em lote,
+    e os outros são atualizados um por um, através de `informacoes_modelo`.
+    O catálogo atualizado também é salvo em arquivo.
+    """
+    sessao = context.bot_data["sessao"]
+    ids_catalogo = context.bot_data.get("ids_catalogo", dict())
+    limite = asyncio.Semaphore(LIMITE_MODELOS_SIMULTANEOS)
+
+    async def atualizar_modelo(url: str) -> dict:
+        async with limite:
+            return await informacoes_modelo(sessao, url)
+
+    urls = list(dict.fromkeys(normalizar_url(url) for url in MODELOS.values()))
+    urls_lote = [url for url in urls if url in ids_catalogo]
+    urls_individuais = [url for url in urls if url not in ids_catalogo]
+
+    produtos, resultados = await asyncio.gather(
+        produtos_por_id(sessao, [id for url in urls_lote for id in ids_catalogo[url]]),
+        asyncio.gather(*(atualizar_modelo(url) for url in urls_individuais)),
+    )
+    grupos = agrupar_produtos(produtos)
+
+    catalogo = {
+        url: informacoes
+        for url, informacoes in zip(urls_individuais, resultados)
+        if "erro" not in informacoes
+    }
+    for url in urls_lote:
+        informacoes = informacoes_produtos(grupos.get(url, list()))
+        if informacoes:
+            catalogo[url] = informacoes
+
+    # O catálogo é substituído por inteiro, para que nunca seja lido parcialmente atualizado
+    context.bot_data["catalogo"] = catalogo
+    await salvar_catalogo(catalogo)
+
+
+async def descobrir_catalogo(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Descobre os modelos das categorias `CATEGORIAS_DESCOBERTA` da Samsung Shop, através das listagens do catalog_system,
+    que já possuem as capacidades, as cores e o estoque de cada produto.\n
+    Os modelos novos com estoque são adicionados a `MODELOS`, com o nome da searchapi (requisitada em lote pelos referenceIds),
+    e as informações de todos os modelos descobertos substituem as do catálogo.
+    Os IDs dos produtos de cada modelo são armazenados em `bot_data["ids_catalogo"]`, para que `atualizar_catalogo` os atualize em lote.
+    """
+    sessao = context.bot_data["sessao"]
+
+    resultados = await asyncio.gather(
+        *(produtos_categoria(sessao, categoria) for categoria in CATEGORIAS_DESCOBERTA),
+        return_exceptions=True,
+    )
+    produtos = list()
+    for categoria, resultado in zip(CATEGORIAS_DESCOBERTA, resultados):
+        if isinstance(resultado, Exception):
+            logger.warning(
+                "Produtos da categoria %s não foram descobertos. Erro: %s",
+                categoria,
+                resultado,
+            )
+            continue
+        produtos.extend(resultado)
+
+    grupos = agrupar_produtos(produtos)
+    if not grupos:
+        return
+
+    # Os IDs dos produtos descobertos evitam baixar o HTML das páginas em `informacoes_modelo`
+    await indexar_produtos(produtos)
+
+    context.bot_data["ids_catalogo"] = {
+        url: [produto["productId"] for produto in grupo if produto.get("productId")]
+        for url, grupo in grupos.items()
+    }
+    informacoes = {url: informacoes_produtos(grupo) for url, grupo in grupos.items()}
+
+    # Modelos novos com estoque, e um referenceId de cada um para pegar o nome na searchapi
+    urls_conhecidas = {normalizar_url(url) for url in MODELOS.values()}
+    novos = {
+        url: grupo
+        for url, grupo in grupos.items()
+        if url not in urls_conhecidas and informacoes[url]
+    }
+    refs = {
+        url: next(
+            (produto["productReference"] for produto in grupo if produto.get("productReference")),
+            None,
+        )
+        for url, grupo in novos.items()
+    }
+    detalhes = await detalhes_modelos(sessao, [ref for ref in refs.values() if ref])
+
+    for url, grupo in novos.items():
+        nome = (
+            detalhes.get(refs[url], dict()).get("fmyMarketingName")
+            or grupo[0].get("productName")
+            or url
+        )
+        # Modelos diferentes com o mesmo nome são diferenciados pelo URL
+        if nome in MODELOS:
+            nome = f"{nome} ({url.removesuffix('/p').rsplit('/', 1)[-1]})"
+        MODELOS[nome] = url
+
+    if novos:
+        atualizar_teclados_modelos()
+
+    catalogo = dict(context.bot_data["catalogo"])
+    for url, dispositivo in informacoes.items():
+        if dispositivo:
+            catalogo[url] = dispositivo
+        else:
+            catalogo.pop(url, None)
+
+    context.bot_data["catalogo"] = catalogo
+    await salvar_catalogo(catalogo)
+
+
+async def recarregar_catalogo(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Substitui o catálogo em `bot_data["catalogo"]` pelo salvo em arquivo por outro processo,
+    e adiciona a `MODELOS` os modelos descobertos por ele.
+
+    Usada pelos trabalhadores do modo escalável (ver `escala`), em que apenas o primeiro trabalhador atualiza e descobre o catálogo.
+    """
+    catalogo, nomes = await asyncio.to_thread(_ler_catalogo, CAMINHO_CATALOGO)
+
+    novos = {nome: url for nome, url in nomes.items() if nome not in MODELOS}
+    if novos:
+        MODELOS.update(novos)
+        atualizar_teclados_modelos()
+
+    if catalogo:
+        context.bot_data["catalogo"] = catalogo
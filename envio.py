@@ -0,0 +1,170 @@
+"""
+Envio das requisições do bot.py à Bot API do Telegram.
+
+Classe `LimitadorTelegram`, limitador de taxa da `Application` (`rate_limiter`), que respeita os limites do Telegram
+por chat, por grupo e global no envio e na edição de mensagens, e espera o tempo informado quando o Telegram recusa uma requisição por flood control (`RetryAfter`).
+"""
+
+import asyncio
+import logging
+import time
+from limitador import LimitadorTaxa
+from metricas import RETRY_AFTER_TELEGRAM
+from os import getenv
+from registro import registrar_span
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from typing import Any, Callable, Coroutine
+
+logger = logging.getLogger(__name__)
+
+# URL base da Bot API, seguido do token do bot (vazio usa a Bot API do Telegram)
+# Permite executar o bot contra um servidor local da Bot API ou uma Bot API falsa
+URL_API_TELEGRAM = getenv("URL_API_TELEGRAM", "")
+
+# Limites de requisições (por segundo) e rajadas à Bot API: global, por chat privado e por grupo
+# O Telegram permite cerca de 30 mensagens por segundo no total, 1 por segundo em cada chat e 20 por minuto em cada grupo
+TAXA_TELEGRAM = float(getenv("TAXA_TELEGRAM", 30))
+TAXA_TELEGRAM_CHAT = float(getenv("TAXA_TELEGRAM_CHAT", 1))
+RAJADA_TELEGRAM_CHAT = float(getenv("RAJADA_TELEGRAM_CHAT", 5))
+TAXA_TELEGRAM_GRUPO = float(getenv("TAXA_TELEGRAM_GRUPO", 20 / 60))
+RAJADA_TELEGRAM_GRUPO = float(getenv("RAJADA_TELEGRAM_GRUPO", 20))
+
+# Quantidade máxima de repetições de uma requisição recusada por flood control
+TENTATIVAS_TELEGRAM = int(getenv("TENTATIVAS_TELEGRAM", 3))
+
+# Quantidade de limitadores de chats a partir da qual os limitadores ociosos são descartados
+MAX_LIMITADORES_CHATS = 512
+
+# Prefixos dos métodos da Bot API que enviam ou editam mensagens, os únicos sujeitos aos limites por chat, por grupo e global
+# Outros métodos com `chat_id` (ex: `getChatMember` na verificação de acesso, `deleteMessage`) não passam pelos limitadores
+PREFIXOS_MENSAGENS = ("send", "edit", "copy", "forward")
+
+
+class LimitadorTelegram(BaseRateLimiter[int]):
+    """
+    Limitador de taxa das requisições à Bot API, aplicado às requisições que enviam ou editam mensagens em um chat (`PREFIXOS_MENSAGENS`).\n
+    Cada chat possui um balde de tokens próprio, com os limites de chat privado ou de grupo,
+    e todas as requisições passam por um balde global, com fila justa entre os chats.
+    Quando o Telegram responde com `RetryAfter`, as requisições do chat esperam o tempo informado
+    (ou todas as requisições, caso o limite global esteja sendo atingido ou a requisição não seja de um chat),
+    e a requisição é repetida até `TENTATIVAS_TELEGRAM` vezes (ou `rate_limit_args` vezes, caso informado).\n
+    Cada requisição, incluindo as esperas, é adicionada como um span ao rastro da etapa atual do bot, caso exista (ver `registro`).
+    """
+
+    def __init__(self) -> None:
+        self._global = LimitadorTaxa(TAXA_TELEGRAM, TAXA_TELEGRAM, "telegram")
+        self._chats: dict[int | str, LimitadorTaxa] = dict()
+        # Fim (`loop.time()`) da pausa de cada chat após um `RetryAfter`, com a chave `None` para a pausa global
+        self._pausas: dict[int | str | None, float] = dict()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _limitador_chat(self, chat_id: int | str) -> LimitadorTaxa:
+        """Retorna o limitador do chat, criado com os limites de grupo (ID negativo ou @username) ou de chat privado."""
+        if len(self._chats) > MAX_LIMITADORES_CHATS:
+            for chave, limitador in list(self._chats.items()):
+                if chave != chat_id and limitador.ocioso():
+                    del self._chats[chave]
+
+        limitador = self._chats.get(chat_id)
+        if limitador is None:
+            if isinstance(chat_id, str) or chat_id < 0:
+                limitador = LimitadorTaxa(
+                    TAXA_TELEGRAM_GRUPO, RAJADA_TELEGRAM_GRUPO, "telegram_grupo"
+                )
+            else:
+                limitador = LimitadorTaxa(
+                    TAXA_TELEGRAM_CHAT, RAJADA_TELEGRAM_CHAT, "telegram_chat"
+                )
+            self._chats[chat_id] = limitador
+        return limitador
+
+    async def _esperar_pausa(self, chat_id: int | str | None) -> None:
+        """Espera as pausas global e do chat, caso um `RetryAfter` esteja em andamento, inclusive as estendidas durante a espera."""
+        loop = asyncio.get_running_loop()
+        while True:
+            fim = max(self._pausas.get(None, 0.0), self._pausas.get(chat_id, 0.0))
+            restante = fim - loop.time()
+            if restante <= 0:
+                return
+            await asyncio.sleep(restante)
+
+    def _pausar(self, chat_id: int | str | None, segundos: float) -> None:
+        """Pausa as requisições do chat (ou todas, com `chat_id` `None`), estendendo a pausa em andamento, e descarta as pausas encerradas."""
+        agora = asyncio.get_running_loop().time()
+        for chave, fim in list(self._pausas.items()):
+            if fim <= agora:
+                del self._pausas[chave]
+        self._pausas[chat_id] = max(self._pausas.get(chat_id, 0.0), agora + segundos)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict | list[dict]:
+        inicio = time.perf_counter()
+        status = "erro"
+        try:
+            resposta = await self._enviar(
+                callback, args, kwargs, endpoint, data, rate_limit_args
+            )
+            status = "ok"
+            return resposta
+        except asyncio.CancelledError:
+            status = "cancelada"
+            raise
+        finally:
+            registrar_span("telegram", "POST", endpoint, inicio, status)
+
+    async def _enviar(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: int | None,
+    ) -> bool | dict | list[dict]:
+        """Faz a requisição após esperar os limitadores, e a repete caso o Telegram responda com `RetryAfter`."""
+        tentativas = rate_limit_args or TENTATIVAS_TELEGRAM
+
+        chat_id = data.get("chat_id") if endpoint.startswith(PREFIXOS_MENSAGENS) else None
+        # IDs numéricos podem ser informados como string
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+
+        for numero in range(tentativas + 1):
+            if chat_id is not None:
+                await self._limitador_chat(chat_id).adquirir()
+                await self._global.adquirir(chat_id)
+
+            # Caso um `RetryAfter` esteja em andamento, espera antes de fazer a requisição
+            await self._esperar_pausa(chat_id)
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                RETRY_AFTER_TELEGRAM.incrementar(endpoint)
+                if numero == tentativas:
+                    raise
+
+                logger.info(
+                    "Flood control do Telegram em %s, repetindo após %s segundos",
+                    endpoint,
+                    e.retry_after,
+                )
+                # O `RetryAfter` é atribuído ao limite global caso a requisição não seja de um chat,
+                # ou caso haja requisições esperando o balde global (o limite global está sendo atingido)
+                global_ = chat_id is None or self._global.esperando > 0
+                self._pausar(None if global_ else chat_id, e.retry_after + 0.1)
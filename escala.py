@@ -0,0 +1,283 @@
+"""
+Modo escalável do bot.py, com um processo de entrada (frente) e `TRABALHADORES` processos trabalhadores na mesma máquina.
+
+A frente recebe os updates do Telegram (por polling ou webhook) e os encaminha aos trabalhadores,
+sempre ao mesmo trabalhador para cada usuário (pelo ID do usuário), para que o estado do `ConversationHandler`
+e o `user_data` de cada usuário fiquem em um único processo.
+Cada trabalhador é o próprio bot.py, executado através do webhook local (ver `webhook`) na porta `PORTA_TRABALHADORES + índice`,
+sem configurar o webhook no Telegram, e recebe os updates da frente com um token secreto gerado a cada execução.\n
+Os trabalhadores são supervisionados pela frente, e reiniciados sempre que terminam.
+Ao encerrar a frente, os updates pendentes são entregues e os trabalhadores são encerrados com `SIGTERM`.
+Os limites de taxa globais (Samsung Shop e Telegram) são divididos entre os trabalhadores.\n
+Função `criar_application_frente`, que cria a `application` da frente.\n
+Função `verificar_frente`, tarefa agendada na `JobQueue` dos trabalhadores que os encerra caso a frente tenha terminado.
+"""
+
+import aiohttp
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+from avisos import CAMINHO_AVISOS
+from envio import TAXA_TELEGRAM, URL_API_TELEGRAM
+from limitador import RAJADA_REQUISICOES, TAXA_REQUISICOES
+from metricas import (
+    FILA_TRABALHADOR,
+    METRICAS_PORTA,
+    REINICIOS_TRABALHADORES,
+    UPDATES_ENCAMINHADOS,
+    iniciar_servidor_metricas,
+)
+from os import getenv
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de processos trabalhadores (0 executa o bot em um único processo)
+TRABALHADORES = int(getenv("TRABALHADORES", 0))
+
+# Índice do trabalhador, definido pela frente no ambiente de cada trabalhador (`None` na frente e no modo de processo único)
+TRABALHADOR = int(getenv("TRABALHADOR")) if getenv("TRABALHADOR") else None
+
+# Porta do webhook local do primeiro trabalhador (os outros usam as portas seguintes)
+PORTA_TRABALHADORES = int(getenv("PORTA_TRABALHADORES", 8100))
+
+# Prefixo dos arquivos onde cada trabalhador salva as conversas em andamento, para mantê-las ao reiniciar (vazio desabilita)
+ESTADO_TRABALHADORES = getenv("ESTADO_TRABALHADORES", "estado_trabalhador")
+
+# Espera (em segundos) antes de reiniciar um trabalhador, dobrada a cada reinício seguido, até a espera máxima
+ESPERA_REINICIO = float(getenv("ESPERA_REINICIO", 1))
+MAX_ESPERA_REINICIO = 30
+
+# Tempo (em segundos) para entregar os updates pendentes e para cada trabalhador terminar ao encerrar a frente
+TEMPO_ENCERRAMENTO = float(getenv("TEMPO_ENCERRAMENTO", 10))
+
+# Quantidade máxima de updates esperando para serem encaminhados a cada trabalhador
+MAX_UPDATES_PENDENTES = int(getenv("MAX_UPDATES_PENDENTES", 1000))
+
+# Arquivo executado por cada trabalhador
+CAMINHO_BOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def indice_trabalhador(update: Update, trabalhadores: int) -> int:
+    """
+    Retorna o índice do trabalhador responsável pelo update, pelo ID do usuário.\n
+    As mudanças de membros do grupo vão ao trabalhador do membro, que mantém o cache de membros do usuário,
+    e os updates sem usuário vão ao primeiro trabalhador.
+    """
+    if update.chat_member:
+        usuario_id = update.chat_member.new_chat_member.user.id
+    elif update.effective_user:
+        usuario_id = update.effective_user.id
+    else:
+        return 0
+    return usuario_id % trabalhadores
+
+
+def ambiente_trabalhador(indice: int, trabalhadores: int, segredo: str) -> dict[str, str]:
+    """Retorna as variáveis de ambiente do trabalhador `indice`, a partir das variáveis de ambiente da frente."""
+    ambiente = dict(os.environ)
+    nome_avisos, extensao_avisos = os.path.splitext(CAMINHO_AVISOS)
+    ambiente.update(
+        MODO="webhook",
+        URL="",
+        HOST="127.0.0.1",
+        PORT=str(PORTA_TRABALHADORES + indice),
+        SECRET_TOKEN=segredo,
+        TRABALHADOR=str(indice),
+        FRENTE_PID=str(os.getpid()),
+        # Cada trabalhador expõe suas métricas em uma porta própria, após a porta da frente
+        METRICAS_PORTA=str(METRICAS_PORTA + 1 + indice if METRICAS_PORTA else 0),
+        # Os limites globais são divididos entre os trabalhadores; os limites por chat se mantêm, pois cada chat privado fica em um trabalhador
+        TAXA_REQUISICOES=str(TAXA_REQUISICOES / trabalhadores),
+        RAJADA_REQUISICOES=str(max(1.0, RAJADA_REQUISICOES / trabalhadores)),
+        TAXA_TELEGRAM=str(TAXA_TELEGRAM / trabalhadores),
+        CAMINHO_ESTADO=(
+            f"{ESTADO_TRABALHADORES}_{indice}.pickle" if ESTADO_TRABALHADORES else ""
+        ),
+        # Cada trabalhador verifica e salva apenas as assinaturas de avisos de estoque dos seus usuários
+        CAMINHO_AVISOS=f"{nome_avisos}_{indice}{extensao_avisos}" if CAMINHO_AVISOS else "",
+    )
+    return ambiente
+
+
+class Trabalhador:
+    """
+    Processo trabalhador `indice`, reiniciado sempre que termina, e a fila dos updates encaminhados a ele.\n
+    Os updates são encaminhados um de cada vez, na ordem em que chegaram, e repetidos até serem entregues,
+    inclusive enquanto o trabalhador reinicia.
+    """
+
+    def __init__(self, indice: int, trabalhadores: int, segredo: str) -> None:
+        self.indice = indice
+        self.segredo = segredo
+        self.url = f"http://127.0.0.1:{PORTA_TRABALHADORES + indice}/telegram"
+        self.ambiente = ambiente_trabalhador(indice, trabalhadores, segredo)
+        self.fila: asyncio.Queue[dict] = asyncio.Queue(MAX_UPDATES_PENDENTES)
+        self.processo: asyncio.subprocess.Process | None = None
+        self._encerrando = False
+        self._supervisor: asyncio.Task | None = None
+        self._encaminhador: asyncio.Task | None = None
+
+    def iniciar(self, sessao: aiohttp.ClientSession) -> None:
+        """Inicia o processo do trabalhador e o encaminhamento dos updates da fila."""
+        self._supervisor = asyncio.create_task(self._supervisionar())
+        self._encaminhador = asyncio.create_task(self._encaminhar(sessao))
+
+    def enfileirar(self, dados: dict) -> None:
+        """Coloca o update na fila do trabalhador. Caso a fila esteja cheia (trabalhador fora do ar), o update é descartado."""
+        try:
+            self.fila.put_nowait(dados)
+        except asyncio.QueueFull:
+            logger.warning("Fila do trabalhador %s cheia, update descartado", self.indice)
+            UPDATES_ENCAMINHADOS.incrementar(self.indice, "descartado")
+            return
+        FILA_TRABALHADOR.incrementar(self.indice)
+
+    async def _supervisionar(self) -> None:
+        """Executa o processo do trabalhador, e o reinicia sempre que termina, até a frente ser encerrada."""
+        loop = asyncio.get_running_loop()
+        espera = ESPERA_REINICIO
+        while True:
+            inicio = loop.time()
+            # O trabalhador é iniciado em outra sessão, para que o `Ctrl + C` no terminal seja tratado apenas pela frente
+            self.processo = await asyncio.create_subprocess_exec(
+                sys.executable, CAMINHO_BOT, env=self.ambiente, start_new_session=True
+            )
+            codigo = await self.processo.wait()
+            if self._encerrando:
+                return
+
+            REINICIOS_TRABALHADORES.incrementar(self.indice)
+            # Um trabalhador que funcionou por um tempo é reiniciado com a espera inicial,
+            # e um que termina logo após iniciar, com espera crescente
+            if loop.time() - inicio > MAX_ESPERA_REINICIO:
+                espera = ESPERA_REINICIO
+            logger.warning(
+                "Trabalhador %s terminou com código %s, reiniciando em %s segundos",
+                self.indice,
+                codigo,
+                espera,
+            )
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, MAX_ESPERA_REINICIO)
+
+    async def _encaminhar(self, sessao: aiohttp.ClientSession) -> None:
+        """Encaminha os updates da fila ao webhook local do trabalhador, repetindo cada um até ser entregue."""
+        while True:
+            dados = await self.fila.get()
+            espera = 0.1
+            try:
+                while True:
+                    try:
+                        async with sessao.post(
+                            self.url,
+                            json=dados,
+                            headers={"X-Telegram-Bot-Api-Secret-Token": self.segredo},
+                        ) as resposta:
+                            status = resposta.status
+                    except aiohttp.ClientError:
+                        # Trabalhador iniciando ou reiniciando
+                        status = None
+
+                    if status == 200:
+                        UPDATES_ENCAMINHADOS.incrementar(self.indice, "encaminhado")
+                        break
+                    if status is not None and 400 <= status < 500:
+                        # Update inválido, que não seria aceito em uma nova tentativa
+                        logger.warning(
+                            "Update recusado pelo trabalhador %s com status %s", self.indice, status
+                        )
+                        UPDATES_ENCAMINHADOS.incrementar(self.indice, "recusado")
+                        break
+
+                    await asyncio.sleep(espera)
+                    espera = min(espera * 2, 2)
+            finally:
+                FILA_TRABALHADOR.decrementar(self.indice)
+                self.fila.task_done()
+
+    async def parar(self) -> None:
+        """Entrega os updates pendentes, encerra o processo do trabalhador e espera ele terminar."""
+        try:
+            await asyncio.wait_for(self.fila.join(), TEMPO_ENCERRAMENTO)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "%s updates pendentes do trabalhador %s não foram entregues",
+                self.fila.qsize(),
+                self.indice,
+            )
+
+        self._encerrando = True
+        self._encaminhador.cancel()
+        if self.processo is not None and self.processo.returncode is None:
+            self.processo.terminate()
+            try:
+                await asyncio.wait_for(self.processo.wait(), TEMPO_ENCERRAMENTO)
+            except asyncio.TimeoutError:
+                logger.warning("Trabalhador %s não terminou, forçando o encerramento", self.indice)
+                self.processo.kill()
+                await self.processo.wait()
+        # O supervisor pode estar esperando para reiniciar o trabalhador
+        self._supervisor.cancel()
+        await asyncio.gather(self._encaminhador, self._supervisor, return_exceptions=True)
+
+
+async def encaminhar_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Coloca o update na fila do trabalhador responsável pelo usuário."""
+    trabalhadores = context.bot_data["trabalhadores"]
+    trabalhadores[indice_trabalhador(update, len(trabalhadores))].enfileirar(
+        update.to_dict()
+    )
+
+
+async def iniciar_frente(application: Application) -> None:
+    """Inicia os trabalhadores, a sessão HTTP usada para encaminhar os updates e o servidor de métricas da frente."""
+    segredo = secrets.token_urlsafe(32)
+    application.bot_data["sessao_trabalhadores"] = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=10)
+    )
+    application.bot_data["servidor_metricas"] = await iniciar_servidor_metricas()
+    application.bot_data["trabalhadores"] = [
+        Trabalhador(indice, TRABALHADORES, segredo) for indice in range(TRABALHADORES)
+    ]
+    for trabalhador in application.bot_data["trabalhadores"]:
+        trabalhador.iniciar(application.bot_data["sessao_trabalhadores"])
+
+
+async def parar_frente(application: Application) -> None:
+    """Encerra os trabalhadores, a sessão HTTP e o servidor de métricas da frente."""
+    await asyncio.gather(
+        *(trabalhador.parar() for trabalhador in application.bot_data["trabalhadores"])
+    )
+    await application.bot_data["sessao_trabalhadores"].close()
+    if application.bot_data["servidor_metricas"]:
+        await application.bot_data["servidor_metricas"].cleanup()
+
+
+def criar_application_frente(token: str) -> Application:
+    """
+    Cria a `application` da frente, que apenas encaminha cada update recebido ao trabalhador do usuário.
+    A `application` é executada como a do bot, por polling ou webhook.
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(iniciar_frente)
+        .post_shutdown(parar_frente)
+    )
+    if URL_API_TELEGRAM:
+        builder.base_url(URL_API_TELEGRAM)
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, encaminhar_update))
+    return application
+
+
+async def verificar_frente(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Encerra o trabalhador com `SIGTERM` caso a frente que o iniciou tenha terminado sem encerrá-lo."""
+    if os.getppid() != int(getenv("FRENTE_PID", os.getppid())):
+        logger.warning("Frente encerrada, encerrando o trabalhador %s", TRABALHADOR)
+        os.kill(os.getpid(), signal.SIGTERM)
@@ -0,0 +1,141 @@
+"""
+Índice persistente dos IDs dos produtos da Samsung Shop para o utils.py.
+
+Classe `IndiceProdutos`, que armazena em SQLite o ID (productId) e o referenceId de cada página de produto,
+indexados pelo slug do URL (ex: `galaxy-s24-256gb`), para que as informações dos modelos sejam consultadas
+diretamente nas URLs APIs, sem baixar o HTML das páginas. Os IDs quase nunca mudam,
+e são verificados novamente apenas quando uma URL API informa que um ID do índice é inválido.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from os import getenv
+
+logger = logging.getLogger(__name__)
+
+# Arquivo do índice (vazio mantém o índice apenas em memória)
+CAMINHO_INDICE = getenv("CAMINHO_INDICE", "indice_produtos.sqlite3")
+
+INSERIR_PRODUTO = "INSERT OR REPLACE INTO produtos (slug, id, ref, atualizado_em) VALUES (?, ?, ?, ?)"
+
+
+class IndiceProdutos:
+    """
+    Índice `{slug: (id, ref)}` dos produtos, mantido em memória e persistido no arquivo SQLite `caminho`.\n
+    O arquivo é aberto e carregado na primeira consulta. Caso não possa ser aberto, o índice é mantido apenas em memória.\n
+    Os produtos armazenados em lote (`definir_varios`) são escritos em outra thread, em uma única transação.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_INDICE) -> None:
+        self.caminho = caminho
+        self._conexao: sqlite3.Connection | None = None
+        # A conexão é usada pelo event loop e pela thread da escrita em lote, um de cada vez
+        self._trava = threading.Lock()
+        self._aberto = False
+        self._produtos: dict[str, tuple[str, str | None]] = dict()
+
+    def _abrir(self) -> None:
+        """Abre o arquivo do índice, criando a tabela caso não exista, e carrega os produtos em memória."""
+        self._aberto = True
+        if not self.caminho:
+            return
+
+        try:
+            conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+            # O journal WAL evita sincronizar o arquivo com o disco a cada produto armazenado
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS produtos "
+                "(slug TEXT PRIMARY KEY, id TEXT NOT NULL, ref TEXT, atualizado_em REAL NOT NULL)"
+            )
+            self._produtos = {
+                slug: (id, ref)
+                for slug, id, ref in conexao.execute("SELECT slug, id, ref FROM produtos")
+            }
+        except sqlite3.Error as e:
+            logger.warning(
+                "Índice de produtos em %s não pôde ser aberto. Erro: %s",
+                self.caminho,
+                e,
+            )
+            return
+
+        self._conexao = conexao
+
+    def _executar(self, comando: str, parametros: list[tuple]) -> None:
+        """
+        Executa um comando no arquivo do índice, caso esteja aberto, uma vez para cada parâmetro, em uma única transação.
+        Erros são informados e ignorados.
+        """
+        if self._conexao is None:
+            return
+        try:
+            with self._trava, self._conexao:
+                self._conexao.executemany(comando, parametros)
+        except sqlite3.Error as e:
+            logger.warning(
+                "Índice de produtos em %s não pôde ser atualizado. Erro: %s",
+                self.caminho,
+                e,
+            )
+
+    def obter(self, slug: str) -> tuple[str, str | None] | None:
+        """Retorna o ID e o referenceId do produto, no formato `(id, ref)`, ou `None` caso não esteja no índice."""
+        if not self._aberto:
+            self._abrir()
+        return self._produtos.get(slug)
+
+    def _atualizar(self, slug: str, id: str, ref: str | None) -> tuple | None:
+        """
+        Atualiza o produto em memória e retorna a linha a ser escrita no arquivo, ou `None` caso o produto não tenha mudado.
+        Um referenceId já conhecido é mantido caso `ref` não seja informado.
+        """
+        anterior = self._produtos.get(slug)
+        if ref is None and anterior is not None and anterior[0] == id:
+            ref = anterior[1]
+        if anterior == (id, ref):
+            return None
+
+        self._produtos[slug] = (id, ref)
+        return slug, id, ref, time.time()
+
+    def definir(self, slug: str, id: str, ref: str | None = None) -> None:
+        """Armazena o ID e o referenceId do produto. Um referenceId já conhecido é mantido caso `ref` não seja informado."""
+        if not self._aberto:
+            self._abrir()
+
+        linha = self._atualizar(slug, id, ref)
+        if linha is not None:
+            self._executar(INSERIR_PRODUTO, [linha])
+
+    async def definir_varios(self, produtos: list[tuple[str, str, str | None]]) -> None:
+        """
+        Armazena o ID e o referenceId de vários produtos, no formato `[(slug, id, ref)]`, como em `definir`.
+        O índice em memória é atualizado imediatamente, e o arquivo em outra thread, em uma única transação.
+        """
+        if not self._aberto:
+            self._abrir()
+
+        linhas = [
+            linha
+            for slug, id, ref in produtos
+            if (linha := self._atualizar(slug, id, ref)) is not None
+        ]
+        if linhas:
+            await asyncio.to_thread(self._executar, INSERIR_PRODUTO, linhas)
+
+    def remover(self, slug: str) -> None:
+        """Remove o produto do índice, para que seus IDs sejam procurados novamente no HTML da página."""
+        if not self._aberto:
+            self._abrir()
+        if self._produtos.pop(slug, None) is not None:
+            self._executar("DELETE FROM produtos WHERE slug = ?", [(slug,)])
+
+    def __len__(self) -> int:
+        if not self._aberto:
+            self._abrir()
+        return len(self._produtos)
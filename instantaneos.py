@@ -0,0 +1,68 @@
+"""
+Instantâneos das informações dos modelos compartilhados pelas conversas do bot.py.
+
+Classe `Instantaneos`, que armazena as informações dos modelos (resultado de `informacoes_modelo`) imutáveis e deduplicadas,
+identificadas por uma versão calculada a partir do conteúdo. Cada conversa guarda apenas a referência `(url, versao)`,
+em vez de uma cópia das informações, e todas as conversas do mesmo modelo compartilham o mesmo instantâneo.
+"""
+
+import hashlib
+import json
+import sys
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping
+
+
+def congelar(valor: Any) -> Any:
+    """
+    Retorna uma cópia imutável do valor: dicionários como `MappingProxyType`, listas como tuplas,
+    e textos internados (`sys.intern`), para que nomes de cores e capacidades repetidos entre os modelos sejam compartilhados.
+    """
+    if isinstance(valor, dict):
+        return MappingProxyType(
+            {congelar(chave): congelar(item) for chave, item in valor.items()}
+        )
+    if isinstance(valor, (list, tuple)):
+        return tuple(congelar(item) for item in valor)
+    if isinstance(valor, str):
+        return sys.intern(valor)
+    return valor
+
+
+def versao_dispositivo(dispositivo: dict) -> str:
+    """Retorna a versão das informações de um modelo, calculada a partir do conteúdo (incluindo a ordem das capacidades)."""
+    conteudo = json.dumps(dispositivo, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(conteudo.encode(), digest_size=8).hexdigest()
+
+
+class Instantaneos:
+    """
+    Registro `{versao: instantaneo}` das informações dos modelos usadas pelas conversas.\n
+    Informações com o mesmo conteúdo possuem a mesma versão e são armazenadas uma única vez.
+    Os instantâneos que não são mais referenciados por nenhuma conversa são descartados por `coletar`.
+    """
+
+    def __init__(self) -> None:
+        self._instantaneos: dict[str, Mapping] = dict()
+
+    def __len__(self) -> int:
+        return len(self._instantaneos)
+
+    def registrar(self, dispositivo: dict) -> str:
+        """Armazena as informações do modelo, caso ainda não estejam no registro, e retorna a sua versão."""
+        versao = sys.intern(versao_dispositivo(dispositivo))
+        if versao not in self._instantaneos:
+            self._instantaneos[versao] = congelar(dispositivo)
+        return versao
+
+    def obter(self, versao: str) -> Mapping | None:
+        """Retorna o instantâneo da versão, ou `None` caso não esteja no registro (ex: após reiniciar o bot)."""
+        return self._instantaneos.get(versao)
+
+    def coletar(self, versoes_em_uso: Iterable[str]) -> int:
+        """Descarta os instantâneos cujas versões não estão em uso, e retorna a quantidade descartada."""
+        em_uso = set(versoes_em_uso)
+        descartadas = [versao for versao in self._instantaneos if versao not in em_uso]
+        for versao in descartadas:
+            del self._instantaneos[versao]
+        return len(descartadas)
@@ -0,0 +1,139 @@
+"""
+Limitador de taxa das requisições do utils.py à Samsung Shop (e do envio de mensagens do bot ao Telegram, ver `envio`).
+
+Classe `LimitadorTaxa`, balde de tokens (token bucket) global com fila justa ponderada (weighted fair queuing)
+entre os usuários do Telegram, para que um usuário gerando muitos links não impeça os outros de serem atendidos.\n
+Variável de contexto `usuario_atual` (definida em `registro`), o ID do usuário do Telegram a quem as requisições são atribuídas,
+definido por `medir_etapa` para cada função callback do bot.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from metricas import ESPERA_LIMITADOR, FILA_LIMITADOR
+from os import getenv
+from registro import usuario_atual
+
+# Requisições por segundo à Samsung Shop (0 desabilita o limitador) e rajada máxima de requisições
+TAXA_REQUISICOES = float(getenv("TAXA_REQUISICOES", 10))
+RAJADA_REQUISICOES = float(getenv("RAJADA_REQUISICOES", 20))
+
+# Peso das requisições sem usuário (catálogo e pool de carrinhos) em relação ao peso 1 de cada usuário
+PESO_SEGUNDO_PLANO = float(getenv("PESO_SEGUNDO_PLANO", 0.5))
+
+
+class LimitadorTaxa:
+    """
+    Balde de tokens com `rajada` tokens, repostos a `taxa` tokens por segundo. Cada requisição consome um token.\n
+    Enquanto não há tokens, as requisições esperam em uma fila justa ponderada: cada usuário recebe uma marca de término virtual
+    (`max(tempo virtual, última marca do usuário) + 1 / peso`), e os tokens são liberados na ordem das marcas.
+    Assim, as requisições de usuários diferentes são intercaladas, independentemente de quantas cada um fez.\n
+    As métricas da fila e da espera são registradas com o `nome` do limitador.
+    """
+
+    def __init__(
+        self,
+        taxa: float = TAXA_REQUISICOES,
+        rajada: float = RAJADA_REQUISICOES,
+        nome: str = "samsung",
+    ) -> None:
+        self.taxa = taxa
+        self.nome = nome
+        self.rajada = max(1.0, rajada)
+        self.tokens = self.rajada
+        self.atualizado = time.monotonic()
+        # Fila de `(marca, ordem, futuro)` das requisições esperando um token
+        self._fila: list[tuple[float, int, asyncio.Future]] = list()
+        self._ordem = itertools.count()
+        self._tempo_virtual = 0.0
+        self._ultimas_marcas: dict[int | None, float] = dict()
+        self._temporizador: asyncio.TimerHandle | None = None
+        self.esperando = 0
+
+    def _repor(self) -> None:
+        """Repõe os tokens pelo tempo passado desde a última reposição, até a rajada máxima."""
+        agora = time.monotonic()
+        self.tokens = min(self.rajada, self.tokens + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    async def adquirir(self, usuario: int | None = None, peso: float = 1) -> None:
+        """Espera a vez do `usuario` na fila e consome um token."""
+        if not self.taxa:
+            return
+
+        self._repor()
+        if not self.esperando and self.tokens >= 1:
+            self.tokens -= 1
+            ESPERA_LIMITADOR.observar(0, self.nome)
+            return
+
+        marca = (
+            max(self._tempo_virtual, self._ultimas_marcas.get(usuario, 0)) + 1 / peso
+        )
+        self._ultimas_marcas[usuario] = marca
+        futuro = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._fila, (marca, next(self._ordem), futuro))
+        self.esperando += 1
+        FILA_LIMITADOR.incrementar(self.nome)
+        self._agendar()
+
+        inicio = time.perf_counter()
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            # Caso o token já tenha sido liberado para a requisição cancelada, ele é devolvido
+            if futuro.done() and not futuro.cancelled():
+                self.tokens = min(self.rajada, self.tokens + 1)
+                self._agendar()
+            else:
+                self._desistir()
+            raise
+        ESPERA_LIMITADOR.observar(time.perf_counter() - inicio, self.nome)
+
+    def ocioso(self) -> bool:
+        """Retorna se não há requisições esperando e o balde está cheio, ou seja, se o limitador pode ser descartado."""
+        self._repor()
+        return not self.esperando and self.tokens >= self.rajada
+
+    def _desistir(self) -> None:
+        """Retira da contagem uma requisição que saiu da fila sem receber um token."""
+        self.esperando -= 1
+        FILA_LIMITADOR.decrementar(self.nome)
+        if not self.esperando:
+            self._esvaziar()
+
+    def _esvaziar(self) -> None:
+        """Descarta as marcas dos usuários quando a fila fica vazia, para que não cresçam indefinidamente."""
+        self._fila.clear()
+        self._ultimas_marcas.clear()
+        self._tempo_virtual = 0.0
+
+    def _agendar(self) -> None:
+        """Agenda a liberação de tokens para quando o próximo token estiver disponível."""
+        if self._temporizador is not None or not self.esperando:
+            return
+        espera = max(0.0, (1 - self.tokens) / self.taxa)
+        self._temporizador = asyncio.get_running_loop().call_later(
+            espera, self._liberar
+        )
+
+    def _liberar(self) -> None:
+        """Libera os tokens disponíveis para as requisições da fila, na ordem das marcas."""
+        self._temporizador = None
+        self._repor()
+        while self._fila and self.tokens >= 1:
+            marca, _, futuro = heapq.heappop(self._fila)
+            if futuro.done():
+                # Requisição cancelada enquanto esperava
+                continue
+            self.tokens -= 1
+            self._tempo_virtual = marca
+            futuro.set_result(None)
+            self.esperando -= 1
+            FILA_LIMITADOR.decrementar(self.nome)
+
+        if self.esperando:
+            self._agendar()
+        else:
+            self._esvaziar()
@@ -0,0 +1,318 @@
+"""
+Métricas do bot.py e do utils.py, expostas no formato de texto do Prometheus.
+
+Classes `Contador`, `Medidor` e `Histograma`, métricas com labels registradas globalmente.\n
+Métricas das requisições à Samsung Shop (latência, total por endpoint e status, requisições em andamento,
+repetições e circuitos abertos), dos limitadores de taxa (fila, espera e RetryAfter do Telegram),
+da distribuição dos updates entre os trabalhadores do modo escalável (encaminhados, fila e reinícios),
+dos avisos de estoque (verificações e assinaturas) e das etapas do `ConversationHandler` (latência e total por resultado).\n
+Decorator `medir_etapa`, que mede e rastreia (ver `registro`) uma função callback do bot.\n
+Função `monitorar_event_loop`, que mede continuamente o atraso do event loop.\n
+Função `iniciar_servidor_metricas`, que serve as métricas na rota `GET /metrics`.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from aiohttp import web
+from os import getenv
+from registro import rastrear, usuario_atual
+
+logger = logging.getLogger(__name__)
+
+# Endereço e porta do servidor de métricas (porta 0, o padrão, desabilita o servidor)
+METRICAS_HOST = getenv("METRICAS_HOST", "127.0.0.1")
+METRICAS_PORTA = int(getenv("METRICAS_PORTA", 0))
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Limites (em segundos) dos buckets do histograma de atraso do event loop, e intervalo (em segundos) entre as medições
+BUCKETS_ATRASO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+INTERVALO_ATRASO = 0.1
+
+# Todas as métricas criadas, na ordem em que são expostas
+_metricas: list["_Metrica"] = list()
+
+
+def _escapar(valor: str) -> str:
+    """Escapa barras invertidas, aspas e quebras de linha do valor de um label."""
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_labels(nomes: tuple[str, ...], valores: tuple[str, ...]) -> str:
+    """Retorna os labels no formato `{nome="valor",...}`, ou uma string vazia caso não haja labels."""
+    if not nomes:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores))
+        + "}"
+    )
+
+
+class _Metrica:
+    """Base das métricas, com nome, descrição e nomes dos labels."""
+
+    tipo = ""
+
+    def __init__(self, nome: str, descricao: str, labels: tuple[str, ...] = ()) -> None:
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self._valores: dict[tuple[str, ...], float] = dict()
+        _metricas.append(self)
+
+    def _chave(self, labels: tuple) -> tuple[str, ...]:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"A métrica {self.nome} possui os labels {self.labels}")
+        return tuple(str(label) for label in labels)
+
+    def _amostras(self) -> list[str]:
+        return [
+            f"{self.nome}{_formatar_labels(self.labels, chave)} {valor}"
+            for chave, valor in self._valores.items()
+        ]
+
+    def expor(self) -> str:
+        """Retorna a métrica no formato de texto do Prometheus."""
+        return "\n".join(
+            [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+            + self._amostras()
+        )
+
+
+class Contador(_Metrica):
+    """Métrica que apenas aumenta, como o total de requisições."""
+
+    tipo = "counter"
+
+    def incrementar(self, *labels, valor: float = 1) -> None:
+        chave = self._chave(labels)
+        self._valores[chave] = self._valores.get(chave, 0) + valor
+
+
+class Medidor(_Metrica):
+    """Métrica que aumenta e diminui, como a quantidade de requisições em andamento."""
+
+    tipo = "gauge"
+
+    def incrementar(self, *labels, valor: float = 1) -> None:
+        chave = self._chave(labels)
+        self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def decrementar(self, *labels, valor: float = 1) -> None:
+        self.incrementar(*labels, valor=-valor)
+
+    def definir(self, *labels, valor: float) -> None:
+        self._valores[self._chave(labels)] = valor
+
+
+class Histograma(_Metrica):
+    """Métrica que distribui observações em buckets, como a latência das requisições."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        nome: str,
+        descricao: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = BUCKETS_LATENCIA,
+    ) -> None:
+        super().__init__(nome, descricao, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Para cada combinação de labels: contagem por bucket, soma e contagem total
+        self._observacoes: dict[tuple[str, ...], tuple[list[int], float, int]] = dict()
+
+    def observar(self, valor: float, *labels) -> None:
+        chave = self._chave(labels)
+        contagens, soma, total = self._observacoes.get(
+            chave, ([0] * len(self.buckets), 0.0, 0)
+        )
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                contagens[i] += 1
+        self._observacoes[chave] = (contagens, soma + valor, total + 1)
+
+    def _amostras(self) -> list[str]:
+        amostras = list()
+        for chave, (contagens, soma, total) in self._observacoes.items():
+            for limite, contagem in zip(self.buckets, contagens):
+                labels = _formatar_labels(self.labels + ("le",), chave + (str(limite),))
+                amostras.append(f"{self.nome}_bucket{labels} {contagem}")
+            labels = _formatar_labels(self.labels + ("le",), chave + ("+Inf",))
+            amostras.append(f"{self.nome}_bucket{labels} {total}")
+            labels = _formatar_labels(self.labels, chave)
+            amostras.append(f"{self.nome}_sum{labels} {soma}")
+            amostras.append(f"{self.nome}_count{labels} {total}")
+        return amostras
+
+
+# Métricas das requisições à Samsung Shop, por endpoint
+LATENCIA_REQUISICOES = Histograma(
+    "bot_requisicoes_latencia_segundos",
+    "Latência das requisições à Samsung Shop, incluindo a leitura da resposta.",
+    ("endpoint",),
+)
+REQUISICOES = Contador(
+    "bot_requisicoes_total",
+    "Total de requisições à Samsung Shop, por endpoint e status (código HTTP ou tipo de erro).",
+    ("endpoint", "status"),
+)
+REQUISICOES_EM_ANDAMENTO = Medidor(
+    "bot_requisicoes_em_andamento",
+    "Requisições à Samsung Shop em andamento.",
+    ("endpoint",),
+)
+REQUISICOES_REPETIDAS = Contador(
+    "bot_requisicoes_repetidas_total",
+    "Requisições à Samsung Shop feitas novamente, por motivo (repeticao após erro temporário ou reserva após o p95).",
+    ("endpoint", "motivo"),
+)
+CIRCUITOS_ABERTOS = Medidor(
+    "bot_circuito_aberto",
+    "Se o circuito do endpoint da Samsung Shop está aberto (1) ou fechado (0).",
+    ("endpoint",),
+)
+
+# Métricas dos limitadores de taxa das requisições à Samsung Shop e ao Telegram
+FILA_LIMITADOR = Medidor(
+    "bot_limitador_fila",
+    "Requisições esperando um token do limitador de taxa.",
+    ("limitador",),
+)
+ESPERA_LIMITADOR = Histograma(
+    "bot_limitador_espera_segundos",
+    "Tempo de espera das requisições no limitador de taxa.",
+    ("limitador",),
+)
+RETRY_AFTER_TELEGRAM = Contador(
+    "bot_telegram_retry_after_total",
+    "Requisições à Bot API do Telegram recusadas por flood control (RetryAfter), por método.",
+    ("metodo",),
+)
+
+# Métricas do processo de entrada do modo escalável (ver `escala`), por trabalhador
+UPDATES_ENCAMINHADOS = Contador(
+    "bot_updates_encaminhados_total",
+    "Updates do Telegram distribuídos aos trabalhadores, por status (encaminhado, recusado ou descartado).",
+    ("trabalhador", "status"),
+)
+FILA_TRABALHADOR = Medidor(
+    "bot_trabalhador_fila",
+    "Updates esperando para serem encaminhados ao trabalhador.",
+    ("trabalhador",),
+)
+REINICIOS_TRABALHADORES = Contador(
+    "bot_trabalhador_reinicios_total",
+    "Vezes em que o processo do trabalhador terminou e foi reiniciado.",
+    ("trabalhador",),
+)
+
+# Métricas dos avisos de estoque (ver `avisos`)
+VERIFICACOES_ESTOQUE = Contador(
+    "bot_estoque_verificacoes_total",
+    "Consultas em lote do estoque dos produtos assinados, por resultado (modificado, nao_modificado ou erro).",
+    ("resultado",),
+)
+ASSINATURAS_ESTOQUE = Medidor(
+    "bot_estoque_assinaturas",
+    "Assinaturas de avisos de estoque ativas.",
+)
+
+# Métricas das etapas do `ConversationHandler` e dos comandos do bot
+LATENCIA_ETAPAS = Histograma(
+    "bot_etapas_latencia_segundos",
+    "Latência das funções callback do bot.",
+    ("etapa",),
+)
+ETAPAS = Contador(
+    "bot_etapas_total",
+    "Total de execuções das funções callback do bot, por resultado (sucesso ou erro).",
+    ("etapa", "resultado"),
+)
+
+
+# Atraso do event loop do processo
+ATRASO_EVENT_LOOP = Histograma(
+    "bot_event_loop_atraso_segundos",
+    "Atraso do event loop: quanto uma espera periódica demora além do esperado.",
+    buckets=BUCKETS_ATRASO,
+)
+
+
+def medir_etapa(func):
+    """
+    Mede a latência e o resultado de uma função callback do bot, com o nome da função como etapa.
+    A execução é rastreada com o ID de correlação da conversa do usuário (ver `registro.rastrear`),
+    e as requisições à Samsung Shop feitas por ela, inclusive pelas tarefas que cria, são atribuídas ao usuário no limitador de taxa.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(update, context, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = "erro"
+        usuario = update.effective_user.id if update.effective_user else None
+        # O `user_data` é apenas consultado, sem ser criado para usuários sem conversa em andamento (ex: /start e /avisar)
+        dados = context.application.user_data.get(usuario)
+        token = usuario_atual.set(usuario)
+        try:
+            with rastrear(func.__name__, dados, usuario):
+                retorno = await func(update, context, *args, **kwargs)
+            resultado = "sucesso"
+            return retorno
+        finally:
+            usuario_atual.reset(token)
+            LATENCIA_ETAPAS.observar(time.perf_counter() - inicio, func.__name__)
+            ETAPAS.incrementar(func.__name__, resultado)
+
+    return wrapper
+
+
+async def monitorar_event_loop(intervalo: float = INTERVALO_ATRASO) -> None:
+    """
+    Mede continuamente o atraso do event loop, até ser cancelada.
+    A cada `intervalo` segundos, registra quanto a espera demorou além do esperado, tempo em que o event loop esteve ocupado.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        inicio = loop.time()
+        await asyncio.sleep(intervalo)
+        ATRASO_EVENT_LOOP.observar(max(0.0, loop.time() - inicio - intervalo))
+
+
+def expor_metricas() -> str:
+    """Retorna todas as métricas no formato de texto do Prometheus."""
+    return "\n".join(metrica.expor() for metrica in _metricas) + "\n"
+
+
+async def iniciar_servidor_metricas(
+    host: str = METRICAS_HOST, porta: int = METRICAS_PORTA
+) -> web.AppRunner | None:
+    """
+    Inicia o servidor que expõe as métricas na rota `GET /metrics`.
+    Retorna o `AppRunner` do servidor, que deve ser encerrado com `cleanup`,
+    ou `None` caso o servidor esteja desabilitado ou não tenha sido iniciado (porta em uso, por exemplo).
+    """
+    if not porta:
+        return None
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            text=expor_metricas(), content_type="text/plain", charset="utf-8"
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, porta).start()
+    except OSError as e:
+        # O bot continua funcionando sem o servidor de métricas
+        logger.warning("Servidor de métricas não iniciado em %s:%s: %s", host, porta, e)
+        await runner.cleanup()
+        return None
+    return runner
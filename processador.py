@@ -0,0 +1,65 @@
+"""
+Processamento simultâneo dos updates do bot.py.
+
+Classe `ProcessadorUsuarios`, processador de updates da `application` (`concurrent_updates`), que processa os updates
+de usuários diferentes simultaneamente e os updates de um mesmo usuário um de cada vez, na ordem em que chegaram.
+Assim, um usuário gerando muitos links (e esperando os limites de envio do Telegram no próprio chat) não impede os outros
+de serem atendidos, e as etapas do `ConversationHandler` de cada usuário continuam sequenciais.
+"""
+
+import asyncio
+from os import getenv
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from typing import Any, Awaitable
+
+# Quantidade máxima de updates processados simultaneamente
+MAX_UPDATES_SIMULTANEOS = int(getenv("MAX_UPDATES_SIMULTANEOS", 256))
+
+
+class ProcessadorUsuarios(BaseUpdateProcessor):
+    """
+    Processa até `MAX_UPDATES_SIMULTANEOS` updates simultaneamente, com uma trava por usuário,
+    para que os updates de um mesmo usuário sejam processados na ordem, um de cada vez.
+    Os updates sem usuário são processados diretamente.\n
+    A trava do usuário é obtida antes de uma das vagas do limite global, para que os updates esperando a vez
+    de um mesmo usuário não ocupem as vagas dos outros usuários (ex: um usuário enviando muitas mensagens).\n
+    As travas são descartadas quando o usuário não possui mais updates em processamento.
+    """
+
+    def __init__(self, max_updates: int = MAX_UPDATES_SIMULTANEOS) -> None:
+        super().__init__(max_updates)
+        # Trava e quantidade de updates em processamento ou esperando de cada usuário
+        self._travas: dict[int, tuple[asyncio.Lock, int]] = dict()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Substitui o `process_update` do PTB, que obtém a vaga do limite global antes de chamar `do_process_update`
+        usuario = (
+            update.effective_user.id
+            if isinstance(update, Update) and update.effective_user
+            else None
+        )
+        if usuario is None:
+            await super().process_update(update, coroutine)
+            return
+
+        trava, pendentes = self._travas.get(usuario, (asyncio.Lock(), 0))
+        self._travas[usuario] = (trava, pendentes + 1)
+        try:
+            async with trava:
+                await super().process_update(update, coroutine)
+        finally:
+            trava, pendentes = self._travas[usuario]
+            if pendentes == 1:
+                del self._travas[usuario]
+            else:
+                self._travas[usuario] = (trava, pendentes - 1)
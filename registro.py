@@ -0,0 +1,240 @@
+"""
+Logging estruturado e rastreamento das requisições HTTP (à Samsung Shop e ao Telegram) feitas durante as etapas do bot.py.
+
+Função `configurar_logging`, que envia os registros de log a uma fila, formatados e escritos por uma thread separada (`QueueListener`),
+para que o event loop nunca espere a escrita, em JSON (um objeto por linha) ou em texto (`FORMATO_LOG`).\n
+Classe `Rastro`, com o ID de correlação da conversa, o usuário, a etapa e os spans (requisições HTTP, com a duração e o status) da execução atual.
+Função `rastrear`, que associa um rastro à execução de uma etapa (ver `medir_etapa`), e registra o rastro inteiro
+caso a etapa demore mais que `LIMITE_EXECUCAO_LENTA` segundos.\n
+Variável de contexto `usuario_atual`, o ID do usuário do Telegram a quem as requisições da execução são atribuídas (ver `limitador`).\n
+Função `registrar_span`, que adiciona um span ao rastro atual (ver `utils._tentativa` e `envio.LimitadorTelegram`).\n
+Função `nova_correlacao`, que gera o ID de correlação de uma nova conversa do `/gerar`, salvo no `user_data`
+e incluído em todos os registros de log das etapas da conversa.
+"""
+
+import contextlib
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from os import getenv
+from typing import Iterator
+
+# Formato dos registros de log: "json" (padrão) ou "texto"
+FORMATO_LOG = getenv("FORMATO_LOG", "json")
+
+# Nível mínimo dos registros de log
+NIVEL_LOG = getenv("NIVEL_LOG", "INFO").upper()
+
+# Duração (em segundos) a partir da qual o rastro inteiro de uma etapa é registrado (0 desabilita)
+LIMITE_EXECUCAO_LENTA = float(getenv("LIMITE_EXECUCAO_LENTA", 5))
+
+# Quantidade máxima de spans guardados em cada rastro
+MAX_SPANS = 200
+
+# Atributos de todo `LogRecord`, que não são campos adicionais (`extra`) do registro
+_ATRIBUTOS_PADRAO = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None))
+) | {"message", "asctime", "correlacao", "usuario", "etapa"}
+
+logger = logging.getLogger(__name__)
+
+
+class Rastro:
+    """Rastro de uma execução de uma etapa, com os spans `{endpoint, metodo, url, inicio, duracao, status}` das requisições HTTP."""
+
+    def __init__(self, etapa: str, correlacao: str, usuario: int | None) -> None:
+        self.etapa = etapa
+        self.correlacao = correlacao
+        self.usuario = usuario
+        self.inicio = time.perf_counter()
+        self.spans: list[dict] = list()
+        self.finalizado = False
+
+    def resumo(self, duracao: float) -> dict:
+        """Retorna o rastro com as durações em milissegundos e o início dos spans relativo ao início da etapa."""
+        return {
+            "etapa": self.etapa,
+            "correlacao": self.correlacao,
+            "usuario": self.usuario,
+            "duracao_ms": round(duracao * 1000, 1),
+            "spans": [
+                {
+                    **span,
+                    "inicio": round((span["inicio"] - self.inicio) * 1000, 1),
+                    "duracao": round(span["duracao"] * 1000, 1),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+# Rastro da execução atual, herdado pelas tarefas criadas durante a execução (ex: geração simultânea dos links)
+rastro_atual: ContextVar[Rastro | None] = ContextVar("rastro_atual", default=None)
+
+# ID do usuário do Telegram a quem as requisições da execução atual são atribuídas no limitador de taxa (ver `limitador`)
+# `None` para requisições em segundo plano. Definido aqui, e não no `limitador`, para que `medir_etapa` o defina sem importação circular
+usuario_atual: ContextVar[int | None] = ContextVar("usuario_atual", default=None)
+
+
+def _gerar_correlacao() -> str:
+    """Gera um novo ID de correlação."""
+    return uuid.uuid4().hex[:16]
+
+
+def nova_correlacao(dados: dict | None = None) -> str:
+    """Gera um novo ID de correlação, salvo em `dados` (`user_data` da conversa) e associado ao rastro atual."""
+    correlacao = _gerar_correlacao()
+    if dados is not None:
+        dados["correlacao"] = correlacao
+    rastro = rastro_atual.get()
+    if rastro is not None:
+        rastro.correlacao = correlacao
+    return correlacao
+
+
+@contextlib.contextmanager
+def rastrear(
+    etapa: str, dados: dict | None = None, usuario: int | None = None
+) -> Iterator[Rastro]:
+    """
+    Associa um novo rastro à execução da etapa, com o ID de correlação salvo em `dados` (`user_data` da conversa),
+    ou um novo ID, apenas do rastro, caso a conversa não possua um.
+    O ID não é salvo em `dados`, para que o `user_data` seja criado apenas pelas conversas do /gerar (ver `nova_correlacao`).
+    Ao fim da etapa, caso tenha demorado mais que `LIMITE_EXECUCAO_LENTA` segundos, o rastro inteiro é registrado.
+    """
+    correlacao = (dados or dict()).get("correlacao") or _gerar_correlacao()
+    rastro = Rastro(etapa, correlacao, usuario)
+    token = rastro_atual.set(rastro)
+    try:
+        yield rastro
+    finally:
+        rastro_atual.reset(token)
+        rastro.finalizado = True
+        duracao = time.perf_counter() - rastro.inicio
+        if LIMITE_EXECUCAO_LENTA and duracao >= LIMITE_EXECUCAO_LENTA:
+            logger.warning(
+                "Etapa %s lenta: %.3f s, %d requisições",
+                etapa,
+                duracao,
+                len(rastro.spans),
+                extra={
+                    "rastro": rastro.resumo(duracao),
+                    "correlacao": rastro.correlacao,
+                    "usuario": rastro.usuario,
+                    "etapa": etapa,
+                },
+            )
+
+
+def registrar_span(
+    endpoint: str, metodo: str, url: str, inicio: float, status: str
+) -> None:
+    """Adiciona ao rastro atual, caso exista, o span de uma requisição HTTP iniciada em `inicio` (`time.perf_counter`)."""
+    rastro = rastro_atual.get()
+    # Requisições em segundo plano iniciadas pela etapa podem terminar depois dela
+    if rastro is None or rastro.finalizado or len(rastro.spans) >= MAX_SPANS:
+        return
+    rastro.spans.append(
+        {
+            "endpoint": endpoint,
+            "metodo": metodo,
+            "url": url,
+            "inicio": inicio,
+            "duracao": time.perf_counter() - inicio,
+            "status": status,
+        }
+    )
+
+
+class FiltroContexto(logging.Filter):
+    """Adiciona a cada registro o ID de correlação, o usuário e a etapa do rastro atual, ainda na thread que o emitiu."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rastro = rastro_atual.get()
+        if not hasattr(record, "correlacao"):
+            record.correlacao = rastro.correlacao if rastro else None
+            record.usuario = rastro.usuario if rastro else None
+            record.etapa = rastro.etapa if rastro else None
+        return True
+
+
+class ManipuladorFila(logging.handlers.QueueHandler):
+    """
+    Envia os registros à fila sem formatá-los: apenas a mensagem é montada com os argumentos,
+    e a formatação (inclusive das exceções) fica com a thread do `QueueListener`.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class FormatadorJSON(logging.Formatter):
+    """Formata cada registro como um objeto JSON em uma linha, com os campos adicionais (`extra`) do registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "momento": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+            "correlacao": getattr(record, "correlacao", None),
+            "usuario": getattr(record, "usuario", None),
+            "etapa": getattr(record, "etapa", None),
+        }
+        dados.update(
+            (chave, valor)
+            for chave, valor in vars(record).items()
+            if chave not in _ATRIBUTOS_PADRAO
+        )
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FormatadorTexto(logging.Formatter):
+    """Formata cada registro em texto, com o ID de correlação e, caso exista, o rastro em JSON ao final."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            "%(asctime)s - %(name)s - %(levelname)s - [%(correlacao)s] %(message)s"
+        )
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.correlacao = getattr(record, "correlacao", None) or "-"
+        texto = super().format(record)
+        rastro = getattr(record, "rastro", None)
+        if rastro is not None:
+            texto += f" rastro={json.dumps(rastro, ensure_ascii=False)}"
+        return texto
+
+
+def configurar_logging(
+    formato: str = FORMATO_LOG, nivel: str = NIVEL_LOG
+) -> logging.handlers.QueueListener:
+    """
+    Configura o logger raiz para enviar os registros a uma fila, escritos na saída de erro por uma thread separada.
+    Retorna o `QueueListener` já iniciado, que deve ser parado com `stop` ao encerrar, para escrever os registros pendentes.
+    """
+    fila: queue.SimpleQueue = queue.SimpleQueue()
+
+    saida = logging.StreamHandler(sys.stderr)
+    saida.setFormatter(FormatadorJSON() if formato == "json" else FormatadorTexto())
+
+    manipulador = ManipuladorFila(fila)
+    manipulador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [manipulador]
+    raiz.setLevel(nivel)
+
+    ouvinte = logging.handlers.QueueListener(fila, saida, respect_handler_level=True)
+    ouvinte.start()
+    return ouvinte
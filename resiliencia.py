@@ -0,0 +1,232 @@
+"""
+Resiliência das requisições do utils.py à Samsung Shop.
+
+Função `executar`, que executa uma requisição com:
+repetição com espera exponencial e aleatória (apenas para etapas idempotentes),
+requisição de reserva (hedging) opcional quando a primeira passa do p95 da latência do endpoint,
+e um circuito (circuit breaker) por endpoint, que falha imediatamente enquanto o endpoint está fora do ar.\n
+Classe `CircuitoAbertoError`, erro das requisições recusadas pelo circuito aberto.
+"""
+
+import aiohttp
+import asyncio
+import random
+import time
+from collections import deque
+from metricas import CIRCUITOS_ABERTOS, REQUISICOES_REPETIDAS
+from os import getenv
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Quantidade máxima de tentativas das requisições idempotentes e espera (em segundos) entre as tentativas
+TENTATIVAS_MAXIMAS = int(getenv("TENTATIVAS_MAXIMAS", 3))
+ESPERA_BASE_TENTATIVAS = float(getenv("ESPERA_BASE_TENTATIVAS", 0.2))
+ESPERA_MAXIMA_TENTATIVAS = float(getenv("ESPERA_MAXIMA_TENTATIVAS", 5))
+
+# Requisições de reserva (hedging), desabilitadas por padrão
+# A reserva é feita quando a primeira requisição passa do p95 das últimas latências do endpoint
+HEDGING = getenv("HEDGING", "0") == "1"
+AMOSTRAS_LATENCIA = 200
+AMOSTRAS_MINIMAS_HEDGING = 20
+
+# Falhas seguidas para abrir o circuito de um endpoint e tempo (em segundos) que o circuito fica aberto
+FALHAS_ABRIR_CIRCUITO = int(getenv("FALHAS_ABRIR_CIRCUITO", 5))
+TEMPO_CIRCUITO_ABERTO = float(getenv("TEMPO_CIRCUITO_ABERTO", 30))
+
+# Status HTTP que indicam um erro temporário da Samsung Shop
+STATUS_TEMPORARIOS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitoAbertoError(aiohttp.ClientError):
+    """Requisição recusada porque o circuito do endpoint está aberto."""
+
+
+class Circuito:
+    """
+    Circuito (circuit breaker) de um endpoint.\n
+    Fechado: as requisições são feitas normalmente. Após `FALHAS_ABRIR_CIRCUITO` falhas temporárias seguidas, é aberto.
+    Aberto: as requisições são recusadas por `TEMPO_CIRCUITO_ABERTO` segundos, e então fica meio aberto.
+    Meio aberto: uma única requisição de teste é permitida, que fecha o circuito se tiver sucesso, ou o abre novamente.
+    """
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.teste_em_andamento = False
+
+    @property
+    def aberto(self) -> bool:
+        return self.falhas >= FALHAS_ABRIR_CIRCUITO
+
+    def permitir(self) -> bool:
+        """Retorna se uma requisição pode ser feita, reservando a requisição de teste caso o circuito esteja meio aberto."""
+        if not self.aberto:
+            return True
+        if time.monotonic() < self.aberto_ate or self.teste_em_andamento:
+            return False
+        self.teste_em_andamento = True
+        return True
+
+    def registrar_sucesso(self) -> None:
+        """Registra uma requisição em que a Samsung Shop respondeu, fechando o circuito."""
+        self.falhas = 0
+        self.teste_em_andamento = False
+        CIRCUITOS_ABERTOS.definir(self.endpoint, valor=0)
+
+    def registrar_falha(self) -> None:
+        """Registra uma falha temporária, abrindo o circuito caso atinja o limite de falhas seguidas."""
+        self.falhas += 1
+        self.teste_em_andamento = False
+        if self.aberto:
+            self.aberto_ate = time.monotonic() + TEMPO_CIRCUITO_ABERTO
+            CIRCUITOS_ABERTOS.definir(self.endpoint, valor=1)
+
+    def cancelar_teste(self) -> None:
+        """Libera a requisição de teste, caso tenha sido interrompida sem resultado."""
+        self.teste_em_andamento = False
+
+
+# Circuitos e últimas latências de cada endpoint
+_circuitos: dict[str, Circuito] = dict()
+_latencias: dict[str, deque[float]] = dict()
+
+
+def erro_temporario(erro: BaseException) -> bool:
+    """Retorna se o erro é temporário (timeout, conexão ou status temporário), e a requisição pode ser repetida."""
+    if isinstance(erro, CircuitoAbertoError):
+        return False
+    if isinstance(erro, asyncio.TimeoutError):
+        return True
+    if isinstance(erro, aiohttp.ClientResponseError):
+        return erro.status in STATUS_TEMPORARIOS
+    return isinstance(erro, aiohttp.ClientConnectionError)
+
+
+def _espera(numero: int, erro: BaseException) -> float:
+    """
+    Retorna a espera (em segundos) antes da próxima tentativa, exponencial e aleatória (full jitter).
+    Respeita o cabeçalho `Retry-After` das respostas 429 e 503, até a espera máxima.
+    """
+    espera = random.uniform(
+        0, min(ESPERA_MAXIMA_TENTATIVAS, ESPERA_BASE_TENTATIVAS * 2**numero)
+    )
+    if isinstance(erro, aiohttp.ClientResponseError) and erro.headers:
+        try:
+            espera = max(espera, float(erro.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass
+    return min(espera, ESPERA_MAXIMA_TENTATIVAS)
+
+
+def _p95(endpoint: str) -> float | None:
+    """Retorna o p95 das últimas latências do endpoint, ou `None` caso ainda não haja amostras suficientes."""
+    latencias = _latencias.get(endpoint)
+    if not latencias or len(latencias) < AMOSTRAS_MINIMAS_HEDGING:
+        return None
+    return sorted(latencias)[int(len(latencias) * 0.95) - 1]
+
+
+async def _medir(endpoint: str, tentativa: Callable[[], Awaitable[T]]) -> T:
+    """Executa a tentativa e armazena a sua latência, caso tenha sucesso."""
+    inicio = time.perf_counter()
+    resultado = await tentativa()
+    _latencias.setdefault(endpoint, deque(maxlen=AMOSTRAS_LATENCIA)).append(
+        time.perf_counter() - inicio
+    )
+    return resultado
+
+
+async def _reserva(
+    endpoint: str,
+    tentativa: Callable[[], Awaitable[T]],
+    antes: Callable[[], Awaitable[None]] | None,
+) -> T:
+    """Executa a tentativa de reserva, após esperar `antes` (o limitador de taxa), que não faz parte da latência medida."""
+    if antes is not None:
+        await antes()
+    return await _medir(endpoint, tentativa)
+
+
+async def _com_reserva(
+    endpoint: str,
+    tentativa: Callable[[], Awaitable[T]],
+    antes: Callable[[], Awaitable[None]] | None = None,
+) -> T:
+    """
+    Executa a tentativa e, caso ela passe do p95 da latência do endpoint, executa uma tentativa de reserva.
+    Retorna o primeiro resultado com sucesso, e cancela a outra tentativa.
+    """
+    limite = _p95(endpoint)
+    tarefas = {asyncio.ensure_future(_medir(endpoint, tentativa))}
+    try:
+        if limite is not None:
+            concluidas, _ = await asyncio.wait(tarefas, timeout=limite)
+            if not concluidas:
+                REQUISICOES_REPETIDAS.incrementar(endpoint, "reserva")
+                tarefas.add(asyncio.ensure_future(_reserva(endpoint, tentativa, antes)))
+
+        erro = None
+        while tarefas:
+            concluidas, tarefas = await asyncio.wait(
+                tarefas, return_when=asyncio.FIRST_COMPLETED
+            )
+            for tarefa in concluidas:
+                if tarefa.exception() is None:
+                    return tarefa.result()
+                erro = tarefa.exception()
+        raise erro
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+async def executar(
+    endpoint: str,
+    tentativa: Callable[[], Awaitable[T]],
+    idempotente: bool,
+    antes: Callable[[], Awaitable[None]] | None = None,
+) -> T:
+    """
+    Executa a requisição `tentativa` (uma função que cria uma nova requisição a cada chamada) pelo circuito do endpoint.\n
+    Requisições idempotentes são repetidas em caso de erro temporário, até `TENTATIVAS_MAXIMAS` vezes,
+    e podem ter uma requisição de reserva (hedging). Requisições não idempotentes são feitas uma única vez.
+    Caso o circuito esteja aberto, `CircuitoAbertoError` é lançado sem que a requisição seja feita.\n
+    Antes de cada tentativa, inclusive as repetições e as reservas, espera `antes` (ex: o limitador de taxa),
+    cuja espera não faz parte da latência usada para as reservas.
+    """
+    circuito = _circuitos.setdefault(endpoint, Circuito(endpoint))
+    tentativas = TENTATIVAS_MAXIMAS if idempotente else 1
+
+    for numero in range(tentativas):
+        if not circuito.permitir():
+            raise CircuitoAbertoError(
+                f"Circuito do endpoint {endpoint} está aberto após falhas seguidas"
+            )
+
+        try:
+            if antes is not None:
+                await antes()
+            if idempotente and HEDGING:
+                resultado = await _com_reserva(endpoint, tentativa, antes)
+            else:
+                resultado = await _medir(endpoint, tentativa)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not erro_temporario(e):
+                # A Samsung Shop respondeu, apenas com um erro que não é temporário
+                circuito.registrar_sucesso()
+                raise
+
+            circuito.registrar_falha()
+            if numero == tentativas - 1:
+                raise
+
+            REQUISICOES_REPETIDAS.incrementar(endpoint, "repeticao")
+            await asyncio.sleep(_espera(numero, e))
+        except BaseException:
+            circuito.cancelar_teste()
+            raise
+        else:
+            circuito.registrar_sucesso()
+            return resultado
@@ -0,0 +1,133 @@
+"""
+Teclados (`InlineKeyboard`s) do bot.py, montados uma única vez e reutilizados entre os usuários.
+
+Os botões possuem callback_data compacto, no formato `<prefixo>:<valor>`, em que o prefixo identifica a etapa
+e o valor é o índice da opção, para que o callback_data fique dentro do limite de 64 bytes do Telegram,
+independentemente do tamanho dos nomes dos modelos, capacidades e cores.\n
+Os teclados dos modelos de `MODELOS` são paginados, com `MODELOS_POR_PAGINA` modelos por página,
+e remontados quando modelos são descobertos (função `atualizar_teclados_modelos`).\n
+Os botões dos avisos de estoque (`/avisos`) possuem o ID da cor assinada como valor do callback_data.
+"""
+
+import functools
+from modelos import MODELOS
+from os import getenv
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Prefixos do callback_data dos botões de cada etapa
+PREFIXO_MODELO = "m"
+PREFIXO_PAGINA = "p"
+PREFIXO_OUTRO = "o"
+PREFIXO_CAPACIDADE = "c"
+PREFIXO_COR = "r"
+PREFIXO_QUANTIDADE = "q"
+PREFIXO_AVISO = "a"
+
+# Quantidade de modelos em cada página do teclado de modelos
+MODELOS_POR_PAGINA = max(1, int(getenv("MODELOS_POR_PAGINA", 10)))
+
+# Nomes dos modelos de `MODELOS`, na ordem, indexados pelo valor do callback_data
+NOMES_MODELOS = list(MODELOS.keys())
+
+
+def callback_data(prefixo: str, valor: int | str = "") -> str:
+    """Retorna o callback_data de um botão, no formato `<prefixo>:<valor>`."""
+    return f"{prefixo}:{valor}"
+
+
+def ler_callback_data(dados: str) -> tuple[str, str]:
+    """Retorna o prefixo e o valor de um callback_data, no formato `(prefixo, valor)`."""
+    prefixo, _, valor = dados.partition(":")
+    return prefixo, valor
+
+
+def _montar_teclados_modelos() -> list[InlineKeyboardMarkup]:
+    """Monta as páginas do teclado de modelos, com botões de navegação entre as páginas e a opção "Outro"."""
+    paginas = [
+        NOMES_MODELOS[inicio : inicio + MODELOS_POR_PAGINA]
+        for inicio in range(0, len(NOMES_MODELOS), MODELOS_POR_PAGINA)
+    ] or [[]]
+
+    teclados = list()
+    for numero, nomes in enumerate(paginas):
+        inicio = numero * MODELOS_POR_PAGINA
+        teclado = [
+            [
+                InlineKeyboardButton(
+                    text=nome, callback_data=callback_data(PREFIXO_MODELO, inicio + i)
+                )
+            ]
+            for i, nome in enumerate(nomes)
+        ]
+
+        # Botões de navegação, apenas caso haja mais de uma página
+        navegacao = list()
+        if numero > 0:
+            navegacao.append(
+                InlineKeyboardButton(
+                    text="« Anterior",
+                    callback_data=callback_data(PREFIXO_PAGINA, numero - 1),
+                )
+            )
+        if numero < len(paginas) - 1:
+            navegacao.append(
+                InlineKeyboardButton(
+                    text="Próxima »",
+                    callback_data=callback_data(PREFIXO_PAGINA, numero + 1),
+                )
+            )
+        if navegacao:
+            teclado.append(navegacao)
+
+        teclado.append(
+            [InlineKeyboardButton(text="Outro", callback_data=callback_data(PREFIXO_OUTRO))]
+        )
+        teclados.append(InlineKeyboardMarkup(teclado))
+
+    return teclados
+
+
+# Páginas do teclado de modelos, montadas uma única vez
+TECLADOS_MODELOS = _montar_teclados_modelos()
+
+
+def atualizar_teclados_modelos() -> None:
+    """
+    Remonta as páginas do teclado de modelos após novos modelos serem adicionados a `MODELOS`.
+    Os novos modelos são adicionados ao final, para que os índices dos modelos já existentes não mudem.
+    """
+    existentes = set(NOMES_MODELOS)
+    NOMES_MODELOS.extend(nome for nome in MODELOS.keys() if nome not in existentes)
+    TECLADOS_MODELOS[:] = _montar_teclados_modelos()
+
+
+@functools.lru_cache(maxsize=1024)
+def teclado_opcoes(
+    prefixo: str, opcoes: tuple[str, ...], por_linha: int = 1
+) -> InlineKeyboardMarkup:
+    """
+    Retorna o teclado com um botão para cada opção, com o índice da opção como valor do callback_data.\n
+    Os teclados são armazenados em cache pelas opções, e reutilizados entre os usuários que escolhem o mesmo modelo.
+    """
+    botoes = [
+        InlineKeyboardButton(text=opcao, callback_data=callback_data(prefixo, i))
+        for i, opcao in enumerate(opcoes)
+    ]
+    return InlineKeyboardMarkup(
+        [botoes[i : i + por_linha] for i in range(0, len(botoes), por_linha)]
+    )
+
+
+def teclado_avisos(assinaturas: list[tuple[str, str]]) -> InlineKeyboardMarkup:
+    """Retorna o teclado com um botão para cancelar cada aviso de estoque, a partir das assinaturas no formato `[(id_cor, descricao)]`."""
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    text=f"Cancelar {descricao}",
+                    callback_data=callback_data(PREFIXO_AVISO, id_cor),
+                )
+            ]
+            for id_cor, descricao in assinaturas
+        ]
+    )
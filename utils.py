@@ -3,273 +3,1054 @@ Utils para o bot.py.
 Utilizam URLs APIs da Samsung Shop para extraírem informações de modelos e para adicionarem informações ao carrinho.
 
 Função `informacoes_modelo`, que filtra as capacidades e as cores do modelo, assim como seus IDs associados.\n
-Função `gerar_link`, que gera link de carrinho na Samsung Shop com o produto e desconto do Vale Mais - Troca Smart.
+Função `gerar_link`, que gera link de carrinho na Samsung Shop com o produto e desconto do Vale Mais - Troca Smart.\n
+Função `gerar_links`, que gera vários links simultaneamente, com limite de links gerados ao mesmo tempo.\n
+Função `informacoes_modelo_em_cache`, que consulta as informações do modelo antes no cache.\n
+Função `criar_sessao`, que cria a sessão HTTP compartilhada por todas as requisições à Samsung Shop.\n
+Função `criar_carrinho`, que cria um carrinho vazio na Samsung Shop.\n
+Função `indexar_produtos`, que armazena os IDs dos produtos no índice persistente, consultado antes do HTML das páginas.\n
+Funções `produtos_categoria`, `produtos_por_id` e `detalhes_modelos`, que requisitam vários produtos e modelos em lote,
+e funções `agrupar_produtos` e `informacoes_produtos`, que montam as informações dos modelos a partir dos produtos.\n
+Função `estoque_produtos`, que consulta com uma requisição condicional o estoque das cores de vários produtos.
 """
 
-import aiohttp, re
+import aiohttp, asyncio, functools, logging, re, resiliencia, time
 from bs4 import BeautifulSoup
+from cache import CacheTTL
+from indice import IndiceProdutos
+from limitador import PESO_SEGUNDO_PLANO, LimitadorTaxa, usuario_atual
+from metricas import LATENCIA_REQUISICOES, REQUISICOES, REQUISICOES_EM_ANDAMENTO
+from os import getenv
+from registro import registrar_span
+from typing import Any, Awaitable, Callable
 
+logger = logging.getLogger(__name__)
 
-async def informacoes_modelo(url: str) -> dict:
+# URLs base da Samsung Shop e da API de busca da Samsung
+# Podem ser alterados para apontar para uma loja falsa local (ver `benchmark`)
+URL_LOJA = getenv("URL_LOJA", "https://shop.samsung.com")
+URL_SEARCHAPI = getenv("URL_SEARCHAPI", "https://searchapi.samsung.com")
+
+# Configurações do pool de conexões da sessão HTTP compartilhada
+LIMITE_CONEXOES = int(getenv("LIMITE_CONEXOES", 100))
+LIMITE_CONEXOES_POR_HOST = int(getenv("LIMITE_CONEXOES_POR_HOST", 20))
+TTL_CACHE_DNS = int(getenv("TTL_CACHE_DNS", 300))
+KEEPALIVE = float(getenv("KEEPALIVE", 30))
+
+# Timeouts (em segundos) das requisições da sessão HTTP compartilhada
+TIMEOUT_TOTAL = float(getenv("TIMEOUT_TOTAL", 30))
+TIMEOUT_CONEXAO = float(getenv("TIMEOUT_CONEXAO", 10))
+TIMEOUT_LEITURA = float(getenv("TIMEOUT_LEITURA", 20))
+
+# Tamanho (em bytes) dos pedaços lidos do HTML das páginas dos modelos
+# e sobreposição entre os pedaços, maior que o tamanho dos valores procurados
+TAMANHO_PEDACO_HTML = int(getenv("TAMANHO_PEDACO_HTML", 64 * 1024))
+SOBREPOSICAO_PEDACOS_HTML = 1024
+
+# Expressões para encontrar o ID e o referenceId do modelo no HTML da página
+_REGEX_ID_MODELO = re.compile(
+    rb"https://shop\.samsung\.com/_v/segment/routing/vtex\.store@2\.x/product/(\d+)/"
+)
+_REGEX_REFERENCIA_MODELO = re.compile(
+    rb"<strong[^>]*class=\"[^\"]*\bsamsungbr-app-pdp-2-x-productReferenceId\b[^\"]*\"[^>]*>([^<]+)</strong>"
+)
+
+# Cabeçalhos das requisições à API de carrinho da Samsung Shop
+HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "content-type": "application/json",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+}
+
+# Limite de capacidades de um modelo requisitadas simultaneamente
+LIMITE_CAPACIDADES_SIMULTANEAS = int(getenv("LIMITE_CAPACIDADES_SIMULTANEAS", 4))
+
+# Limite de links gerados simultaneamente em cada chamada de `gerar_links` (para um usuário)
+LIMITE_LINKS_SIMULTANEOS = int(getenv("LIMITE_LINKS_SIMULTANEOS", 5))
+
+# Quantidade máxima de produtos em cada requisição em lote ao catalog_system (limite da API)
+# e de referenceIds no `modelList` de cada requisição em lote à searchapi
+LOTE_CATALOG_SYSTEM = 50
+LOTE_SEARCHAPI = int(getenv("LOTE_SEARCHAPI", 20))
+
+# Quantidade máxima de produtos de uma categoria (limite da paginação do catalog_system)
+MAX_PRODUTOS_CATEGORIA = 2500
+
+# TTLs (em segundos) do cache das marketingTags, para modelos com e sem marketingTag
+TTL_CACHE_MARKETING_TAG = float(getenv("TTL_CACHE_MARKETING_TAG", 600))
+TTL_CACHE_SEM_MARKETING_TAG = float(getenv("TTL_CACHE_SEM_MARKETING_TAG", 60))
+
+# Tarefas de atualização em segundo plano do cache de modelos, indexadas pelo URL normalizado
+_atualizacoes_em_andamento: dict[str, asyncio.Task] = dict()
+
+# Requisições em andamento das informações dos modelos, indexadas pelo URL normalizado e por incluir cores sem estoque
+_requisicoes_modelos: dict[tuple[str, bool], asyncio.Task] = dict()
+
+# Cache das marketingTags e requisições em andamento, indexados por `(id_modelo, id_cor)`
+_cache_marketing_tags = CacheTTL(
+    ttl=TTL_CACHE_MARKETING_TAG, ttl_negativo=TTL_CACHE_SEM_MARKETING_TAG
+)
+_requisicoes_marketing_tags: dict[tuple[str, str], asyncio.Task] = dict()
+
+# Índice persistente dos IDs dos produtos, indexados pelo slug do URL
+_indice = IndiceProdutos()
+
+# Limitador de taxa global das requisições à Samsung Shop, com fila justa entre os usuários
+_limitador = LimitadorTaxa()
+
+
+def criar_sessao() -> aiohttp.ClientSession:
     """
-    Retorna informações do modelo através de seu url na Samsung Shop.
-    Retorna as capacidades e as cores, com seus IDs, se há estoque.\n
-    Formato do dicionário retornado: `{capacidade: {"id": id, "cores": {cor: id}}}`
+    Cria a sessão HTTP compartilhada, que deve ser criada uma única vez e fechada ao encerrar o bot.
+    As conexões são mantidas abertas (keep-alive) e reutilizadas entre as requisições,
+    com limite de conexões por host e cache de DNS.
     """
-    informacoes = dict()
+    conector = aiohttp.TCPConnector(
+        limit=LIMITE_CONEXOES,
+        limit_per_host=LIMITE_CONEXOES_POR_HOST,
+        ttl_dns_cache=TTL_CACHE_DNS,
+        keepalive_timeout=KEEPALIVE,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=TIMEOUT_TOTAL,
+        sock_connect=TIMEOUT_CONEXAO,
+        sock_read=TIMEOUT_LEITURA,
+    )
+    return aiohttp.ClientSession(connector=conector, timeout=timeout)
+
+
+async def _requisitar(
+    sessao: aiohttp.ClientSession,
+    metodo: str,
+    endpoint: str,
+    url: str,
+    ler: Callable[[aiohttp.ClientResponse], Awaitable[Any]] | None = None,
+    idempotente: bool | None = None,
+    **kwargs,
+) -> Any:
+    """
+    Faz uma requisição à Samsung Shop e retorna a resposta lida pela função `ler` (ou `None`, caso não seja informada).\n
+    A requisição passa pelo circuito do endpoint e, caso seja idempotente (por padrão, apenas `GET`),
+    é repetida em caso de erro temporário (ver `resiliencia`).
+    Cada tentativa, inclusive as repetições e as reservas, espera a vez do usuário atual no limitador de taxa (ver `limitador`).
+    Erros de status HTTP, de conexão, de timeout e de circuito aberto são propagados.
+    """
+    if idempotente is None:
+        idempotente = metodo == "GET"
+
+    usuario = usuario_atual.get()
+    peso = 1 if usuario is not None else PESO_SEGUNDO_PLANO
+
+    return await resiliencia.executar(
+        endpoint,
+        lambda: _tentativa(sessao, metodo, endpoint, url, ler, **kwargs),
+        idempotente,
+        lambda: _limitador.adquirir(usuario, peso),
+    )
+
+
+async def _tentativa(
+    sessao: aiohttp.ClientSession,
+    metodo: str,
+    endpoint: str,
+    url: str,
+    ler: Callable[[aiohttp.ClientResponse], Awaitable[Any]] | None,
+    **kwargs,
+) -> Any:
+    """
+    Faz uma tentativa da requisição e registra as suas métricas pelo nome do `endpoint`: latência (incluindo a leitura da resposta),
+    total por status (código HTTP ou tipo de erro) e requisições em andamento.
+    A tentativa também é adicionada como um span ao rastro da etapa atual do bot, caso exista (ver `registro`).
+    """
+    REQUISICOES_EM_ANDAMENTO.incrementar(endpoint)
+    inicio = time.perf_counter()
+    status = "erro"
+    try:
+        async with sessao.request(metodo, url, **kwargs) as resposta:
+            status = str(resposta.status)
+            resposta.raise_for_status()
+            return await ler(resposta) if ler else None
+    except asyncio.TimeoutError:
+        status = "timeout"
+        raise
+    except aiohttp.ContentTypeError:
+        status = "conteudo_invalido"
+        raise
+    except aiohttp.ClientResponseError:
+        raise
+    except aiohttp.ClientError:
+        status = "erro_conexao"
+        raise
+    except asyncio.CancelledError:
+        status = "cancelada"
+        raise
+    finally:
+        REQUISICOES_EM_ANDAMENTO.decrementar(endpoint)
+        LATENCIA_REQUISICOES.observar(time.perf_counter() - inicio, endpoint)
+        REQUISICOES.incrementar(endpoint, status)
+        registrar_span(endpoint, metodo, url, inicio, status)
+
+
+async def _ler_json(resposta: aiohttp.ClientResponse) -> Any:
+    """Lê a resposta em JSON."""
+    return await resposta.json()
+
 
+def _url_loja(url: str) -> str:
+    """Retorna o URL de uma página da Samsung Shop com o URL base `URL_LOJA`."""
+    return URL_LOJA + url.removeprefix("https://shop.samsung.com")
+
+
+def normalizar_url(url: str) -> str | None:
+    """
+    Retorna o URL do modelo na Samsung Shop normalizado, sem parâmetros e sem especificação de capacidade.
+    Retorna `None` caso o formato do URL seja inválido.
+    """
     # Validação do formato do URL
     if not re.compile(r"^https://shop\.samsung\.com/br/.+/p.*").match(url):
-        return {"erro": "Formato de URL inválido"}
+        return None
 
     # Retirar parâmetros que possam estar no URL, como skuId
     if not url.endswith("/p"):
         url = url[: (url.find("/p")) + 2]
 
     # Retirar especificação de capacidade do URL, para que o primeiro ID seja o da capacidade padrão
-    url = re.sub(r"-\d+[gt]b", "", url)
+    return re.sub(r"-\d+[gt]b", "", url)
+
+
+async def informacoes_modelo_em_cache(
+    sessao: aiohttp.ClientSession, cache: CacheTTL, url: str
+) -> dict:
+    """
+    Retorna informações do modelo através de seu url na Samsung Shop, consultando antes o cache.\n
+    O cache é indexado pelo URL normalizado.
+    Caso as informações no cache estejam obsoletas, são retornadas imediatamente e atualizadas em segundo plano.
+    Resultados de erro são armazenados com o TTL negativo do cache.
+    """
+    chave = normalizar_url(url)
+    if chave is None:
+        return await informacoes_modelo(sessao, url)
+
+    entrada = cache.obter(chave)
+
+    if entrada is not None:
+        informacoes, obsoleto = entrada
+
+        # Atualizar em segundo plano as informações obsoletas, caso ainda não estejam sendo atualizadas
+        if obsoleto and chave not in _atualizacoes_em_andamento:
+            tarefa = asyncio.create_task(_atualizar_cache(sessao, cache, chave))
+            _atualizacoes_em_andamento[chave] = tarefa
+            tarefa.add_done_callback(
+                lambda _: _atualizacoes_em_andamento.pop(chave, None)
+            )
+
+        return informacoes
+
+    return await _atualizar_cache(sessao, cache, chave)
+
+
+async def _atualizar_cache(
+    sessao: aiohttp.ClientSession, cache: CacheTTL, chave: str
+) -> dict:
+    """Requisita as informações do modelo e as armazena no cache."""
+    informacoes = await informacoes_modelo(sessao, chave)
+    cache.definir(chave, informacoes, negativo="erro" in informacoes)
+    return informacoes
+
+
+async def _extrair_ids(
+    resposta: aiohttp.ClientResponse, referencia: bool = True
+) -> tuple[str | None, str | None]:
+    """
+    Retorna o ID e o referenceId do modelo no HTML da página, no formato `(id, ref)`.\n
+    O HTML é lido em pedaços e a leitura é interrompida (e a conexão fechada) assim que os valores são encontrados,
+    sem precisar baixar a página inteira. Caso `referencia` seja `False`, apenas o ID é procurado.
+    Caso o referenceId não seja encontrado no HTML inteiro, é procurado através do `BeautifulSoup`.
+    """
+    id = ref = None
+    corpo = bytearray()
+
+    async for pedaco in resposta.content.iter_chunked(TAMANHO_PEDACO_HTML):
+        # Procurar também no final do pedaço anterior, caso o valor esteja dividido entre os pedaços
+        inicio = max(0, len(corpo) - SOBREPOSICAO_PEDACOS_HTML)
+        corpo += pedaco
+
+        if id is None:
+            procura = _REGEX_ID_MODELO.search(corpo, inicio)
+            if procura:
+                id = procura.group(1).decode()
+
+        if referencia and ref is None:
+            procura = _REGEX_REFERENCIA_MODELO.search(corpo, inicio)
+            if procura:
+                ref = procura.group(1).decode("utf-8", "replace").strip() or None
+
+        if id is not None and (ref is not None or not referencia):
+            # Fecha a conexão, pois o restante da página não será lido
+            resposta.close()
+            return id, ref
+
+    # Caso o formato do HTML tenha mudado, procurar o referenceId na página inteira
+    if referencia and ref is None:
+        conteudo = BeautifulSoup(
+            corpo.decode(resposta.charset or "utf-8", "replace"), "html.parser"
+        )
+        elemento = conteudo.find(
+            "strong", class_="samsungbr-app-pdp-2-x-productReferenceId"
+        )
+        if elemento is not None:
+            ref = elemento.text.strip() or None
 
-    async with aiohttp.ClientSession() as sessao:
-        # Requisição GET para pegar HTML do URL
+    return id, ref
+
+
+async def informacoes_modelo(
+    sessao: aiohttp.ClientSession, url: str, indisponiveis: bool = False
+) -> dict:
+    """
+    Retorna informações do modelo através de seu url na Samsung Shop, utilizando a sessão HTTP compartilhada.
+    Retorna as capacidades e as cores, com seus IDs, se há estoque (ou todas, caso `indisponiveis` seja `True`).\n
+    Formato do dicionário retornado: `{capacidade: {"id": id, "cores": {cor: id}}}`\n
+    Chamadas simultâneas para o mesmo URL normalizado compartilham as mesmas requisições e recebem o mesmo resultado.
+    """
+    url = normalizar_url(url)
+    if url is None:
+        return {"erro": "Formato de URL inválido"}
+
+    chave = (url, indisponiveis)
+    tarefa = _requisicoes_modelos.get(chave)
+    if tarefa is None:
+        tarefa = asyncio.create_task(
+            _requisitar_informacoes_modelo(sessao, url, indisponiveis)
+        )
+        _requisicoes_modelos[chave] = tarefa
+        tarefa.add_done_callback(lambda _: _requisicoes_modelos.pop(chave, None))
+
+    # O cancelamento de uma chamada não cancela a requisição compartilhada com as outras
+    return await asyncio.shield(tarefa)
+
+
+class _IdInvalidoError(Exception):
+    """Uma URL API informou que um ID do índice de produtos é inválido."""
+
+
+def _slug(url: str) -> str:
+    """Retorna o slug do URL de um produto na Samsung Shop (ex: `galaxy-s24-256gb`)."""
+    return url.removesuffix("/p").rsplit("/", 1)[-1]
+
+
+async def _ids_pagina(
+    sessao: aiohttp.ClientSession,
+    url: str,
+    referencia: bool = True,
+    indice: bool = True,
+) -> tuple[str | None, str | None, bool]:
+    """
+    Retorna o ID e o referenceId do produto do URL, no formato `(id, ref, do_indice)`, consultando antes o índice de produtos
+    (caso `indice` seja `True`). Caso não estejam no índice, são procurados no HTML da página e armazenados no índice.
+    Caso `referencia` seja `False`, o referenceId não é necessário. Erros da requisição são propagados.
+    """
+    slug = _slug(url)
+
+    if indice:
+        entrada = _indice.obter(slug)
+        if entrada is not None and (entrada[1] or not referencia):
+            return *entrada, True
+
+    # Requisição GET para pegar o ID e o referenceId do modelo no HTML do URL
+    id, ref = await _requisitar(
+        sessao,
+        "GET",
+        "produto",
+        _url_loja(url),
+        functools.partial(_extrair_ids, referencia=referencia),
+    )
+    if id:
+        _indice.definir(slug, id, ref)
+    return id, ref, False
+
+
+async def indexar_produtos(produtos: list[dict]) -> None:
+    """
+    Armazena no índice de produtos o ID e o referenceId dos produtos do catalog_system, pelo `linkText` (slug) de cada produto.
+    Os produtos são armazenados em lote, em uma única transação.
+    """
+    await _indice.definir_varios(
+        [
+            (produto["linkText"], produto["productId"], produto.get("productReference"))
+            for produto in produtos
+            if produto.get("linkText") and produto.get("productId")
+        ]
+    )
+
+
+async def _requisitar_informacoes_modelo(
+    sessao: aiohttp.ClientSession, url: str, indisponiveis: bool
+) -> dict:
+    """
+    Requisita as informações do modelo através de seu url normalizado na Samsung Shop.\n
+    Os IDs do modelo são consultados antes no índice de produtos e, caso uma URL API informe que são inválidos,
+    são removidos do índice e procurados novamente no HTML da página.
+    """
+    try:
+        return await _informacoes_modelo_pelos_ids(
+            sessao, url, indice=True, indisponiveis=indisponiveis
+        )
+    except _IdInvalidoError:
+        logger.warning(
+            "IDs do modelo %s no índice são inválidos, procurando novamente.", url
+        )
+        _indice.remover(_slug(url))
+        return await _informacoes_modelo_pelos_ids(
+            sessao, url, indice=False, indisponiveis=indisponiveis
+        )
+
+
+async def _informacoes_modelo_pelos_ids(
+    sessao: aiohttp.ClientSession, url: str, indice: bool, indisponiveis: bool
+) -> dict:
+    """
+    Requisita as informações do modelo através do seu ID e referenceId, incluindo as cores sem estoque caso `indisponiveis` seja `True`.
+    Lança `_IdInvalidoError` caso os IDs sejam do índice de produtos e uma URL API informe que são inválidos.
+    """
+    informacoes = dict()
+
+    # ID e referenceId do modelo, pelo índice de produtos ou pelo HTML do URL
+    try:
+        id, ref, do_indice = await _ids_pagina(sessao, url, indice=indice)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning("Requisição GET para pegar HTML do URL %s falhou: %s", url, e)
+        return {"erro": "Página não encontrada"}
+
+    if not id:
+        logger.warning("ID do modelo %s não foi encontrado.", url)
+        return {"erro": "Erro ao filtrar características do modelo"}
+
+    if not ref:
+        logger.warning("referenceId do modelo %s não foi encontrado.", url)
+        return {"erro": "Erro ao filtrar características do modelo"}
+
+    # URL da API para pegar as capacidades disponíveis para o modelo através do referenceId
+    capacidades_url = f"{URL_SEARCHAPI}/v6/front/b2c/product/card/detail/global?siteCode=br&modelList={ref}&commonCodeYN=N&saleSkuYN=N&onlyRequestSkuYN=N&keySummaryYN=Y&shopSiteCode=br"
+    # Requisição GET para pegar as capacidades disponíveis para o modelo
+    try:
+        dados = await _requisitar(
+            sessao, "GET", "searchapi", capacidades_url, _ler_json
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(
+            "Requisição GET para pegar as capacidades do modelo %s falhou: %s", ref, e
+        )
+        return {"erro": "Erro ao filtrar características do modelo"}
+
+    # Extrair as capacidades da resposta
+    try:
+        produtos = dados["response"]["resultData"]["productList"]
+        # Nenhum modelo encontrado com o referenceId do índice
+        if not produtos and do_indice:
+            raise _IdInvalidoError(ref)
+        capacidades = [
+            opcao["optionCode"]
+            for produto in produtos
+            for opcao_chip in produto["chipOptions"]
+            if opcao_chip["fmyChipType"] == "MOBILE MEMORY"
+            for opcao in opcao_chip["optionList"]
+        ]
+    except (KeyError, TypeError) as e:
+        logger.warning(
+            "Capacidades do modelo %s não foram encontradas. Erro: %s", ref, e
+        )
+        return {"erro": "Erro ao filtrar características do modelo"}
+
+    # URL da API para pegar a capacidade padrão do modelo através do ID
+    # A capacidade padrão é a do URL do modelo que não especifica a capacidade
+    capacidade_padrao_url = f"{URL_LOJA}/br/api/catalog_system/pub/products/search/?fq=productId:{id}"
+    # Requisição GET para pegar a capacidade padrão do modelo
+    try:
+        dados_capacidade_padrao = await _requisitar(
+            sessao, "GET", "catalog_system", capacidade_padrao_url, _ler_json
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(
+            "Requisição GET para pegar a capacidade padrão do modelo de ID %s falhou: %s",
+            id,
+            e,
+        )
+        return {"erro": "Erro ao filtrar características do modelo"}
+
+    # Nenhum produto encontrado com o ID do índice
+    if not dados_capacidade_padrao and do_indice:
+        raise _IdInvalidoError(id)
+
+    # Extrair a capacidade padrão da resposta
+    try:
+        capacidade_padrao = _capacidade(dados_capacidade_padrao[0])
+    except (IndexError, KeyError, TypeError) as e:
+        logger.warning(
+            "Capacidade padrão do modelo de ID %s não foi encontrada. Erro: %s", id, e
+        )
+        return {"erro": "Erro ao filtrar características do modelo"}
+
+    # Se nenhuma outra capacidade foi encontrada, o modelo apenas oferece a capacidade padrão
+    if not capacidades:
+        capacidades.append(capacidade_padrao)
+
+    # Requisitar os dados das outras capacidades simultaneamente, com limite de requisições simultâneas
+    # A capacidade padrão já possui os dados para extrair as cores
+    outras_capacidades = [c for c in capacidades if c != capacidade_padrao]
+    limite = asyncio.Semaphore(LIMITE_CAPACIDADES_SIMULTANEAS)
+    resultados = await asyncio.gather(
+        *(
+            _dados_capacidade(sessao, limite, url, capacidade)
+            for capacidade in outras_capacidades
+        )
+    )
+    dados_capacidades = dict(zip(outras_capacidades, resultados))
+    dados_capacidades[capacidade_padrao] = (id, dados_capacidade_padrao)
+
+    # Percorrer as capacidades na ordem da resposta, para que o dicionário `informacoes` seja determinístico
+    for capacidade in capacidades:
+
+        # Caso a requisição dos dados dessa capacidade tenha falhado
+        if dados_capacidades[capacidade] is None:
+            continue
+
+        id, dados = dados_capacidades[capacidade]
+
+        # Extrair o nome da cor e o seu ID da resposta, apenas se a cor possui estoque (ou todas as cores)
         try:
-            async with sessao.get(url) as resposta:
-                resposta.raise_for_status()
-                dados = await resposta.text()
-        except aiohttp.ClientError as e:
-            print(f"Requisição GET para pegar HTML do URL {url} falhou: {e}")
-            return {"erro": "Página não encontrada"}
-
-        # Pegar ID do modelo no HTML da página
-        procura = re.search(
-            r"https://shop\.samsung\.com/_v/segment/routing/vtex\.store@2\.x/product/(\d+)/",
-            dados,
+            cores = _cores(dados[0], indisponiveis)
+        except (IndexError, KeyError, TypeError) as e:
+            logger.warning(
+                "Cores do modelo de ID %s não foram encontradas. Erro: %s", id, e
+            )
+            continue
+
+        # Se existe alguma cor com estoque para a capacidade, atualize o dicionário `informacoes`
+        if cores:
+            informacoes[capacidade] = dict()
+            informacoes[capacidade]["cores"] = cores
+            informacoes[capacidade]["id"] = id
+
+    # Caso o modelo não tenha estoque para nenhuma capacidade
+    if not informacoes:
+        return {"erro": "O produto escolhido não está disponível no momento"}
+
+    return informacoes
+
+
+def _capacidade(produto: dict) -> str:
+    """
+    Retorna a capacidade de um produto do catalog_system, no formato `128 GB`.
+    Lança `IndexError`, `KeyError` ou `TypeError` caso a capacidade não seja encontrada.
+    """
+    # Caso a capacidade esteja sucedida de um (*)
+    capacidade = produto["INTERNAL_MEMORY"][0].replace("(*)", "")
+    # Caso a capacidade esteja sem um espaço separando o valor e a medida
+    return re.sub(r"^(\d+)(GB|TB)$", r"\1 \2", capacidade)
+
+
+def _cores(produto: dict, indisponiveis: bool = False) -> dict[str, str]:
+    """
+    Retorna as cores de um produto do catalog_system com estoque (parâmetro `IsAvailable`), no formato `{cor: id}`.
+    Caso `indisponiveis` seja `True`, retorna também as cores sem estoque.
+    Lança `IndexError`, `KeyError` ou `TypeError` caso as cores não sejam encontradas.
+    """
+    return {
+        item["name"]: item["itemId"]
+        for item in produto["items"]
+        if indisponiveis or item["sellers"][0]["commertialOffer"]["IsAvailable"]
+    }
+
+
+def _tamanho_capacidade(capacidade: str) -> float:
+    """Retorna o tamanho da capacidade em GB, para ordenar as capacidades (`1 TB` depois de `512 GB`)."""
+    procura = re.match(r"^(\d+) (GB|TB)$", capacidade)
+    if procura is None:
+        return float("inf")
+    return int(procura.group(1)) * (1024 if procura.group(2) == "TB" else 1)
+
+
+async def _dados_capacidade(
+    sessao: aiohttp.ClientSession,
+    limite: asyncio.Semaphore,
+    url: str,
+    capacidade: str,
+) -> tuple[str, list] | None:
+    """
+    Retorna o ID e os dados (com as cores) do modelo em uma capacidade que não é a padrão.
+    O ID é consultado antes no índice de produtos, e procurado novamente no HTML caso seja inválido.
+    Retorna `None` caso alguma das requisições falhe, para que a capacidade seja ignorada.
+    """
+    # Alterar formato do URL para corresponder à capacidade
+    url_capacidade = f"{url[:-2]}-{capacidade.lower().replace(' ', '')}/p"
+
+    async with limite:
+        for indice in (True, False):
+            # ID do modelo com essa capacidade, pelo índice de produtos ou pelo HTML do URL
+            try:
+                id, _, do_indice = await _ids_pagina(
+                    sessao, url_capacidade, referencia=False, indice=indice
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    "Requisição GET para pegar HTML do URL %s falhou: %s",
+                    url_capacidade,
+                    e,
+                )
+                return None
+
+            if not id:
+                logger.warning("ID do modelo %s não foi encontrado.", url_capacidade)
+                return None
+
+            # URL da API para pegar as cores disponíveis para o modelo e a capacidade através do ID
+            cores_url = f"{URL_LOJA}/br/api/catalog_system/pub/products/search/?fq=productId:{id}"
+            # Requisição GET para pegar as cores disponíveis para o modelo e a capacidade
+            try:
+                dados = await _requisitar(
+                    sessao, "GET", "catalog_system", cores_url, _ler_json
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    "Requisição GET para pegar as cores do modelo de ID %s falhou: %s",
+                    id,
+                    e,
+                )
+                return None
+
+            # Caso nenhum produto seja encontrado com o ID do índice, o ID é procurado novamente no HTML
+            if dados or not do_indice:
+                break
+            logger.warning(
+                "ID %s do modelo %s no índice é inválido, procurando novamente.",
+                id,
+                url_capacidade,
+            )
+            _indice.remover(_slug(url_capacidade))
+
+    return id, dados
+
+
+async def produtos_categoria(
+    sessao: aiohttp.ClientSession, categoria: str
+) -> list[dict]:
+    """
+    Retorna todos os produtos de uma categoria da Samsung Shop (caminho da categoria, ex: `/1/2/`), através do catalog_system,
+    com até `LOTE_CATALOG_SYSTEM` produtos por requisição. Os produtos possuem as capacidades, as cores e o estoque.\n
+    Erros das requisições são propagados.
+    """
+    url = f"{URL_LOJA}/br/api/catalog_system/pub/products/search/"
+    produtos = list()
+
+    for inicio in range(0, MAX_PRODUTOS_CATEGORIA, LOTE_CATALOG_SYSTEM):
+        # Requisição GET para pegar uma página de produtos da categoria
+        pagina = await _requisitar(
+            sessao,
+            "GET",
+            "catalog_system",
+            url,
+            _ler_json,
+            params={
+                "fq": f"C:{categoria}",
+                "_from": inicio,
+                "_to": inicio + LOTE_CATALOG_SYSTEM - 1,
+            },
         )
+        produtos.extend(pagina)
+
+        # A última página possui menos produtos que o lote
+        if len(pagina) < LOTE_CATALOG_SYSTEM:
+            break
+
+    return produtos
+
+
+async def produtos_por_id(
+    sessao: aiohttp.ClientSession, ids: list[str]
+) -> list[dict]:
+    """
+    Retorna os produtos do catalog_system com os IDs, com até `LOTE_CATALOG_SYSTEM` IDs por requisição.
+    Os lotes são requisitados simultaneamente, e os lotes com erro são ignorados.
+    """
+    url = f"{URL_LOJA}/br/api/catalog_system/pub/products/search/"
+
+    async def requisitar_lote(lote: list[str]) -> list[dict]:
+        # Requisição GET para pegar os produtos do lote, com um filtro `fq=productId:<id>` para cada ID
         try:
-            id = procura.group(1)
-        except AttributeError as e:
-            print(f"ID do modelo {url} não foi encontrado. Erro: {e}")
-            return {"erro": "Erro ao filtrar características do modelo"}
-
-        # Pegar referenceId do modelo no HTML da página
-        conteudo = BeautifulSoup(dados, "html.parser")
-        ref = conteudo.find(
-            "strong", class_="samsungbr-app-pdp-2-x-productReferenceId"
-        ).text
-        if not ref:
-            print(f"referenceId do modelo {url} não foi encontrado.")
-            return {"erro": "Erro ao filtrar características do modelo"}
-
-        # URL da API para pegar as capacidades disponíveis para o modelo através do referenceId
-        capacidades_url = f"https://searchapi.samsung.com/v6/front/b2c/product/card/detail/global?siteCode=br&modelList={ref}&commonCodeYN=N&saleSkuYN=N&onlyRequestSkuYN=N&keySummaryYN=Y&shopSiteCode=br"
-        # Requisição GET para pegar as capacidades disponíveis para o modelo
+            return await _requisitar(
+                sessao,
+                "GET",
+                "catalog_system",
+                url,
+                _ler_json,
+                params=[("fq", f"productId:{id}") for id in lote],
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                "Requisição GET para pegar os produtos de IDs %s falhou: %s", lote, e
+            )
+            return list()
+
+    resultados = await asyncio.gather(
+        *(
+            requisitar_lote(ids[inicio : inicio + LOTE_CATALOG_SYSTEM])
+            for inicio in range(0, len(ids), LOTE_CATALOG_SYSTEM)
+        )
+    )
+    return [produto for resultado in resultados for produto in resultado]
+
+
+async def _ler_estoque(
+    resposta: aiohttp.ClientResponse,
+) -> tuple[list | None, tuple[str | None, str | None]]:
+    """
+    Lê a resposta do catalog_system em JSON, com os validadores da resposta (`ETag` e `Last-Modified`).
+    Caso a resposta seja `304 Not Modified`, não há conteúdo, e `None` é retornado.
+    """
+    validador = (resposta.headers.get("ETag"), resposta.headers.get("Last-Modified"))
+    if resposta.status == 304:
+        return None, validador
+    return await resposta.json(), validador
+
+
+async def estoque_produtos(
+    sessao: aiohttp.ClientSession,
+    ids: list[str],
+    validador: tuple[str | None, str | None] | None = None,
+) -> tuple[dict[str, dict[str, bool]] | None, tuple[str | None, str | None] | None]:
+    """
+    Retorna o estoque (parâmetro `IsAvailable`) de cada cor (SKU, `itemId`) dos produtos com os IDs (até `LOTE_CATALOG_SYSTEM`),
+    com uma única requisição ao catalog_system, no formato `({id_produto: {id_cor: disponivel}}, validador)`.\n
+    A requisição é condicional: o `validador` (`ETag` e `Last-Modified`) da resposta anterior para os mesmos IDs é enviado
+    (`If-None-Match` e `If-Modified-Since`), e, caso o catalog_system informe que nada mudou (`304`), o estoque retornado é `None`.
+    Produtos não encontrados não fazem parte do resultado. Erros da requisição são propagados.
+    """
+    url = f"{URL_LOJA}/br/api/catalog_system/pub/products/search/"
+    headers = dict()
+    if validador is not None:
+        etag, modificado_em = validador
+        if etag:
+            headers["If-None-Match"] = etag
+        if modificado_em:
+            headers["If-Modified-Since"] = modificado_em
+
+    # Requisição GET para pegar os produtos, com um filtro `fq=productId:<id>` para cada ID
+    produtos, novo_validador = await _requisitar(
+        sessao,
+        "GET",
+        "catalog_system",
+        url,
+        _ler_estoque,
+        params=[("fq", f"productId:{id}") for id in ids],
+        headers=headers,
+    )
+    if produtos is None:
+        return None, validador
+
+    estoque = dict()
+    for produto in produtos:
         try:
-            async with sessao.get(capacidades_url) as resposta:
-                resposta.raise_for_status()
-                dados = await resposta.json()
-        except aiohttp.ClientError as e:
-            print(
-                f"Requisição GET para pegar as capacidades do modelo {ref} falhou: {e}"
+            estoque[str(produto["productId"])] = {
+                str(item["itemId"]): bool(
+                    item["sellers"][0]["commertialOffer"]["IsAvailable"]
+                )
+                for item in produto["items"]
+            }
+        except (IndexError, KeyError, TypeError) as e:
+            logger.warning(
+                "Estoque do produto %s não foi encontrado. Erro: %s",
+                produto.get("productId"),
+                e,
             )
-            return {"erro": "Erro ao filtrar características do modelo"}
+    return estoque, (novo_validador if any(novo_validador) else None)
+
+
+async def detalhes_modelos(
+    sessao: aiohttp.ClientSession, refs: list[str]
+) -> dict[str, dict]:
+    """
+    Retorna os dados dos modelos na searchapi (como o nome, `fmyMarketingName`, e as capacidades),
+    indexados pelos referenceIds de cada modelo, com até `LOTE_SEARCHAPI` referenceIds no `modelList` de cada requisição.
+    Os lotes são requisitados simultaneamente, e os lotes com erro são ignorados.
+    """
 
-        # Extrair as capacidades da resposta
+    async def requisitar_lote(lote: list[str]) -> list[dict]:
+        # URL da API para pegar os dados dos modelos do lote através dos referenceIds
+        url = f"{URL_SEARCHAPI}/v6/front/b2c/product/card/detail/global?siteCode=br&modelList={','.join(lote)}&commonCodeYN=N&saleSkuYN=N&onlyRequestSkuYN=N&keySummaryYN=Y&shopSiteCode=br"
         try:
-            capacidades = [
-                opcao["optionCode"]
-                for produto in dados["response"]["resultData"]["productList"]
-                for opcao_chip in produto["chipOptions"]
-                if opcao_chip["fmyChipType"] == "MOBILE MEMORY"
-                for opcao in opcao_chip["optionList"]
-            ]
+            dados = await _requisitar(sessao, "GET", "searchapi", url, _ler_json)
+            return dados["response"]["resultData"]["productList"]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                "Requisição GET para pegar os modelos %s falhou: %s", lote, e
+            )
         except (KeyError, TypeError) as e:
-            print(f"Capacidades do modelo {ref} não foram encontradas. Erro: {e}")
-            return {"erro": "Erro ao filtrar características do modelo"}
+            logger.warning("Modelos %s não foram encontrados. Erro: %s", lote, e)
+        return list()
+
+    resultados = await asyncio.gather(
+        *(
+            requisitar_lote(refs[inicio : inicio + LOTE_SEARCHAPI])
+            for inicio in range(0, len(refs), LOTE_SEARCHAPI)
+        )
+    )
 
-        # URL da API para pegar a capacidade padrão do modelo através do ID
-        # A capacidade padrão é a do URL do modelo que não especifica a capacidade
-        capacidade_padrao_url = f"https://shop.samsung.com/br/api/catalog_system/pub/products/search/?fq=productId:{id}"
-        # Requisição GET para pegar a capacidade padrão do modelo
+    # Cada modelo é indexado pelo seu referenceId e pelos referenceIds das suas variações
+    detalhes = dict()
+    for resultado in resultados:
+        for produto in resultado:
+            for modelo in [produto, *(produto.get("modelList") or [])]:
+                if modelo.get("modelCode"):
+                    detalhes[modelo["modelCode"]] = produto
+    return detalhes
+
+
+def agrupar_produtos(produtos: list[dict]) -> dict[str, list[dict]]:
+    """
+    Agrupa os produtos do catalog_system pelo URL normalizado do modelo (a partir do `linkText` do produto),
+    de forma que as capacidades de um mesmo modelo fiquem no mesmo grupo.
+    """
+    grupos = dict()
+    for produto in produtos:
         try:
-            async with sessao.get(capacidade_padrao_url) as resposta:
-                resposta.raise_for_status()
-                dados_capacidade_padrao = await resposta.json()
-        except aiohttp.ClientError as e:
-            print(
-                f"Requisição GET para pegar a capacidade padrão do modelo de ID {id} falhou: {e}"
-            )
-            return {"erro": "Erro ao filtrar características do modelo"}
+            url = normalizar_url(f"https://shop.samsung.com/br/{produto['linkText']}/p")
+        except (KeyError, TypeError):
+            continue
+        if url is not None:
+            grupos.setdefault(url, list()).append(produto)
+    return grupos
+
 
-        # Extrair a capacidade padrão da resposta
+def informacoes_produtos(produtos: list[dict]) -> dict:
+    """
+    Retorna as informações de um modelo a partir dos produtos do catalog_system de cada capacidade,
+    no mesmo formato de `informacoes_modelo`, com as capacidades ordenadas pelo tamanho.
+    Produtos sem capacidade ou sem cores com estoque são ignorados.
+    """
+    informacoes = dict()
+    for produto in produtos:
         try:
-            # Caso a capacidade esteja sucedida de um (*)
-            capacidade_padrao = dados_capacidade_padrao[0]["INTERNAL_MEMORY"][0].replace("(*)", "")
-            # Caso a capacidade esteja sem um espaço separando o valor e a medida
-            capacidade_padrao = re.sub(r'^(\d+)(GB|TB)$', r'\1 \2', capacidade_padrao)
+            capacidade = _capacidade(produto)
+            cores = _cores(produto)
+            id = produto["productId"]
         except (IndexError, KeyError, TypeError) as e:
-            print(f"Capacidade padrão do modelo de ID {id} não foi encontrada. Erro: {e}")
-            return {"erro": "Erro ao filtrar características do modelo"}
+            logger.warning(
+                "Produto %s não foi filtrado. Erro: %s", produto.get("productId"), e
+            )
+            continue
 
-        # Se nenhuma outra capacidade foi encontrada, o modelo apenas oferece a capacidade padrão
-        if not capacidades:
-            capacidades.append(capacidade_padrao)
+        if cores:
+            informacoes[capacidade] = {"cores": cores, "id": id}
 
-        for capacidade in capacidades:
+    return dict(
+        sorted(informacoes.items(), key=lambda item: _tamanho_capacidade(item[0]))
+    )
 
-            # Se for a capacidade padrão, os dados para extrair as cores já estão disponíveis
-            if capacidade == capacidade_padrao:
-                dados = dados_capacidade_padrao
 
-            # Se for outra capacidade, os dados para extrair as cores precisam ser requisitados
-            else:
-                # Alterar formato do URL para corresponder à capacidade
-                url_capacidade = (
-                    f"{url[:-2]}-{capacidade.lower().replace(' ', '')}/p"
-                )
-                # Requisição GET para pegar HTML do URL específico da capacidade
-                try:
-                    async with sessao.get(url_capacidade) as resposta:
-                        resposta.raise_for_status()
-                        dados = await resposta.text()
-                except aiohttp.ClientError as e:
-                    print(
-                        f"Requisição GET para pegar HTML do URL {url_capacidade} falhou: {e}"
-                    )
-                    continue
-
-                # Pegar ID do modelo com essa capacidade no HTML da página
-                procura = re.search(
-                    r"https://shop\.samsung\.com/_v/segment/routing/vtex\.store@2\.x/product/(\d+)/",
-                    dados,
-                )
-                try:
-                    id = procura.group(1)
-                except AttributeError as e:
-                    print(
-                        f"ID do modelo {url_capacidade} não foi encontrado. Erro: {e}"
-                    )
-                    continue
-
-                # URL da API para pegar as cores disponíveis para o modelo e a capacidade através do ID
-                cores_url = f"https://shop.samsung.com/br/api/catalog_system/pub/products/search/?fq=productId:{id}"
-                # Requisição GET para pegar as cores disponíveis para o modelo e a capacidade
-                try:
-                    async with sessao.get(cores_url) as resposta:
-                        resposta.raise_for_status()
-                        dados = await resposta.json()
-                except aiohttp.ClientError as e:
-                    print(
-                        f"Requisição GET para pegar as cores do modelo de ID {id} falhou: {e}"
-                    )
-                    continue
-
-            cores = dict()
-
-            # Extrair o nome da cor e o seu ID da resposta, apenas se a cor possui estoque
-            try:
-                for item in dados[0]["items"]:
-                    if item["sellers"][0]["commertialOffer"]["IsAvailable"]:
-                        cores[item["name"]] = item["itemId"]
-            except (IndexError, KeyError, TypeError) as e:
-                print(f"Cores do modelo de ID {id} não foram encontradas. Erro: {e}")
-                continue
-
-            # Se existe alguma cor com estoque para a capacidade, atualize o dicionário `informacoes`
-            if cores:
-                informacoes[capacidade] = dict()
-                informacoes[capacidade]["cores"] = cores
-                informacoes[capacidade]["id"] = id
+async def _marketing_tag(
+    sessao: aiohttp.ClientSession,
+    id_modelo: str | int,
+    id_cor: str | int,
+) -> str | None:
+    """
+    Retorna a marketingTag do modelo e da cor, consultando antes o cache, ou `None` caso o modelo não possua marketingTag.\n
+    Chamadas simultâneas para o mesmo modelo e cor compartilham a mesma requisição.
+    Erros da requisição não são armazenados no cache e são propagados.
+    """
+    chave = (str(id_modelo), str(id_cor))
 
-    # Caso o modelo não tenha estoque para nenhuma capacidade
-    if not informacoes:
-        return {"erro": "O produto escolhido não está disponível no momento"}
+    entrada = _cache_marketing_tags.obter(chave)
+    if entrada is not None:
+        return entrada[0]
+
+    tarefa = _requisicoes_marketing_tags.get(chave)
+    if tarefa is None:
+        tarefa = asyncio.create_task(
+            _requisitar_marketing_tag(sessao, id_modelo, id_cor)
+        )
+        _requisicoes_marketing_tags[chave] = tarefa
+        tarefa.add_done_callback(lambda _: _requisicoes_marketing_tags.pop(chave, None))
+
+    # O cancelamento de uma chamada não cancela a requisição compartilhada com as outras
+    return await asyncio.shield(tarefa)
 
-    return informacoes
 
+async def _requisitar_marketing_tag(
+    sessao: aiohttp.ClientSession,
+    id_modelo: str | int,
+    id_cor: str | int,
+) -> str | None:
+    """Requisita a marketingTag do modelo e da cor e a armazena no cache, inclusive caso o modelo não possua marketingTag."""
+    # URL da API para pegar a marketingTag associada ao modelo, capacidade e cor específicas
+    # A marketingTag define o valor do Vale Mais - Troca Smart
+    url = f"{URL_LOJA}/br/tradein/vtex/getProductGroup/{id_modelo}/{id_cor}/MQ=="
+    # Requisição GET para pegar a marketingTag
+    dados = await _requisitar(
+        sessao, "GET", "getProductGroup", url, _ler_json, headers=HEADERS
+    )
 
-async def gerar_link(id_modelo: str | int, id_cor: str | int) -> str:
+    # Pegar marketingTag da resposta
+    try:
+        marketing_tag = dados[0].get("marketingTag")
+    except (IndexError, TypeError, AttributeError) as e:
+        logger.warning(
+            "marketingTag do modelo de ID %s não foi encontrada. Erro: %s", id_modelo, e
+        )
+        marketing_tag = None
+
+    _cache_marketing_tags.definir(
+        (str(id_modelo), str(id_cor)), marketing_tag, negativo=not marketing_tag
+    )
+    return marketing_tag
+
+
+async def criar_carrinho(sessao: aiohttp.ClientSession) -> str | None:
+    """Cria um carrinho vazio na Samsung Shop e retorna o seu orderFormId, ou `None` caso ocorra erro."""
+    # URL da API para criar um carrinho vazio
+    url = f"{URL_LOJA}/br/api/checkout/pub/orderForm"
+    # Requisição POST para criar um carrinho vazio
+    try:
+        dados = await _requisitar(
+            sessao,
+            "POST",
+            "orderForm",
+            url,
+            _ler_json,
+            idempotente=False,
+            headers=HEADERS,
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning("Requisição POST para criar um carrinho vazio falhou: %s", e)
+        return None
+
+    # Pegar orderFormId (ID do carrinho) da resposta
+    order_form_id = dados.get("orderFormId")
+    if not order_form_id:
+        logger.warning("orderFormId não foi encontrado.")
+        return None
+
+    return order_form_id
+
+
+async def _adicionar_item(
+    sessao: aiohttp.ClientSession, order_form_id: str, id_cor: str | int
+) -> bool:
+    """Adiciona o produto de ID `id_cor` ao carrinho e retorna se a adição teve sucesso."""
+    # URL da API para adicionar um produto ao carrinho
+    url = f"{URL_LOJA}/br/api/checkout/pub/orderForm/{order_form_id}/items"
+    # Dados do produto a ser adicionado
+    payload = {"orderItems": [{"id": id_cor, "quantity": 1, "seller": "1"}]}
+    # Requisição POST para adicionar o produto ao carrinho
+    try:
+        await _requisitar(
+            sessao,
+            "POST",
+            "items",
+            url,
+            idempotente=False,
+            headers=HEADERS,
+            json=payload,
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(
+            "Requisição POST para adicionar item de ID %s ao carrinho %s falhou: %s",
+            id_cor,
+            order_form_id,
+            e,
+        )
+        return False
+    return True
+
+
+async def gerar_link(
+    sessao: aiohttp.ClientSession,
+    id_modelo: str | int,
+    id_cor: str | int,
+    order_form_id: str | None = None,
+) -> str | None:
     """
-    Gera link de carrinho na Samsung Shop com desconto do Vale Mais - Troca Smart,
+    Utilizando a sessão HTTP compartilhada, gera link de carrinho na Samsung Shop com desconto do Vale Mais - Troca Smart,
     através do ID do modelo (dependente da capacidade) e do ID da cor (dependente da cor).\n
+    Pode receber o orderFormId de um carrinho vazio já criado (de `PoolCarrinhos`), caso contrário cria um novo carrinho.
+    Caso a adição do item ao carrinho recebido falhe (ex: carrinho expirado), tenta novamente uma vez com um novo carrinho.\n
     Formato do link retornado: `https://shop.samsung.com/br/checkout?orderFormId={order_form_id}#/cart`
     """
-    async with aiohttp.ClientSession() as sessao:
-        # Cabeçalhos das requisições
-        headers = {
-            "accept": "application/json, text/plain, */*",
-            "content-type": "application/json",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        }
-
-        # URL da API para criar um carrinho vazio
-        url = "https://shop.samsung.com/br/api/checkout/pub/orderForm"
-        # Requisição POST para criar um carrinho vazio
-        try:
-            async with sessao.post(url, headers=headers) as resposta:
-                resposta.raise_for_status()
-                dados = await resposta.json()
-        except aiohttp.ClientError as e:
-            print(f"Requisição POST para criar um carrinho vazio falhou: {e}")
-            return None
+    # Adiciona o produto ao carrinho vazio recebido, se houver
+    adicionado = False
+    if order_form_id:
+        adicionado = await _adicionar_item(sessao, order_form_id, id_cor)
 
-        # Pegar orderFormId (ID do carrinho) da resposta
-        order_form_id = dados.get("orderFormId")
-        if not order_form_id:
-            print("orderFormId não foi encontrado.")
+    # Caso não tenha recebido um carrinho vazio, ou a adição ao carrinho recebido tenha falhado (ex: carrinho expirado),
+    # cria um novo carrinho e adiciona o produto a ele
+    if not adicionado:
+        order_form_id = await criar_carrinho(sessao)
+        if not order_form_id or not await _adicionar_item(
+            sessao, order_form_id, id_cor
+        ):
             return None
 
-        # URL da API para adicionar um produto ao carrinho
-        url = f"https://shop.samsung.com/br/api/checkout/pub/orderForm/{order_form_id}/items"
-        # Dados do produto a ser adicionado
-        payload = {"orderItems": [{"id": id_cor, "quantity": 1, "seller": "1"}]}
-        # Requisição POST para adicionar o produto ao carrinho
-        try:
-            async with sessao.post(url, headers=headers, json=payload) as resposta:
-                resposta.raise_for_status()
-        except aiohttp.ClientError as e:
-            print(
-                f"Requisição POST para adicionar item de ID {id_cor} ao carrinho falhou: {e}"
-            )
-            return None
+    # Pegar a marketingTag associada ao modelo, capacidade e cor específicas
+    try:
+        marketing_tag = await _marketing_tag(sessao, id_modelo, id_cor)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(
+            "Requisição GET para pegar a marketingTag do modelo de ID %s falhou: %s",
+            id_modelo,
+            e,
+        )
+        return None
 
-        # URL da API para pegar a marketingTag associada ao modelo, capacidade e cor específicas
-        # A marketingTag define o valor do Vale Mais - Troca Smart
-        url = f"https://shop.samsung.com/br/tradein/vtex/getProductGroup/{id_modelo}/{id_cor}/MQ=="
-        # Requisição GET para pegar a marketingTag
+    # Se o modelo não possui marketingTag, não oferece Vale Mais - Troca Smart
+    if marketing_tag:
+
+        # URL da API para adicionar a marketingTag ao carrinho
+        url = f"{URL_LOJA}/br/api/checkout/pub/orderForm/{order_form_id}/attachments/marketingData"
+        # marketingTag a ser adicionada ao carrinho
+        payload = {"marketingTags": [marketing_tag]}
+        # Requisição POST para adicionar a marketingTag ao carrinho
         try:
-            async with sessao.get(url, headers=headers) as resposta:
-                resposta.raise_for_status()
-                dados = await resposta.json()
-        except aiohttp.ClientError as e:
-            print(
-                f"Requisição GET para pegar a marketingTag do modelo de ID {id_modelo} falhou: {e}"
+            # A marketingTag substitui os dados de marketing do carrinho, então a requisição pode ser repetida
+            await _requisitar(
+                sessao,
+                "POST",
+                "marketingData",
+                url,
+                idempotente=True,
+                headers=HEADERS,
+                json=payload,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(
+                "Requisição POST para adicionar a marketingTag %s ao carrinho falhou: %s",
+                marketing_tag,
+                e,
             )
             return None
 
-        # Pegar marketingTag da resposta
-        try:
-            marketing_tag = dados[0].get("marketingTag")
-        except (IndexError, TypeError) as e:
-            print(
-                f"marketingTag do modelo de ID {id_modelo} não foi encontrada. Erro: {e}"
-            )
-            marketing_tag = None
+    # Retorna link do carrinho, com o orderFormId
+    return f"https://shop.samsung.com/br/checkout?orderFormId={order_form_id}#/cart"
 
-        # Se o modelo não possui marketingTag, não oferece Vale Mais - Troca Smart
-        if marketing_tag:
 
-            # URL da API para adicionar a marketingTag ao carrinho
-            url = f"https://shop.samsung.com/br/api/checkout/pub/orderForm/{order_form_id}/attachments/marketingData"
-            # marketingTag a ser adicionada ao carrinho
-            payload = {"marketingTags": [marketing_tag]}
-            # Requisição POST para adicionar a marketingTag ao carrinho
-            try:
-                async with sessao.post(url, headers=headers, json=payload) as resposta:
-                    resposta.raise_for_status()
-            except aiohttp.ClientError as e:
-                print(
-                    f"Requisição POST para adicionar a marketingTag {marketing_tag} ao carrinho falhou: {e}"
-                )
-                return None
+def gerar_links(
+    sessao: aiohttp.ClientSession,
+    id_modelo: str | int,
+    id_cor: str | int,
+    quantidade: int,
+    carrinho_vazio: Callable[[], str | None] | None = None,
+) -> list[asyncio.Task]:
+    """
+    Inicia a geração simultânea de `quantidade` links (ver `gerar_link`), com no máximo `LIMITE_LINKS_SIMULTANEOS` ao mesmo tempo,
+    e retorna as tarefas na ordem, cada uma com o link gerado ou `None`, para que os links sejam enviados conforme são gerados.\n
+    Cada link usa o carrinho vazio retornado por `carrinho_vazio` (ex: `PoolCarrinhos.retirar`), caso haja.
+    As tarefas herdam o contexto atual (usuário no limitador de taxa e rastro), e devem ser canceladas caso deixem de ser esperadas.
+    """
+    limite = asyncio.Semaphore(LIMITE_LINKS_SIMULTANEOS)
+
+    async def gerar_link_limitado() -> str | None:
+        async with limite:
+            return await gerar_link(
+                sessao, id_modelo, id_cor, carrinho_vazio() if carrinho_vazio else None
+            )
 
-        # Retorna link do carrinho, com o orderFormId
-        return f"https://shop.samsung.com/br/checkout?orderFormId={order_form_id}#/cart"
+    return [asyncio.create_task(gerar_link_limitado()) for _ in range(quantidade)]
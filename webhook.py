@@ -0,0 +1,174 @@
+"""
+Webhook do bot.py, alternativa ao polling, com base no exemplo de webhook customizado com `Flask` do `python-telegram-bot`.
+
+O webserver `Flask` é servido como aplicação ASGI pelo `uvicorn`, e possui as rotas:
+`POST /telegram`, que recebe os updates do Telegram, verifica o token secreto e os coloca na `update_queue` da `application`;
+e `GET /healthcheck`, que informa se o bot está funcionando.\n
+
+Função `criar_app_webhook`, que cria o webserver `Flask`, e pode ser testada localmente enviando updates gravados em JSON.\n
+Função `token_secreto`, que define o token secreto do webhook, gerado caso o webhook público não possua um.\n
+Função `criar_app_asgi`, que adapta o webserver `Flask` para o `uvicorn`.\n
+Função `executar_webhook`, que configura o webhook no Telegram e executa o bot e o webserver.
+"""
+
+import asyncio
+import contextvars
+import hmac
+import logging
+import secrets
+import signal
+import uvicorn
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask, Response, abort, make_response, request
+from http import HTTPStatus
+from os import getenv
+from telegram import Update
+from telegram.ext import Application
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# URL público do webhook (sem a rota `/telegram`)
+# Caso não seja definido, o webhook não é configurado no Telegram, o que permite testar o webserver localmente
+URL = getenv("URL")
+
+# Endereço e porta do webserver
+HOST = getenv("HOST", "127.0.0.1")
+PORT = int(getenv("PORT", 8000))
+
+# Token secreto enviado pelo Telegram no cabeçalho `X-Telegram-Bot-Api-Secret-Token` de cada update
+SECRET_TOKEN = getenv("SECRET_TOKEN")
+
+# Endereços em que o webserver pode ser executado sem token secreto, apenas para testes locais
+HOSTS_LOCAIS = ("127.0.0.1", "localhost", "::1")
+
+
+def token_secreto() -> str | None:
+    """
+    Retorna o token secreto do webhook: `SECRET_TOKEN` ou, caso não seja definido e o webhook seja configurado no Telegram (`URL`),
+    um token gerado a cada execução, para que updates forjados por terceiros não sejam aceitos.\n
+    Sem token secreto, o webserver aceita qualquer update, o que é permitido apenas para testes locais (`HOST` local e sem `URL`).
+    """
+    if SECRET_TOKEN:
+        return SECRET_TOKEN
+    if URL:
+        logger.warning("SECRET_TOKEN não definido, usando um token secreto gerado")
+        return secrets.token_urlsafe(32)
+    if HOST not in HOSTS_LOCAIS:
+        raise RuntimeError(
+            f"SECRET_TOKEN deve ser definido para executar o webhook em {HOST}"
+        )
+    return None
+
+
+def criar_app_webhook(
+    application: Application,
+    secret_token: str | None,
+    loop: asyncio.AbstractEventLoop,
+) -> Flask:
+    """
+    Cria o webserver `Flask` que recebe os updates do Telegram e os coloca na `update_queue` da `application`,
+    que é executada no event loop `loop`.\n
+    As rotas são síncronas e executadas pelo `WsgiToAsgi` em outra thread, então os updates são entregues ao event loop
+    da `application` com `call_soon_threadsafe`, sem esperar.
+    """
+    flask_app = Flask(__name__)
+
+    @flask_app.post("/telegram")
+    def telegram() -> Response:
+        """Recebe um update do Telegram e o coloca na `update_queue`, caso o token secreto esteja correto."""
+        if secret_token and not hmac.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token
+        ):
+            abort(HTTPStatus.FORBIDDEN)
+
+        dados = request.get_json(silent=True)
+        if not isinstance(dados, dict):
+            abort(HTTPStatus.BAD_REQUEST)
+
+        # A `update_queue` não possui limite de tamanho, então o update é colocado nela sem esperar
+        loop.call_soon_threadsafe(
+            application.update_queue.put_nowait,
+            Update.de_json(data=dados, bot=application.bot),
+        )
+        return Response(status=HTTPStatus.OK)
+
+    @flask_app.get("/healthcheck")
+    def healthcheck() -> Response:
+        """Informa se o bot está funcionando."""
+        if not application.running:
+            return make_response("O bot não está funcionando", HTTPStatus.SERVICE_UNAVAILABLE)
+        return make_response("O bot está funcionando", HTTPStatus.OK)
+
+    return flask_app
+
+
+def criar_app_asgi(flask_app: Flask) -> Callable[[dict, Callable, Callable], Awaitable[None]]:
+    """
+    Retorna o webserver `Flask` como aplicação ASGI, com cada requisição executada em um contexto (`contextvars`) vazio.\n
+    O `uvicorn` inicia a próxima requisição de uma conexão ainda dentro da tarefa da anterior, que herdaria o seu contexto,
+    e o `WsgiToAsgi` falharia com `Single thread executor already being used, would deadlock` com vários updates simultâneos.
+    """
+    app_asgi = WsgiToAsgi(flask_app)
+
+    async def app(scope: dict, receive: Callable, send: Callable) -> None:
+        await asyncio.create_task(
+            app_asgi(scope, receive, send), context=contextvars.Context()
+        )
+
+    return app
+
+
+async def executar_webhook(application: Application) -> None:
+    """
+    Executa o bot através do webhook, até o webserver ser encerrado (`Ctrl + C`).\n
+    Como a `application` não é executada por `run_polling` ou `run_webhook`, `post_init` e `post_shutdown` são chamados aqui.
+    """
+    # O token secreto é definido antes de iniciar a `application`, para que o bot não seja iniciado sem ele
+    secret_token = token_secreto()
+    servidor = uvicorn.Server(
+        config=uvicorn.Config(
+            app=criar_app_asgi(
+                criar_app_webhook(application, secret_token, asyncio.get_running_loop())
+            ),
+            host=HOST,
+            port=PORT,
+            use_colors=False,
+            # Os registros do uvicorn passam pelo logging configurado pelo bot.py (ver `registro`)
+            log_config=None,
+        )
+    )
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+
+        # Configura o webhook no Telegram, caso o URL público tenha sido definido
+        if URL:
+            await application.bot.set_webhook(
+                url=f"{URL}/telegram",
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=secret_token,
+            )
+
+        await application.start()
+
+        # O uvicorn repete o sinal de encerramento (`Ctrl + C` ou `SIGTERM`) ao terminar, para o handler anterior,
+        # que encerraria o processo antes de a `application` ser encerrada, então o sinal repetido é ignorado
+        # Os handlers anteriores são restaurados após o encerramento
+        anteriores = {
+            sinal: signal.signal(sinal, lambda *args: None)
+            for sinal in (signal.SIGINT, signal.SIGTERM)
+        }
+
+        # Mesmo que o webserver falhe, a `application` é encerrada e os recursos do `post_init` são liberados
+        try:
+            await servidor.serve()
+        finally:
+            try:
+                await application.stop()
+                if application.post_shutdown:
+                    await application.post_shutdown(application)
+            finally:
+                for sinal, handler in anteriores.items():
+                    signal.signal(sinal, handler)